@@ -1,6 +1,8 @@
 #board/admin.py
 from django.contrib import admin
-from .models import Board, Node, Edge
+from .models import Board, BoardAction, BoardSnapshot, Node, Edge
 admin.site.register(Board)
+admin.site.register(BoardAction)
+admin.site.register(BoardSnapshot)
 admin.site.register(Node)
 admin.site.register(Edge)
@@ -0,0 +1,262 @@
+# board/codec.py
+#
+# board WebSocket 帧的编码工具：
+#   - 把大列表切成不超过指定字节数的 JSON 片段，用于分块推送初始状态
+#   - 可选的应用层压缩：客户端以 ?compress=deflate 连接时，大帧压缩后以二进制帧发送
+#     （zlib 格式，对应浏览器 DecompressionStream('deflate')）
+#   - 可选的二进制子协议（见文件后半部分）
+
+import json
+import struct
+import zlib
+
+from django.conf import settings
+
+from .strokes import delta_decode
+
+# 初始状态每个分块的最大字节数
+INIT_CHUNK_BYTES = getattr(settings, "BOARD_INIT_CHUNK_BYTES", 64 * 1024)
+# 超过多少字节的帧才压缩
+COMPRESS_MIN_BYTES = getattr(settings, "BOARD_COMPRESS_MIN_BYTES", 4 * 1024)
+
+COMPRESSIONS = ("deflate",)
+
+
+def iter_json_chunks(items, max_bytes=None):
+    """逐个序列化 items，按字节数切块，每块返回 (条数, 逗号拼接的 JSON 文本)
+
+    单条超过 max_bytes 的 item 自成一块。
+    """
+    max_bytes = max_bytes or INIT_CHUNK_BYTES
+    parts = []
+    size = 0
+    for item in items:
+        text = json.dumps(item, separators=(",", ":"))
+        if parts and size + len(text) + 1 > max_bytes:
+            yield len(parts), ",".join(parts)
+            parts = []
+            size = 0
+        parts.append(text)
+        size += len(text) + 1
+    if parts:
+        yield len(parts), ",".join(parts)
+
+
+def encode_frame(text, compression=None):
+    """返回 (text_data, bytes_data)，二者只有一个不为 None"""
+    if compression == "deflate" and len(text) >= COMPRESS_MIN_BYTES:
+        return None, zlib.compress(text.encode("utf-8"))
+    return text, None
+
+
+# ================= 二进制子协议 =================
+#
+# 客户端在握手时请求子协议 BINARY_SUBPROTOCOL 即启用。每个二进制帧首字节是类型标签：
+#   0x01 JSON          后面是 UTF-8 JSON
+#   0x02 DEFLATE_JSON  后面是 zlib 压缩的 JSON（连接同时开启了 compress=deflate）
+#   0x10 STROKE        path / erase 笔画（board.message 内的消息）
+#   0x11 PAN           pan 视角（board.message 内的消息）
+#   0x20 BATCH         board.batch：若干条 varint 长度前缀的子帧，子帧是 STROKE / PAN / JSON（消息本身）
+# STROKE / PAN 使用固定布局（网络字节序），末尾可跟一段 JSON 保存布局之外的字段：
+#   STROKE: tag:B flags:B seq:I lineWidth:d color:3s q:d count:varint pts:zigzag-varint*count [extra]
+#   PAN:    tag:B flags:B seq:I offsetX:d offsetY:d scale:d [extra]
+# flags: bit0 = erase，bit1 = 有 color，bit2 = 有 seq
+# seq 字段是 32 位无符号整数，超出范围的 seq 不设 bit2，放在 extra 的 "m" 里
+# extra: {"m": 消息顶层的其他字段, "d": data 里的其他字段}，两者都为空时省略；不是这个结构的帧拒绝
+
+BINARY_SUBPROTOCOL = "livemeeting.board.v1"
+
+TAG_JSON = 0x01
+TAG_DEFLATE_JSON = 0x02
+TAG_STROKE = 0x10
+TAG_PAN = 0x11
+TAG_BATCH = 0x20
+
+FLAG_ERASE = 0x01
+FLAG_COLOR = 0x02
+FLAG_SEQ = 0x04
+
+SEQ_MAX = 0xFFFFFFFF
+
+_STROKE_HEADER = struct.Struct("!BBId3sd")
+_PAN_HEADER = struct.Struct("!BBIddd")
+_STROKE_FIELDS = ("lineWidth", "color", "q", "pts")
+_PAN_FIELDS = ("offsetX", "offsetY", "scale")
+
+
+def encode_binary(text, compression=None):
+    """把已序列化的 JSON 文本包装成二进制帧"""
+    if compression == "deflate" and len(text) >= COMPRESS_MIN_BYTES:
+        return bytes([TAG_DEFLATE_JSON]) + zlib.compress(text.encode("utf-8"))
+    return bytes([TAG_JSON]) + text.encode("utf-8")
+
+
+def encode_binary_message(message):
+    """board.message 里的笔画 / pan 编码成紧凑帧，不适用时返回 None"""
+    op_type = message.get("type")
+    data = message.get("data")
+    if not isinstance(data, dict):
+        return None
+    seq = message.get("seq")
+    flags = FLAG_SEQ if _is_number(seq) and isinstance(seq, int) and 0 <= seq <= SEQ_MAX else 0
+    packed = ("type", "seq", "data") if flags & FLAG_SEQ else ("type", "data")
+    top_extra = {k: v for k, v in message.items() if k not in packed}
+
+    if op_type in ("path", "erase"):
+        pts = data.get("pts")
+        if not isinstance(pts, list) or not all(isinstance(v, int) for v in pts):
+            return None
+        if op_type == "erase":
+            flags |= FLAG_ERASE
+        color = _pack_color(data.get("color"))
+        data_extra = {k: v for k, v in data.items() if k not in _STROKE_FIELDS}
+        if color is not None:
+            flags |= FLAG_COLOR
+        elif "color" in data:
+            data_extra["color"] = data["color"]
+        header = _STROKE_HEADER.pack(
+            TAG_STROKE, flags, seq if flags & FLAG_SEQ else 0,
+            _float(data.get("lineWidth")), color or b"\0\0\0", _float(data.get("q"), 1.0),
+        )
+        body = _write_varints([len(pts)] + [_zigzag(v) for v in pts])
+        return header + body + _pack_extra(top_extra, data_extra)
+
+    if op_type == "pan":
+        if not all(_is_number(data.get(k)) for k in ("offsetX", "offsetY")):
+            return None
+        data_extra = {k: v for k, v in data.items() if k not in _PAN_FIELDS}
+        header = _PAN_HEADER.pack(
+            TAG_PAN, flags, seq if flags & FLAG_SEQ else 0,
+            data["offsetX"], data["offsetY"], _float(data.get("scale"), 1.0),
+        )
+        return header + _pack_extra(top_extra, data_extra)
+    return None
+
+
+def encode_binary_batch(messages):
+    """board.batch 里的消息编码成一个 BATCH 帧"""
+    out = bytearray([TAG_BATCH])
+    for message in messages:
+        frame = encode_binary_message(message)
+        if frame is None:
+            frame = bytes([TAG_JSON]) + json.dumps(message, separators=(",", ":")).encode("utf-8")
+        out += _write_varints([len(frame)])
+        out += frame
+    return bytes(out)
+
+
+def decode_binary(frame):
+    """解析客户端发来的二进制帧，返回消息 dict；格式错误抛 ValueError
+
+    笔画的 pts 会展开成 points 列表，之后和 JSON 客户端走同一条处理流程。
+    """
+    if not frame:
+        raise ValueError("empty frame")
+    tag = frame[0]
+    try:
+        if tag == TAG_JSON:
+            return json.loads(frame[1:].decode("utf-8"))
+        if tag == TAG_DEFLATE_JSON:
+            return json.loads(zlib.decompress(frame[1:]).decode("utf-8"))
+        if tag == TAG_STROKE:
+            _, flags, seq, line_width, color, q = _STROKE_HEADER.unpack_from(frame)
+            values, offset = _read_varints(frame, _STROKE_HEADER.size)
+            pts = [_unzigzag(v) for v in values]
+            data = {
+                "points": [{"x": x * q, "y": y * q} for x, y in delta_decode(pts)],
+                "lineWidth": line_width,
+            }
+            if flags & FLAG_COLOR:
+                data["color"] = "#" + color.hex()
+            message = {"type": "erase" if flags & FLAG_ERASE else "path", "data": data}
+            return _apply_extra(message, flags, seq, frame[offset:])
+        if tag == TAG_PAN:
+            _, flags, seq, offset_x, offset_y, scale = _PAN_HEADER.unpack_from(frame)
+            message = {"type": "pan", "data": {"offsetX": offset_x, "offsetY": offset_y, "scale": scale}}
+            return _apply_extra(message, flags, seq, frame[_PAN_HEADER.size:])
+    except (struct.error, zlib.error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError(f"bad frame: {exc}") from exc
+    raise ValueError(f"unknown frame tag {tag:#x}")
+
+
+def _apply_extra(message, flags, seq, extra):
+    if flags & FLAG_SEQ:
+        message["seq"] = seq
+    if extra:
+        extra = json.loads(extra.decode("utf-8"))
+        if not isinstance(extra, dict):
+            raise ValueError("bad frame: extra is not an object")
+        data_extra, top_extra = extra.get("d") or {}, extra.get("m") or {}
+        if not isinstance(data_extra, dict) or not isinstance(top_extra, dict):
+            raise ValueError("bad frame: extra fields are not objects")
+        message["data"].update(data_extra)
+        for key, value in top_extra.items():
+            message.setdefault(key, value)
+    return message
+
+
+def _pack_extra(top_extra, data_extra):
+    if not top_extra and not data_extra:
+        return b""
+    extra = {}
+    if top_extra:
+        extra["m"] = top_extra
+    if data_extra:
+        extra["d"] = data_extra
+    return json.dumps(extra, separators=(",", ":")).encode("utf-8")
+
+
+def _pack_color(color):
+    if isinstance(color, str) and len(color) == 7 and color.startswith("#"):
+        try:
+            return bytes.fromhex(color[1:])
+        except ValueError:
+            return None
+    return None
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _write_varints(values):
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _read_varints(frame, offset):
+    """先读一个 count，再读 count 个 varint，返回 (values, 新 offset)"""
+    def read():
+        nonlocal offset
+        value = shift = 0
+        while True:
+            if offset >= len(frame):
+                raise struct.error("truncated varint")
+            byte = frame[offset]
+            offset += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    count = read()
+    if count > len(frame):
+        raise struct.error("bad point count")
+    return [read() for _ in range(count)], offset
+
+
+def _float(value, default=0.0):
+    return float(value) if _is_number(value) else default
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,190 @@
+# board/compaction.py
+#
+# 把 board 的操作列表压缩成更小的快照：
+#   - clear / undo 已经在折叠日志时生效（clear 之前的历史整个丢掉），这里只处理剩下的冗余
+#   - pan 只保留最后一条
+#   - 旧格式（points 列表）的笔画顺便编码成压缩格式
+#   - 超过撤销期限（BOARD_UNDO_WINDOW，见 undo_expired）的橡皮擦不能再被撤销：
+#     被这些橡皮擦完全覆盖、自己也过了期限的笔画直接删除，过了期限又擦不到任何图形的橡皮擦一并删除。
+#     期限内的图形和橡皮擦一律保留，它们还能按 id 撤销 / 重做（undo 橡皮擦时被擦掉的笔画要重新出现）；
+#     旧数据里没有时间戳（t）的图形按期限内处理
+# 这些函数都是纯计算，不修改传入的 action，可以放在线程里跑
+
+import math
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import BoardAction, BoardSnapshot
+from .strokes import encode_action, stroke_points
+
+# 图形加入 board（或被 redo）多少秒后不能再撤销，之后才会在压缩时合并
+UNDO_WINDOW = getattr(settings, "BOARD_UNDO_WINDOW", 3600)
+DEFAULT_ERASE_WIDTH = 15
+# 笔画每段最多采样多少个点，需要更多时不合并（防止超长线段拖慢压缩）
+MAX_SEGMENT_SAMPLES = 256
+
+
+def compact_actions(actions, now=None):
+    """返回压缩后的新列表；now 是判断撤销期限用的当前时间，默认 time.time()"""
+    return [action for _, action in compact_indexed(actions, now)]
+
+
+def compact_indexed(actions, now=None):
+    """同 compact_actions，但返回 (原下标, 压缩后的 action)，调用方可以据此保留对象的顺序号"""
+    last_pan = None
+    indexed = []
+    for i, action in enumerate(actions):
+        if not action:
+            continue
+        if action.get("type") == "pan":
+            last_pan = (i, action)
+        else:
+            indexed.append((i, encode_action(action)))
+
+    now = time.time() if now is None else now
+    kept = _drop_erased_strokes([action for _, action in indexed], now)
+    result = [indexed[k] for k in kept]
+    if last_pan is not None:
+        result.append(last_pan)
+    return result
+
+
+def undo_expired(action, now):
+    """图形是否已经过了撤销期限；没有时间戳 t 的旧数据永远不过期"""
+    stamp = action.get("t")
+    return _is_finite(stamp) and now - stamp > UNDO_WINDOW
+
+
+def write_snapshot(board_id, seq, state):
+    """保存 seq 处的快照，并删除已经被快照覆盖的日志和旧快照"""
+    with transaction.atomic():
+        BoardSnapshot.objects.create(board_id=board_id, seq=seq, state=state)
+        BoardAction.objects.filter(board_id=board_id, seq__lte=seq).delete()
+        BoardSnapshot.objects.filter(board_id=board_id, seq__lt=seq).delete()
+
+
+def action_bbox(action):
+    """返回 (minx, miny, maxx, maxy)，无法计算时返回 None"""
+    data = action.get("data") or {}
+    op_type = action.get("type")
+    width = _number(data.get("lineWidth"), 0)
+    pad = width / 2
+    if op_type in ("path", "erase"):
+        points = stroke_points(data)
+        if not points:
+            return None
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        return (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+    if op_type == "rect":
+        x, y = _number(data.get("x")), _number(data.get("y"))
+        w, h = _number(data.get("width")), _number(data.get("height"))
+        return (min(x, x + w) - pad, min(y, y + h) - pad, max(x, x + w) + pad, max(y, y + h) + pad)
+    if op_type == "circle":
+        x, y = _number(data.get("x")), _number(data.get("y"))
+        r = abs(_number(data.get("radius"))) + pad
+        return (x - r, y - r, x + r, y + r)
+    return None
+
+
+def bbox_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+# ================= 橡皮擦合并 =================
+
+def _drop_erased_strokes(items, now):
+    """返回保留下来的下标列表；只有过了撤销期限的笔画和橡皮擦会被删除"""
+    bboxes = [action_bbox(a) for a in items]
+    erasers = [
+        i for i, a in enumerate(items)
+        if a.get("type") == "erase" and bboxes[i] and undo_expired(a, now)
+    ]
+    if not erasers:
+        return list(range(len(items)))
+
+    removed = set()
+    for i, action in enumerate(items):
+        if action.get("type") != "path" or bboxes[i] is None or not undo_expired(action, now):
+            continue
+        later = [j for j in erasers if j > i and bbox_overlap(bboxes[i], bboxes[j])]
+        if later and _fully_erased(action, [items[j] for j in later]):
+            removed.add(i)
+
+    # 过期的橡皮擦只在还能擦到东西时保留（前面至少有一个未删除且包围盒相交的图形）
+    expired = set(erasers)
+    result = []
+    for i, action in enumerate(items):
+        if i in removed:
+            continue
+        if i in expired:
+            hits = any(
+                j not in removed and items[j].get("type") != "erase"
+                and (bboxes[j] is None or bbox_overlap(bboxes[i], bboxes[j]))
+                for j in range(i)
+            )
+            if not hits:
+                continue
+        result.append(i)
+    return result
+
+
+def _fully_erased(path, erasers):
+    data = path.get("data") or {}
+    half = _number(data.get("lineWidth"), 2) / 2
+    points = stroke_points(data)
+    segments = []
+    for eraser in erasers:
+        edata = eraser.get("data") or {}
+        radius = _number(edata.get("lineWidth"), DEFAULT_ERASE_WIDTH) / 2 - half
+        if radius <= 0:
+            continue
+        epoints = stroke_points(edata)
+        if len(epoints) == 1:
+            epoints = epoints * 2
+        for (ax, ay), (bx, by) in zip(epoints, epoints[1:]):
+            segments.append((ax, ay, bx, by, radius))
+    if not segments or not points:
+        return False
+
+    samples = _samples(points, segments)
+    return samples is not None and all(_covered(x, y, segments) for x, y in samples)
+
+
+def _samples(points, segments):
+    """笔画上的采样点：顶点 + 线段内按橡皮擦半径的一半等距取点；
+    某段需要超过 MAX_SEGMENT_SAMPLES 个点时返回 None（按没有擦干净处理，保留笔画）"""
+    step = max(0.5, min(s[4] for s in segments) / 2)
+    samples = [points[0]]
+    for (ax, ay), (bx, by) in zip(points, points[1:]):
+        n = max(1, int(math.ceil(math.hypot(bx - ax, by - ay) / step)))
+        if n > MAX_SEGMENT_SAMPLES:
+            return None
+        samples.extend((ax + (bx - ax) * k / n, ay + (by - ay) * k / n) for k in range(1, n + 1))
+    return samples
+
+
+def _covered(x, y, segments):
+    for ax, ay, bx, by, radius in segments:
+        if _segment_distance(x, y, ax, ay, bx, by) <= radius:
+            return True
+    return False
+
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def _is_finite(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _number(value, default=0):
+    return value if isinstance(value, (int, float)) else default
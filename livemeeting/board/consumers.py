@@ -1,66 +1,119 @@
+import asyncio
 import json
+import logging
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from .models import Board
+from livemeeting.metrics import active_sockets, database_sync_to_async, init_state_bytes, messages_in, messages_out
+from livemeeting.outbox import OutboxMixin, drop_queued
+from .compaction import UNDO_WINDOW
+from .codec import (
+    BINARY_SUBPROTOCOL, COMPRESSIONS, decode_binary, encode_binary, encode_binary_batch,
+    encode_binary_message, encode_frame, iter_json_chunks,
+)
+from .fanout import board_fanout
+from .presence import PRESENCE_HEARTBEAT, get_presence, user_profiles
+from .spatial import parse_rect, viewport_rect
+from .state import DRAWABLE_TYPES, board_states
+from .strokes import InvalidStroke, encode_action
+
+# 被 clear 取代的排队消息
+CLEARED_TYPES = set(DRAWABLE_TYPES) | {"clear", "undo", "redo"}
+PRESENCE_TYPES = {"user_list", "user_joined", "user_left"}
+# 客户端能发的消息类型，/metrics 按类型计数（其他一律记为 other，避免标签无限增长）
+CLIENT_TYPES = {
+    "path", "erase", "rect", "circle", "text", "clear", "undo", "redo", "pan", "follow", "ack",
+    "viewport", "presence_sync", "sharescreen", "stopsharescreen", "share_video", "stop_share_video",
+}
+
+logger = logging.getLogger(__name__)
+
+class BoardConsumer(OutboxMixin, AsyncWebsocketConsumer):
+    metrics_name = "board"
 
-class BoardConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        # 广播消息经有界队列发送，慢客户端积压时合并 / 断开（见 livemeeting/outbox.py）
+        self.open_outbox()
         self.board_id = self.scope['url_route']['kwargs']['board_id']
         self.group_name = f"board_{self.board_id}"
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        # 客户端以 ?compress=deflate 连接时，大帧压缩后以二进制帧发送
+        self.compression = query.get("compress", [None])[0]
+        if self.compression not in COMPRESSIONS:
+            self.compression = None
+        # ?viewport=<宽>,<高>：首屏只加载当前视口内的对象，其余随平移按需获取
+        try:
+            self.screen = tuple(float(v) for v in query["viewport"][0].split(","))[:2]
+            if len(self.screen) != 2:
+                self.screen = None
+        except (KeyError, ValueError):
+            self.screen = None
+        # 视口加载模式下，初始快照的顺序号上界；断线重连时客户端用 ?horizon= 带回来
+        try:
+            self.horizon = int(query["horizon"][0])
+        except (KeyError, ValueError):
+            self.horizon = None
+        self.loaded = set()        # 已经发给客户端的对象顺序号
+        # 跟随主持人的连接加入 follow group，只有它们收到主持人的平移；?follow=0 时看自己的视图
+        self.follow_group = f"{self.group_name}_follow"
+        self.following = query.get("follow", ["1"])[0] != "0"
+        # 握手时请求了二进制子协议的客户端，收发都用二进制帧（见 board/codec.py）
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get("subprotocols", [])
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
-        print(f"✅ 用户连接 WebSocket，加入 group: {self.group_name} | channel: {self.channel_name}")
-        # 初始化状态
-        board_state = await self.get_board_state()
-        current_sharescreen = await self.get_current_sharescreen()  # ✅ 获取当前共享用户ID
-        await self.send(text_data=json.dumps({
-            "type": "init_state",
-            "state": board_state,
-            "current_sharescreen": current_sharescreen   # ✅ 加上这里
-        }))
-
-        current_sharevideo = await self.get_current_sharevideo()
-        await self.send(text_data=json.dumps({
-            "type": "init_state",
-            "state": board_state,
-            "current_sharescreen": current_sharescreen,
-            "current_sharevideo": current_sharevideo  # 🔹 新增
-        }))
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+        active_sockets.inc(consumer="board")
+        self.counted = True
+        logger.debug("用户连接 WebSocket，加入 group: %s | channel: %s", self.group_name, self.channel_name)
+        # 初始化状态（进程内共享的内存状态）
+        self.board_state = await board_states.acquire(self.board_id)
+        if self.following and not self.is_presenter:
+            await self.channel_layer.group_add(self.follow_group, self.channel_name)
+
+        # 断线重连：客户端带上 ?since=<最后看到的 seq>，只补发缺失的尾部
+        try:
+            since = int(query["since"][0])
+        except (KeyError, ValueError):
+            since = None
+        await self.send_initial_state(since)
 
     # ========== 用户加入在线列表 ==========
+        # 组里只广播增量（user_joined / user_left，带版本号），全量列表只发给自己
         user_id = self.scope["user"].id
-        user_ids = await self.add_user(user_id)
-        user_info = await self.get_user_info(user_ids)
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                "type": "board.message",
-                "message": {
-                    "type": "user_list",
-                    "users": user_info
+        version, user_ids, joined = await self.add_user(user_id)
+        self.presence_version, self.online_users = version, user_ids
+        self.heartbeat_task = asyncio.ensure_future(self.presence_heartbeat())
+        if joined:
+            await self.channel_layer.group_send(
+                self.group_name,
+                {
+                    "type": "board.message",
+                    "message": {
+                        "type": "user_joined",
+                        "version": version,
+                        "user": (await self.get_user_info([user_id]) or [{"id": user_id, "username": ""}])[0]
+                    }
                 }
-            }
-        )
+            )
 
         # 2️⃣ 直接发送给自己，确保自己的绿点立即显示
-        await self.send(text_data=json.dumps({
-            "type": "user_list",
-            "users": user_info
-        }))
+        await self.send_user_list(version, user_ids)
 
 
     async def disconnect(self, close_code):
         # 先移出 group
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
-        print(f"❌ 用户断开 WebSocket，离开 group: {self.group_name} | channel: {self.channel_name}")
+        await self.channel_layer.group_discard(self.follow_group, self.channel_name)
+        self.close_outbox()
+        if getattr(self, "counted", False):
+            active_sockets.dec(consumer="board")
+        logger.debug("用户断开 WebSocket，离开 group: %s | channel: %s", self.group_name, self.channel_name)
 
         # 检查是否是当前共享屏幕的用户
-        current_sharer = await self.get_current_sharescreen()
         user_id = self.scope["user"].id
-        if current_sharer == user_id:
+        if getattr(self, "board_state", None) is not None and self.get_current_sharescreen() == user_id:
             # 清空数据库字段
             await self.clear_current_sharescreen()
-            print(f"➡️ 用户 {user_id} 断开，清空 current_sharescreen")
+            logger.info("用户 %s 断开，清空 board %s 的 current_sharescreen", user_id, self.board_id)
 
             # 广播给组里的其他人：共享结束
             await self.channel_layer.group_send(
@@ -75,23 +128,69 @@ class BoardConsumer(AsyncWebsocketConsumer):
             )
 
         # ========== 用户离开在线列表 ==========
+        if getattr(self, "heartbeat_task", None) is not None:
+            self.heartbeat_task.cancel()
         user_id = self.scope["user"].id
-        user_ids = await self.remove_user(user_id)
-        user_info = await self.get_user_info(user_ids)
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                "type": "board.message",
-                "message": {
-                    "type": "user_list",
-                    "users": user_info
+        version, _, left = await self.remove_user(user_id)
+        if left:
+            # 同一用户的其他标签页还在线时不算离开
+            await self.channel_layer.group_send(
+                self.group_name,
+                {
+                    "type": "board.message",
+                    "message": {
+                        "type": "user_left",
+                        "version": version,
+                        "user_id": user_id
+                    }
                 }
-            }
-        )
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+            )
+
+        # 最后一个连接离开时把内存状态落盘
+        if getattr(self, "board_state", None) is not None:
+            await board_states.release(self.board_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            try:
+                data = decode_binary(bytes_data)
+            except ValueError as exc:
+                logger.warning("无法解析的二进制帧: %s", exc)
+                return
+        else:
+            try:
+                data = json.loads(text_data)
+            except ValueError as exc:
+                logger.warning("无法解析的消息: %s", exc)
+                return
+        if not isinstance(data, dict):
+            return
+        messages_in.inc(consumer="board", type=data.get("type") if data.get("type") in CLIENT_TYPES else "other")
+        if data.get("type") == "ack":
+            self.outbox.ack(data.get("n"))
+            return
+        if data.get("type") == "viewport":
+            await self.send_viewport(data.get("rect"))
+            return
+        if data.get("type") == "presence_sync":
+            # 客户端发现在线列表版本号不连续，重新取全量
+            version, user_ids = await self.get_users()
+            self.presence_version, self.online_users = version, user_ids
+            await self.send_user_list(version, user_ids)
+            return
+        if data.get("type") == "follow":
+            await self.set_following(bool(data.get("follow")))
+            return
+        if data.get("type") == "pan":
+            # 视图位置按用户单独保存（合并后定期写回），只有主持人的平移广播给跟随者
+            view = board_states.set_viewport(self.board_state, self.scope["user"].id, data.get("data"))
+            if view is not None and self.is_presenter:
+                board_fanout.publish(
+                    self.channel_layer, self.follow_group, {"type": "pan", "data": view}, self.channel_name
+                )
+            return
         allowed_types = ["path","erase","rect","circle","text","clear",
-                         "undo","redo","pan", "sharescreen", "stopsharescreen", "share_video", "stop_share_video"]
+                         "undo","redo", "sharescreen", "stopsharescreen", "share_video", "stop_share_video"]
         if data.get("type") not in allowed_types:
             return
         
@@ -100,7 +199,7 @@ class BoardConsumer(AsyncWebsocketConsumer):
             user_id = self.scope["user"].id
             # 保存到数据库
             await self.set_current_sharescreen(user_id)
-            print(f"➡️ sharescreen 消息准备广播: {data}")
+            logger.info("用户 %s 在 board %s 开始共享屏幕", user_id, self.board_id)
             await self.channel_layer.group_send(
                 self.group_name,
                 {
@@ -119,7 +218,7 @@ class BoardConsumer(AsyncWebsocketConsumer):
             user_id = self.scope["user"].id
             video_url = data["video_url"]
             await self.set_current_sharevideo(user_id, video_url)
-            print(f"➡️ share_video 消息准备广播: {data}")
+            logger.info("用户 %s 在 board %s 开始共享视频", user_id, self.board_id)
             await self.channel_layer.group_send(
                 self.group_name,
                 {
@@ -147,6 +246,7 @@ class BoardConsumer(AsyncWebsocketConsumer):
         
         # ========= stop sharescreen =========
         if data["type"] == "stopsharescreen":
+            user_id = self.scope["user"].id
             await self.clear_current_sharescreen()
             await self.channel_layer.group_send(
                 self.group_name,
@@ -160,174 +260,262 @@ class BoardConsumer(AsyncWebsocketConsumer):
             )
             return
         
-        # 广播消息给组内其他用户
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                "type": "board.message",
-                "message": data
-            }
-        )
-
-        # 数据库同步
-        if data["type"] in ["undo", "redo"]:
-            action = data.get("action")
-            await self.apply_undo_redo(data["type"], action)
-        elif data["type"] == "clear":
-            await self.apply_clear()
-        elif data["type"] == "pan":
-            await self.save_pan(data)
-        else:
-            await self.save_action_to_db(data)
+        # 笔画简化 + 量化压缩（undo/redo 携带的 action 也按同样规则编码，保证各端能匹配）
+        # 坐标不合法（非有限数、超出范围、pts / q 格式不对）的笔画在落盘和广播之前拒绝
+        data.pop("seq", None)
+        try:
+            data = encode_action(data)
+            if isinstance(data.get("action"), dict):
+                data["action"] = encode_action(data["action"])
+        except InvalidStroke as exc:
+            logger.warning("用户 %s 在 board %s 提交的笔画不合法: %s", self.scope["user"].id, self.board_id, exc)
+            await self.send_payload({"type": "conflict", "op": data["type"], "id": data.get("id")})
+            return
+        # 操作归属于当前用户，undo / redo 只能作用于自己的图形
+        data["user"] = self.scope["user"].id
+
+        # 更新内存状态（分配 seq），由 board_states 在后台批量落盘
+        seq = board_states.apply(self.board_state, data)
+        if seq is None:
+            # 与当前状态冲突（目标已被撤销 / 清空、重复提交等），只告诉发送者
+            await self.send_payload({"type": "conflict", "op": data["type"], "id": data.get("id")})
+            return
+
+        # 广播消息给组内其他用户（按 tick 合并成批，见 board/fanout.py）
+        board_fanout.publish(self.channel_layer, self.group_name, dict(data, seq=seq), self.channel_name)
 
     async def board_message(self, event):
-        payload = {
-            "type": "board.message",
-            "message": event["message"]
-        }
-        print(f"📢 广播给 group {self.group_name}: {payload}")
-        await self.send(text_data=json.dumps(payload))
-
-    # ================= 数据库操作 =================
-    @database_sync_to_async
-    def get_board_state(self):
-        board = Board.objects.get(id=self.board_id)
-        return board.state or []
+        message = event["message"]
+        if message.get("type") in ("user_joined", "user_left"):
+            self.track_presence(message)
+        self.enqueue(message)
 
-    @database_sync_to_async
-    def save_action_to_db(self, action):
-        board = Board.objects.get(id=self.board_id)
-        state = board.state or []
-        state.append(action)
-        board.state = state
-        board.save()
+    async def board_batch(self, event):
+        for message in event["messages"]:
+            self.enqueue(message)
 
-    @database_sync_to_async
-    def save_pan(self, action):
-        board = Board.objects.get(id=self.board_id)
-        state = board.state or []
-        # 移除旧 pan
-        state = [a for a in state if a.get("type") != "pan"]
-        state.append(action)
-        board.state = state
-        board.save()
+    # ================= 发送 =================
+    async def deliver(self, messages):
+        """队列里攒下的消息：一条按 board.message 发，多条合成一个 board.batch 帧"""
+        if len(messages) == 1:
+            await self.send_payload({"type": "board.message", "message": messages[0]})
+        elif self.binary:
+            await self.send(bytes_data=encode_binary_batch(messages))
+        else:
+            await self.send_frame(json.dumps({"type": "board.batch", "messages": messages}))
 
-    @database_sync_to_async
-    def apply_clear(self):
-        board = Board.objects.get(id=self.board_id)
-        board.state = []
-        board.save()
-
-    async def apply_undo_redo(self, op_type, action=None):
-        board = await database_sync_to_async(Board.objects.get)(id=self.board_id)
-        state = board.state or []
-
-        if op_type == "undo":
-            if state:
-                last_action = state.pop()
-                board.state = state
-                await database_sync_to_async(board.save)()
-                return last_action
-
-        elif op_type == "redo":
-            if action:
-                state.append(action)
-                board.state = state
-                await database_sync_to_async(board.save)()
-                return action
-
-    # ================= share screen 操作 =================        
-    @database_sync_to_async
-    def set_current_sharescreen(self, user_id):
-        board = Board.objects.get(id=self.board_id)
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            user = None
-        board.current_sharescreen = user
-        board.save()
-        return user.id if user else None
+    def coalesce_outbox(self, queue, message):
+        """客户端跟不上时，排队中被新消息取代的消息不再发送"""
+        kind = message.get("type")
+        if kind == "pan":
+            # 只有最新的视图位置有意义
+            drop_queued(queue, lambda m: m.get("type") == "pan")
+        elif kind == "user_list":
+            # 全量在线列表覆盖之前的列表和增量
+            drop_queued(queue, lambda m: m.get("type") in PRESENCE_TYPES)
+        elif kind == "clear":
+            drop_queued(queue, lambda m: m.get("type") in CLEARED_TYPES)
+        elif kind == "undo" and message.get("id") is not None:
+            # 撤销的图形还没发出去：两条都不用发
+            target = message["id"]
+            if drop_queued(queue, lambda m: m.get("type") in DRAWABLE_TYPES and m.get("id") == target):
+                return False
+        return True
 
-    @database_sync_to_async
-    def get_current_sharescreen(self):
-        board = Board.objects.get(id=self.board_id)
-        return board.current_sharescreen.id if board.current_sharescreen else None
-    
-    @database_sync_to_async
-    def clear_current_sharescreen(self):
-        board = Board.objects.get(id=self.board_id)
-        board.current_sharescreen = None
-        board.save()
+    async def send_payload(self, payload):
+        if payload.get("type") != "board.message":   # board.message 由队列发送时计数
+            messages_out.inc(consumer="board", type=payload.get("type"))
+        if self.binary and payload.get("type") == "board.message":
+            frame = encode_binary_message(payload["message"])
+            if frame is not None:
+                await self.send(bytes_data=frame)
+                return
+        await self.send_frame(json.dumps(payload))
 
-    # ================= share video 数据库操作 =================
-    @database_sync_to_async
-    def set_current_sharevideo(self, user_id, video_url):
-        board = Board.objects.get(id=self.board_id)
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        try:
-            board.current_sharevideo_user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            board.current_sharevideo_user = None
-        board.current_sharevideo_url = video_url
-        board.save()
+    async def send_frame(self, text):
+        if self.binary:
+            await self.send(bytes_data=encode_binary(text, self.compression))
+            return
+        text_data, bytes_data = encode_frame(text, self.compression)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
 
-    @database_sync_to_async
-    def get_current_sharevideo(self):
-        board = Board.objects.get(id=self.board_id)
-        if board.current_sharevideo_user:
-            return {"user_id": board.current_sharevideo_user.id, "video_url": board.current_sharevideo_url}
-        return None
+    async def send_initial_state(self, since=None):
+        """分块推送初始状态：init_begin（进度头）→ 若干 init_chunk → init_end
 
-    @database_sync_to_async
-    def clear_current_sharevideo(self):
-        board = Board.objects.get(id=self.board_id)
-        board.current_sharevideo_user = None
-        board.current_sharevideo_url = None
-        board.save()
+        mode=tail 时只包含 seq > since 的日志（客户端按实时消息重放），
+        mode=full 时是完整的操作列表，mode=viewport 时只有视口内的对象（带顺序号 z）。
+        每块之间让出事件循环，避免大 board 阻塞其他连接。
+        """
+        state = self.board_state
+        start_bytes = self.outbox.sent_bytes
+        tail = await board_states.tail(state, since) if since is not None else None
+        rect = None
+        view = self.current_view()
+        if tail is not None:
+            mode = "tail"
+            seq = tail[-1][0] if tail else since
+            actions = [dict(action, seq=action_seq) for action_seq, action in tail]
+            if self.horizon is not None:
+                self.horizon = min(self.horizon, state.next_order)
+        elif self.screen is not None:
+            mode = "viewport"
+            seq = state.seq
+            rect = viewport_rect({"data": view}, *self.screen)
+            self.horizon = state.next_order
+            items = state.query(rect)
+            self.loaded = {order for order, _ in items}
+            actions = [dict(action, z=order) for order, action in items]
+        else:
+            mode = "full"
+            self.horizon = None
+            seq = state.seq
+            actions = list(state.actions)   # 视图位置单独放在 init_begin 里
 
-    @database_sync_to_async
-    def get_current_sharevideo(self):
-        board = Board.objects.get(id=self.board_id)
-        if board.current_sharevideo_user and board.current_sharevideo_url:
-            return {
-                "user_id": board.current_sharevideo_user.id,
-                "video_url": board.current_sharevideo_url
-            }
-        return None
+        await self.send_payload({
+            "type": "init_begin",
+            "mode": mode,
+            "since": since if mode == "tail" else None,
+            "seq": seq,
+            "total": len(actions),
+            "rect": list(rect) if rect else None,
+            "pan": view if mode != "tail" else None,
+            "horizon": self.horizon,
+            # 撤销期限和服务器时间：客户端据此不再尝试撤销过期的图形（图形的 t 是服务器时间）
+            "undo_window": UNDO_WINDOW,
+            "now": time.time(),
+            "presenter": state.session.presenter,
+            "following": self.following and not self.is_presenter,
+            "current_sharescreen": self.get_current_sharescreen(),
+            "current_sharevideo": self.get_current_sharevideo(),
+        })
+        index = 0
+        for count, chunk in iter_json_chunks(actions):
+            await self.send_frame(
+                '{"type":"init_chunk","index":%d,"count":%d,"actions":[%s]}' % (index, count, chunk)
+            )
+            index += 1
+            await asyncio.sleep(0)
+        messages_out.inc(index, consumer="board", type="init_chunk")
+        await self.send_payload({"type": "init_end", "seq": seq, "chunks": index})
+        init_state_bytes.observe(self.outbox.sent_bytes - start_bytes)
 
-    # ========== 在线用户管理（全局字典） ==========
-    ONLINE_USERS = {}  # board_id → set(user_ids)
+    async def send_viewport(self, rect):
+        """视口加载：补发 rect 内、初始快照里还没发过的对象"""
+        rect = parse_rect(rect)
+        if rect is None or self.horizon is None:
+            return
+        items = [
+            (order, action) for order, action in self.board_state.query(rect, below=self.horizon)
+            if order not in self.loaded
+        ]
+        self.loaded.update(order for order, _ in items)
+        index = 0
+        for count, chunk in iter_json_chunks(dict(action, z=order) for order, action in items):
+            await self.send_frame(
+                '{"type":"viewport_chunk","index":%d,"count":%d,"actions":[%s]}' % (index, count, chunk)
+            )
+            index += 1
+            await asyncio.sleep(0)
+        messages_out.inc(index, consumer="board", type="viewport_chunk")
 
-    @classmethod
-    def _board_key(cls, board_id):
-        return f"board_{board_id}"
+    # ================= 视图位置 / 跟随主持人 =================
+    @property
+    def is_presenter(self):
+        return self.board_state.session.presenter == self.scope["user"].id
 
+    def current_view(self):
+        """跟随时用主持人的视图位置，否则用自己的"""
+        state = self.board_state
+        if self.following and not self.is_presenter:
+            view = state.viewport(state.session.presenter)
+            if view is not None:
+                return view
+        return state.viewport(self.scope["user"].id)
+
+    async def set_following(self, following):
+        if self.is_presenter or following == self.following:
+            return
+        self.following = following
+        if following:
+            await self.channel_layer.group_add(self.follow_group, self.channel_name)
+            # 重新跟随时马上跳到主持人当前的位置
+            view = self.board_state.viewport(self.board_state.session.presenter)
+            if view is not None:
+                self.enqueue({"type": "pan", "data": view})
+        else:
+            await self.channel_layer.group_discard(self.follow_group, self.channel_name)
+
+    # ================= share screen / share video =================
+    # 会话信息随 board 状态缓存在进程内（board/state.py 的 BoardSession），读取不查库，修改时原地更新并写回
+    async def set_current_sharescreen(self, user_id):
+        await board_states.set_sharescreen(self.board_state, user_id)
+
+    def get_current_sharescreen(self):
+        return self.board_state.session.sharescreen
+
+    async def clear_current_sharescreen(self):
+        await board_states.set_sharescreen(self.board_state, None)
+
+    async def set_current_sharevideo(self, user_id, video_url):
+        await board_states.set_sharevideo(self.board_state, user_id, video_url)
+
+    def get_current_sharevideo(self):
+        return self.board_state.session.sharevideo
+
+    async def clear_current_sharevideo(self):
+        await board_states.set_sharevideo(self.board_state, None, None)
+
+    # ========== 在线用户管理（可插拔 presence 后端，见 board/presence.py） ==========
+    # 按连接登记，同一用户的多个标签页互不影响；连接由 presence_heartbeat 定期续期
     @database_sync_to_async
     def add_user(self, user_id):
-        key = self._board_key(self.board_id)
-        if key not in self.ONLINE_USERS:
-            self.ONLINE_USERS[key] = set()
-        self.ONLINE_USERS[key].add(user_id)
-        return list(self.ONLINE_USERS[key])
+        return get_presence().join(self.group_name, user_id, self.channel_name)
+
+    @database_sync_to_async
+    def touch_user(self, user_id):
+        return get_presence().heartbeat(self.group_name, user_id, self.channel_name)
 
     @database_sync_to_async
     def remove_user(self, user_id):
-        key = self._board_key(self.board_id)
-        if key in self.ONLINE_USERS and user_id in self.ONLINE_USERS[key]:
-            self.ONLINE_USERS[key].remove(user_id)
-        return list(self.ONLINE_USERS[key])
+        return get_presence().leave(self.group_name, user_id, self.channel_name)
 
     @database_sync_to_async
     def get_users(self):
-        key = self._board_key(self.board_id)
-        return list(self.ONLINE_USERS.get(key, set()))
-    
+        return get_presence().members(self.group_name)
+
+    async def presence_heartbeat(self):
+        """续期本连接；版本号对不上（漏了增量、别的进程的连接过期）时给自己发全量列表"""
+        user_id = self.scope["user"].id
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT)
+            try:
+                version, user_ids, _ = await self.touch_user(user_id)
+            except Exception as exc:
+                logger.warning("presence 续期失败: %s", exc)
+                continue
+            if version != self.presence_version:
+                self.presence_version, self.online_users = version, user_ids
+                await self.send_user_list(version, user_ids)
+
+    def track_presence(self, message):
+        """按版本号应用组内广播的增量；不连续时保持旧版本，等下一次续期发全量"""
+        current = getattr(self, "presence_version", None)
+        if current is None or message.get("version") != current + 1:
+            return
+        self.presence_version = message["version"]
+        if message["type"] == "user_joined":
+            self.online_users = sorted(set(self.online_users) | {message["user"]["id"]})
+        else:
+            self.online_users = [u for u in self.online_users if u != message["user_id"]]
+
+    async def send_user_list(self, version, user_ids):
+        self.enqueue({
+            "type": "user_list",
+            "version": version,
+            "users": await self.get_user_info(user_ids)
+        })
+
     @database_sync_to_async
     def get_user_info(self, user_ids):
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        users = User.objects.filter(id__in=user_ids)
-        return [{"id": u.id, "username": u.username} for u in users]
+        # 用户名走进程内 LRU（board/presence.py），只查缓存里没有的用户
+        return user_profiles.get_many(user_ids)
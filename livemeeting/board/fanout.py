@@ -0,0 +1,96 @@
+# board/fanout.py
+#
+# board 消息的批量广播：
+#   - 同一个 board 的消息先进队列，每个 tick（BOARD_FANOUT_TICK 秒）合并成一次 group_send，
+#     每个接收端每个 tick 只收到一帧（board.batch）
+#   - 同一发送者还没发出去的 pan 只保留最新一条
+#   - 队列里的消息保持到达顺序，所以同一发送者的消息按序送达
+#   - 队列攒满 BOARD_FANOUT_MAX_BATCH 条时不等 tick 立即发送，延迟不超过一个 tick
+
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from livemeeting.metrics import fanout_batch_size, fanout_seconds
+
+logger = logging.getLogger(__name__)
+
+# 合并窗口（秒）
+FANOUT_TICK = getattr(settings, "BOARD_FANOUT_TICK", 0.03)
+# 单批最多多少条消息
+FANOUT_MAX_BATCH = getattr(settings, "BOARD_FANOUT_MAX_BATCH", 200)
+
+
+class BoardFanout:
+    """单个 group 的发送队列，只在事件循环线程里使用"""
+
+    def __init__(self, channel_layer, group_name):
+        self.channel_layer = channel_layer
+        self.group_name = group_name
+        self.queue = []            # [(sender, message, 入队时间)]
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def publish(self, message, sender=None):
+        if message.get("type") == "pan":
+            for i in range(len(self.queue) - 1, -1, -1):
+                queued_sender, queued, _ = self.queue[i]
+                if queued_sender == sender and queued.get("type") == "pan":
+                    del self.queue[i]
+                    break
+        self.queue.append((sender, message, time.monotonic()))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        elif len(self.queue) >= FANOUT_MAX_BATCH:
+            self._wake.set()
+
+    @property
+    def idle(self):
+        return not self.queue and (self._task is None or self._task.done())
+
+    async def _run(self):
+        while self.queue:
+            if len(self.queue) < FANOUT_MAX_BATCH:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), FANOUT_TICK)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            batch, self.queue = self.queue[:FANOUT_MAX_BATCH], self.queue[FANOUT_MAX_BATCH:]
+            try:
+                await self._send([message for _, message, _ in batch])
+            except Exception as exc:
+                logger.warning("group %s 批量广播失败: %s", self.group_name, exc)
+                continue
+            fanout_batch_size.observe(len(batch))
+            fanout_seconds.observe(time.monotonic() - min(queued_at for _, _, queued_at in batch))
+
+    async def _send(self, messages):
+        if len(messages) == 1:
+            event = {"type": "board.message", "message": messages[0]}
+        else:
+            event = {"type": "board.batch", "messages": messages}
+        await self.channel_layer.group_send(self.group_name, event)
+
+
+class FanoutRegistry:
+    """进程内所有 group 的发送队列"""
+
+    def __init__(self):
+        self._fanouts = {}
+
+    def publish(self, channel_layer, group_name, message, sender=None):
+        fanout = self._fanouts.get(group_name)
+        if fanout is None or fanout.channel_layer is not channel_layer:
+            self._prune()
+            fanout = self._fanouts[group_name] = BoardFanout(channel_layer, group_name)
+        fanout.publish(message, sender)
+
+    def _prune(self):
+        for name in [name for name, fanout in self._fanouts.items() if fanout.idle]:
+            del self._fanouts[name]
+
+
+board_fanout = FanoutRegistry()
@@ -0,0 +1,331 @@
+# board/management/commands/benchmark.py
+#
+# python manage.py benchmark --boards 4 --drawers 2 --viewers 20 --duration 30 --output bench.json
+# python manage.py benchmark --baseline bench.json --fail-on-regression
+#
+# 在本进程里启动 livemeeting.asgi.application，用 channels 的 WebsocketCommunicator 模拟负载：
+#   - 每个 board 若干画笔用户（按 --stroke-rate 发送 --stroke-points 个点左右的笔画）和只看的用户
+#   - 聊天室里的发言用户、屏幕共享房间里的信令双方（一个 owner + 若干 viewer 互发 candidate）
+# 接收端和浏览器一样定期回 ack（见 livemeeting/outbox.py），按消息里的 id 计算从发送到收到的延迟。
+# 输出吞吐量、各类消息的 p50 / p95 / p99 延迟、每秒写库次数和峰值 RSS，写成 JSON；
+# 带 --baseline 时逐项与基线比较，--fail-on-regression 时超出 --tolerance 的退化让命令失败。
+# 默认在临时的测试数据库里运行（和 manage.py test 一样先建库、迁移），不碰正式数据。
+
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from board.models import Board
+from board.state import board_states
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+# 和 board.js 一样，每收到这么多帧回一次 ack
+ACK_EVERY = 32
+
+
+class Command(BaseCommand):
+    help = "在进程内模拟 board / 聊天 / 屏幕共享负载，输出延迟、吞吐量等指标"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--boards", type=int, default=2, help="board 数")
+        parser.add_argument("--drawers", type=int, default=2, help="每个 board 的画笔用户数")
+        parser.add_argument("--viewers", type=int, default=10, help="每个 board 只看的用户数")
+        parser.add_argument("--stroke-rate", type=float, default=2.0, help="每个画笔用户每秒的笔画数")
+        parser.add_argument("--stroke-points", type=int, default=80, help="每个笔画的平均点数")
+        parser.add_argument("--chat-rooms", type=int, default=1, help="聊天室数")
+        parser.add_argument("--chat-senders", type=int, default=5, help="每个聊天室的发言用户数")
+        parser.add_argument("--chat-rate", type=float, default=0.5, help="每个发言用户每秒的消息数")
+        parser.add_argument("--share-rooms", type=int, default=1, help="屏幕共享房间数")
+        parser.add_argument("--share-peers", type=int, default=4, help="每个共享房间的 viewer 数")
+        parser.add_argument("--duration", type=float, default=10, help="发送持续的秒数")
+        parser.add_argument("--seed", type=int, default=1, help="随机种子，同样的参数生成同样的笔画")
+        parser.add_argument("--output", help="结果写入的 JSON 文件")
+        parser.add_argument("--baseline", help="用来比较的基线 JSON 文件")
+        parser.add_argument("--tolerance", type=float, default=10, help="允许的退化百分比")
+        parser.add_argument("--fail-on-regression", action="store_true", help="超出 tolerance 时返回失败")
+        parser.add_argument("--live-db", action="store_true", help="直接用当前数据库（会留下 bench_ 开头的用户和 board）")
+
+    def handle(self, *args, **options):
+        old_config, tmpdir = (None, None) if options["live_db"] else _setup_test_db()
+        try:
+            result = asyncio.run(Benchmark(options).run())
+        finally:
+            if old_config is not None:
+                connection.creation.destroy_test_db(old_config, verbosity=0)
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+        report = json.dumps(result, indent=2, ensure_ascii=False)
+        self.stdout.write(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report + "\n")
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = self.compare(json.load(f)["metrics"], result["metrics"], options["tolerance"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} 项指标退化超过 {options['tolerance']}%: {', '.join(regressions)}")
+
+    def compare(self, baseline, current, tolerance):
+        """逐项比较，返回退化超过 tolerance 的指标名"""
+        regressions = []
+        self.stdout.write(f"{'指标':<36}{'基线':>14}{'本次':>14}{'变化':>10}")
+        for name, value in sorted(current.items()):
+            base = baseline.get(name)
+            if not isinstance(base, (int, float)) or not isinstance(value, (int, float)):
+                continue
+            change = (value - base) / base * 100 if base else 0.0
+            # 吞吐量越高越好，延迟 / 写库 / 内存越低越好
+            worse = -change if name.endswith("_per_sec") else change
+            mark = ""
+            if worse > tolerance:
+                regressions.append(name)
+                mark = " ⚠️"
+            self.stdout.write(f"{name:<36}{base:>14.4g}{value:>14.4g}{change:>+9.1f}%{mark}")
+        return regressions
+
+
+def _setup_test_db():
+    """和 manage.py test 一样建一个测试库；SQLite 用临时文件而不是内存库，写库开销才接近实际
+
+    返回 (原数据库名, 临时目录)
+    """
+    tmpdir = None
+    if connection.vendor == "sqlite":
+        tmpdir = tempfile.mkdtemp(prefix="livemeeting-bench-")
+        connection.settings_dict.setdefault("TEST", {})
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(tmpdir, "db.sqlite3")
+    return connection.creation.create_test_db(verbosity=0, autoclobber=True), tmpdir
+
+
+class Stats:
+    def __init__(self):
+        self.sent = {}         # 类型 → 发送数
+        self.delivered = {}    # 类型 → 收到数（每个接收端算一次）
+        self.latencies = {}    # 类型 → [秒]
+        self.pending = {}      # 消息 id → (类型, 发送时间)
+        self.db_writes = 0
+
+    def send(self, kind, key):
+        self.sent[kind] = self.sent.get(kind, 0) + 1
+        self.pending[key] = (kind, time.perf_counter())
+
+    def receive(self, key):
+        entry = self.pending.get(key)
+        if entry is None:
+            return
+        kind, sent_at = entry
+        self.delivered[kind] = self.delivered.get(kind, 0) + 1
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - sent_at)
+
+    def count_query(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(WRITE_PREFIXES):
+            self.db_writes += 1
+        return execute(sql, params, many, context)
+
+
+class Benchmark:
+    def __init__(self, options):
+        self.options = options
+        self.random = random.Random(options["seed"])
+        self.stats = Stats()
+        self.clients = []
+        self.readers = []
+        self.application = None
+
+    async def run(self):
+        from livemeeting.asgi import application
+        self.application = application
+        options = self.options
+        connection_created.connect(self._watch_connection)
+        try:
+            boards, chat_rooms, share_rooms = await self.create_fixtures()
+            senders = []
+            for board, drawers, viewers in boards:
+                for user in viewers:
+                    await self.open(f"/ws/board/{board.id}/", user, self.read_board)
+                for user in drawers:
+                    client = await self.open(f"/ws/board/{board.id}/", user, self.read_board)
+                    senders.append(self.draw(client, user))
+            for room, users in chat_rooms:
+                for user in users:
+                    client = await self.open(f"/ws/chat/{room}/", user, self.read_chat)
+                    senders.append(self.chat(client, user))
+            for room, users in share_rooms:
+                for user in users:
+                    client = await self.open(f"/ws/sharescreen/{room}/", user, self.read_share)
+                    senders.append(self.signal(client))
+            await asyncio.sleep(0.5)   # 初始状态、在线列表先发完
+
+            self.stats.db_writes = 0
+            start = time.perf_counter()
+            await asyncio.gather(*senders)
+            await asyncio.sleep(1.0)   # 等最后一批消息送达
+            elapsed = time.perf_counter() - start
+            writes = self.stats.db_writes
+        finally:
+            for reader in self.readers:
+                reader.cancel()
+            for client in self.clients:
+                await client.disconnect()
+            await board_states.flush_all()
+            connection_created.disconnect(self._watch_connection)
+        return self.result(elapsed, writes)
+
+    def _watch_connection(self, sender, connection, **kwargs):
+        # 每个线程的连接对象会反复重连（CONN_MAX_AGE=0），只挂一次
+        if self.stats.count_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.stats.count_query)
+
+    async def create_fixtures(self):
+        @database_sync_to_async
+        def create():
+            User = get_user_model()
+            options = self.options
+            tag = f"{os.getpid()}_{int(time.time())}"
+            counter = iter(range(1_000_000))
+
+            def users(n):
+                return [User.objects.create(username=f"bench_{tag}_{next(counter)}") for _ in range(n)]
+
+            boards = []
+            for i in range(options["boards"]):
+                drawers, viewers = users(options["drawers"]), users(options["viewers"])
+                owner = drawers[0] if drawers else viewers[0]
+                boards.append((Board.objects.create(name=f"bench {i}", created_by=owner), drawers, viewers))
+            chat_rooms = [(f"bench_{tag}_{i}", users(options["chat_senders"])) for i in range(options["chat_rooms"])]
+            share_rooms = [(f"bench_{tag}_{i}", users(options["share_peers"] + 1)) for i in range(options["share_rooms"])]
+            return boards, chat_rooms, share_rooms
+
+        return await create()
+
+    async def open(self, path, user, reader):
+        client = WebsocketCommunicator(self.application, path)
+        client.scope["user"] = user
+        connected, _ = await client.connect(timeout=10)
+        if not connected:
+            raise CommandError(f"无法连接 {path}")
+        self.clients.append(client)
+        self.readers.append(asyncio.ensure_future(self.read(client, reader)))
+        return client
+
+    async def read(self, client, handle):
+        received = 0
+        while True:
+            message = await client.output_queue.get()
+            if message["type"] != "websocket.send":
+                return
+            received += 1
+            if received % ACK_EVERY == 0:
+                await client.send_json_to({"type": "ack", "n": received})
+            if message.get("text") is not None:
+                handle(json.loads(message["text"]))
+
+    # ========== 发送端 ==========
+    async def paced(self, rate, send):
+        """按 rate（每秒次数）发送，起始时间随机错开"""
+        if rate <= 0:
+            return
+        interval = 1 / rate
+        await asyncio.sleep(self.random.uniform(0, interval))
+        deadline = time.perf_counter() + self.options["duration"]
+        while time.perf_counter() < deadline:
+            await send()
+            await asyncio.sleep(interval)
+
+    async def draw(self, client, user):
+        async def send():
+            key = f"s{user.id}_{self.random.getrandbits(48):x}"
+            self.stats.send("stroke", key)
+            await client.send_json_to({"type": "path", "id": key, "data": self.stroke()})
+        await self.paced(self.options["stroke_rate"], send)
+
+    def stroke(self):
+        """随机游走的笔画，点数在平均值上下浮动"""
+        count = max(2, int(self.random.gauss(self.options["stroke_points"], self.options["stroke_points"] / 4)))
+        x, y = self.random.uniform(0, 2000), self.random.uniform(0, 1200)
+        points = []
+        for _ in range(count):
+            x += self.random.gauss(0, 4)
+            y += self.random.gauss(0, 4)
+            points.append({"x": round(x, 2), "y": round(y, 2)})
+        return {"points": points, "color": "#1e90ff", "lineWidth": 2}
+
+    async def chat(self, client, user):
+        async def send():
+            key = f"c{user.id}_{self.random.getrandbits(48):x}"
+            self.stats.send("chat", key)
+            await client.send_json_to({"message": key})
+        await self.paced(self.options["chat_rate"], send)
+
+    async def signal(self, client):
+        # 信令频率不高，每个参与者每秒发一个 candidate 给房间里的其他人
+        async def send():
+            key = f"x{self.random.getrandbits(48):x}"
+            self.stats.send("signal", key)
+            await client.send_json_to({"type": "candidate", "candidate": {"candidate": key, "sdpMid": "0"}})
+        await self.paced(1.0, send)
+
+    # ========== 接收端 ==========
+    def read_board(self, payload):
+        if payload.get("type") == "board.batch":
+            messages = payload.get("messages", [])
+        elif payload.get("type") == "board.message":
+            messages = [payload.get("message", {})]
+        else:
+            return
+        for message in messages:
+            if message.get("id"):
+                self.stats.receive(message["id"])
+
+    def read_chat(self, payload):
+        self.stats.receive(payload.get("message"))
+
+    def read_share(self, payload):
+        if payload.get("type") == "candidate":
+            self.stats.receive((payload.get("candidate") or {}).get("candidate"))
+
+    # ========== 结果 ==========
+    def result(self, elapsed, writes):
+        stats = self.stats
+        metrics = {
+            "db_writes_per_sec": writes / elapsed,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        for kind in sorted(stats.sent):
+            metrics[f"{kind}_sent_per_sec"] = stats.sent[kind] / elapsed
+            metrics[f"{kind}_delivered_per_sec"] = stats.delivered.get(kind, 0) / elapsed
+            latencies = sorted(stats.latencies.get(kind, []))
+            for p in (50, 95, 99):
+                metrics[f"{kind}_latency_p{p}_ms"] = _percentile(latencies, p) * 1000
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "options": {k: v for k, v in self.options.items() if k in _WORKLOAD_OPTIONS},
+            "elapsed": elapsed,
+            "metrics": metrics,
+        }
+
+
+_WORKLOAD_OPTIONS = (
+    "boards", "drawers", "viewers", "stroke_rate", "stroke_points", "chat_rooms", "chat_senders",
+    "chat_rate", "share_rooms", "share_peers", "duration", "seed",
+)
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    # nearest-rank
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
@@ -0,0 +1,151 @@
+# board/management/commands/runworkers.py
+#
+# python manage.py runworkers --workers 4 --port 8000
+#
+# 启动 N 个 daphne worker（各自监听一个 unix socket）和前端路由（livemeeting/router.py），
+# 同一个 board / 聊天室的连接总是落到同一个 worker。
+#   - worker 异常退出时自动重启，期间它的 key 临时分给其他 worker
+#   - kill -TTIN <pid> 增加一个 worker，kill -TTOU <pid> 减少一个；需要迁移的连接被断开后由客户端重连
+#   - SIGTERM / SIGINT：停止接收新连接，等已有连接结束（最多 --drain-timeout 秒），再依次停止 worker
+#   - channel layer 是 UnixSocketChannelLayer 时由本进程担任 hub，worker 重启不影响跨进程消息
+
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+from livemeeting.channel_layer import UnixSocketChannelLayer
+from livemeeting.router import FrontRouter
+
+# 等待 worker 的 unix socket 可以连接的最长时间（秒）
+WORKER_START_TIMEOUT = 30
+# worker 收到 SIGTERM 后多久还没退出就强制结束（秒）
+WORKER_STOP_TIMEOUT = 10
+
+
+class Command(BaseCommand):
+    help = "启动多个 ASGI worker 和按 board / 聊天室固定 worker 的前端路由"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker 进程数")
+        parser.add_argument("--bind", default="0.0.0.0", help="对外监听地址")
+        parser.add_argument("--port", type=int, default=8000, help="对外监听端口")
+        parser.add_argument("--socket-dir", default=None, help="worker unix socket 所在目录，默认临时目录")
+        parser.add_argument("--drain-timeout", type=float, default=30, help="退出 / 减少 worker 时等待连接结束的秒数")
+        parser.add_argument("--application", default="livemeeting.asgi:application")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers 至少为 1")
+        asyncio.run(WorkerPool(options, self.stdout).run())
+
+
+class WorkerPool:
+    def __init__(self, options, stdout):
+        self.options = options
+        self.stdout = stdout
+        self.socket_dir = options["socket_dir"] or tempfile.mkdtemp(prefix="livemeeting-")
+        self.router = FrontRouter()
+        self.processes = {}       # 名字 → asyncio.subprocess.Process
+        self.next_id = 0
+        self.stopping = False
+        self._resize = asyncio.Lock()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        loop.add_signal_handler(signal.SIGTTIN, lambda: asyncio.ensure_future(self.add_worker()))
+        loop.add_signal_handler(signal.SIGTTOU, lambda: asyncio.ensure_future(self.remove_worker()))
+
+        layer = get_channel_layer()
+        if isinstance(layer, UnixSocketChannelLayer) and await layer.ensure_hub():
+            self.stdout.write(f"✅ channel hub 监听 {layer.path}")
+        await asyncio.gather(*(self.add_worker() for _ in range(self.options["workers"])))
+        await self.router.serve(self.options["bind"], self.options["port"])
+        self.stdout.write(
+            f"✅ 前端路由监听 {self.options['bind']}:{self.options['port']}，"
+            f"{len(self.processes)} 个 worker（pid {os.getpid()}）"
+        )
+        await stop.wait()
+
+        self.stopping = True
+        self.stdout.write("⏳ 停止接收新连接，等待已有连接结束…")
+        await self.router.drain(self.options["drain_timeout"])
+        await asyncio.gather(*(self.stop_worker(name) for name in list(self.processes)))
+
+    async def add_worker(self):
+        async with self._resize:
+            name = f"worker{self.next_id}"
+            self.next_id += 1
+            await self.start_worker(name)
+
+    async def remove_worker(self):
+        async with self._resize:
+            if len(self.processes) <= 1:
+                self.stdout.write("⚠️ 至少保留一个 worker")
+                return
+            name = max(self.processes, key=lambda n: int(n[len("worker"):]))
+            self.router.remove_worker(name)
+            await self.router.drain_worker(name, self.options["drain_timeout"])
+            await self.stop_worker(name)
+
+    async def start_worker(self, name):
+        path = os.path.join(self.socket_dir, f"{name}.sock")
+        if os.path.exists(path):
+            os.unlink(path)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "daphne", "-u", path, "--proxy-headers", self.options["application"],
+        )
+        self.processes[name] = process
+        await _wait_for_socket(path, process)
+        self.router.add_worker(name, path)
+        self.stdout.write(f"✅ {name} 已启动（pid {process.pid}）")
+        asyncio.ensure_future(self.watch(name, process))
+
+    async def stop_worker(self, name):
+        process = self.processes.pop(name, None)
+        if process is None or process.returncode is not None:
+            return
+        self.router.remove_worker(name)
+        process.terminate()   # daphne 断开剩余连接，board 状态在 disconnect 里落盘
+        try:
+            await asyncio.wait_for(process.wait(), WORKER_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        self.stdout.write(f"❌ {name} 已停止")
+
+    async def watch(self, name, process):
+        """worker 意外退出时从哈希环移出并重启"""
+        await process.wait()
+        if self.stopping or self.processes.get(name) is not process:
+            return
+        self.stdout.write(f"⚠️ {name} 意外退出（exit {process.returncode}），重新启动")
+        self.router.remove_worker(name)
+        del self.processes[name]
+        await asyncio.sleep(1)
+        if not self.stopping:
+            async with self._resize:
+                await self.start_worker(name)
+
+
+async def _wait_for_socket(path, process):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WORKER_START_TIMEOUT
+    while loop.time() < deadline:
+        if process.returncode is not None:
+            raise CommandError(f"worker 启动失败（exit {process.returncode}）")
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+    raise CommandError(f"worker 没有在 {WORKER_START_TIMEOUT} 秒内监听 {path}")
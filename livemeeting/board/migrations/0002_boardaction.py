@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_state_to_actions(apps, schema_editor):
+    """把旧的 Board.state 列表拆成逐条的 BoardAction"""
+    Board = apps.get_model('board', 'Board')
+    BoardAction = apps.get_model('board', 'BoardAction')
+    for board in Board.objects.only('id', 'state').iterator():
+        rows = [
+            BoardAction(board_id=board.id, seq=i, type=action.get('type', ''), data=action)
+            for i, action in enumerate((a for a in board.state or [] if a), start=1)
+        ]
+        BoardAction.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('board', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('type', models.CharField(max_length=32)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actions', to='board.board')),
+            ],
+            options={
+                'ordering': ['seq'],
+                'unique_together': {('board', 'seq')},
+            },
+        ),
+        migrations.RunPython(copy_state_to_actions, migrations.RunPython.noop),
+    ]
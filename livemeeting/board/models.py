@@ -11,7 +11,7 @@ class Board(models.Model):
     last_accessed = models.DateTimeField(auto_now=True)  # 自动更新时间
     users = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="boards", through='BoardUser', blank=True)
 
-    # 新增字段：保存 board 上的操作记录
+    # 旧字段：整块保存 board 上的操作记录；现在的操作日志见 BoardAction，仅做兼容保留
     state = models.JSONField(default=list, blank=True)
 
     #✅ 新增字段：记录当前共享屏幕的用户
@@ -45,6 +45,53 @@ class Board(models.Model):
         return BoardUser.objects.filter(board=self, is_authorized=True).values_list("user_id", flat=True)
 
 
+class BoardAction(models.Model):
+    """只追加的 board 操作日志，每个 board 内 seq 单调递增"""
+    board = models.ForeignKey(Board, related_name="actions", on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()
+    type = models.CharField(max_length=32)
+    data = models.JSONField()  # 客户端发来的完整操作消息
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['board', 'seq']
+        ordering = ['seq']
+
+    def __str__(self):
+        return f"{self.board_id}#{self.seq} {self.type}"
+
+
+class BoardSnapshot(models.Model):
+    """把 seq 及之前的日志折叠、压缩后的 board 状态；加载时 = 最新快照 + 之后的日志"""
+    board = models.ForeignKey(Board, related_name="snapshots", on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()
+    state = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['board', 'seq']
+        ordering = ['-seq']
+
+    def __str__(self):
+        return f"{self.board_id}@{self.seq}"
+
+
+class BoardViewport(models.Model):
+    """每个用户在每个 board 上最后的视图位置（平移 / 缩放），由 board 状态合并后定期写回"""
+    board = models.ForeignKey(Board, related_name="viewports", on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    offset_x = models.FloatField(default=0)
+    offset_y = models.FloatField(default=0)
+    scale = models.FloatField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['board', 'user']
+
+    def __str__(self):
+        return f"{self.board_id}/{self.user_id} ({self.offset_x}, {self.offset_y}) x{self.scale}"
+
+
 class BoardUser(models.Model):
     board = models.ForeignKey(Board, on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -0,0 +1,317 @@
+# board/presence.py
+#
+# 在线用户（presence）登记，后端可插拔（settings.BOARD_PRESENCE）：
+#   - LocalPresence   进程内字典，单进程部署 / 开发用
+#   - SQLitePresence  本机共享的 SQLite 文件，同一台机器上的多个 worker 共享
+#   - RedisPresence   Redis 协议（RESP）的存储，跨机器共享（客户端见 livemeeting/resp.py）
+# 登记的单位是连接而不是用户：同一用户开多个标签页时，最后一个连接离开才算下线。
+# 匿名连接（user_id 为 None）同样按连接登记，但不算在线用户，也不产生上线 / 下线增量。
+# 每条连接带 TTL，由连接所在进程定期续期（heartbeat）；进程崩溃后连接自然过期，不会留下幽灵用户。
+# 每个 room 有一个版本号，在线用户集合每变化一次（有人上线 / 下线 / 过期）加一，
+# consumer 据此广播 user_joined / user_left 增量，客户端发现版本号不连续时再取全量列表。
+# 所有方法都是同步的阻塞调用，consumer 里放在线程中执行。
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save
+from django.utils.module_loading import import_string
+
+from livemeeting.resp import RespClient
+
+# 连接多久没有续期就视为离线（秒）
+PRESENCE_TTL = getattr(settings, "BOARD_PRESENCE_TTL", 30)
+# 连接续期间隔（秒），应明显小于 TTL
+PRESENCE_HEARTBEAT = getattr(settings, "BOARD_PRESENCE_HEARTBEAT", 10)
+# 用户名缓存最多保留多少个用户
+PROFILE_CACHE_SIZE = getattr(settings, "BOARD_PRESENCE_PROFILE_CACHE", 1024)
+
+
+class PresenceBackend:
+    """后端接口：room 里登记 (连接 → 用户)
+
+    join / heartbeat / leave 返回 (版本号, 在线用户 id 列表, 该用户是否刚上线 / 刚下线)，
+    members 返回 (版本号, 在线用户 id 列表)。user_id 为 None 的匿名连接不出现在在线用户里。
+    """
+
+    def join(self, room, user_id, conn_id, ttl=None):
+        raise NotImplementedError
+
+    def heartbeat(self, room, user_id, conn_id, ttl=None):
+        """续期；连接已经过期被清理时重新登记"""
+        return self.join(room, user_id, conn_id, ttl)
+
+    def leave(self, room, user_id, conn_id):
+        raise NotImplementedError
+
+    def members(self, room):
+        raise NotImplementedError
+
+
+class LocalPresence(PresenceBackend):
+    def __init__(self, **options):
+        self._rooms = {}      # room → {conn_id: (user_id, expires_at)}
+        self._versions = {}   # room → 版本号
+        self._lock = threading.Lock()
+
+    def join(self, room, user_id, conn_id, ttl=None):
+        with self._lock:
+            online = self._prune(room)
+            self._rooms.setdefault(room, {})[conn_id] = (user_id, time.time() + (ttl or PRESENCE_TTL))
+            joined = _joined(online, user_id)
+            if joined:
+                self._bump(room)
+            return self._versions.get(room, 0), _with_user(online, user_id), joined
+
+    def leave(self, room, user_id, conn_id):
+        with self._lock:
+            conns = self._rooms.get(room)
+            was_online = conns is not None and conn_id in conns
+            if was_online:
+                del conns[conn_id]
+            online = self._prune(room)
+            left = was_online and user_id is not None and user_id not in online
+            if left:
+                self._bump(room)
+            return self._versions.get(room, 0), sorted(online), left
+
+    def members(self, room):
+        with self._lock:
+            online = self._prune(room)
+            return self._versions.get(room, 0), sorted(online)
+
+    def _prune(self, room):
+        """清理过期连接，返回在线用户集合；有用户因此下线时版本号加一"""
+        conns = self._rooms.get(room)
+        if not conns:
+            self._rooms.pop(room, None)
+            return set()
+        before = {user_id for user_id, _ in conns.values() if user_id is not None}
+        now = time.time()
+        for conn_id in [c for c, (_, expires) in conns.items() if expires <= now]:
+            del conns[conn_id]
+        online = {user_id for user_id, _ in conns.values() if user_id is not None}
+        if online != before:
+            self._bump(room)
+        return online
+
+    def _bump(self, room):
+        self._versions[room] = self._versions.get(room, 0) + 1
+
+
+class SQLitePresence(PresenceBackend):
+    """同一台机器上多个进程共享的 SQLite 文件（WAL 模式），每个线程一个连接"""
+
+    def __init__(self, path=None, **options):
+        self.path = str(path or settings.BASE_DIR / "presence.sqlite3")
+        self._local = threading.local()
+        with self._connect() as db:
+            # 旧版本的表 user_id 是 NOT NULL，登记不了匿名连接；表里只有短期数据，直接重建
+            columns = {row[1]: row[3] for row in db.execute("PRAGMA table_info(presence)")}
+            if columns.get("user_id"):
+                db.execute("DROP TABLE presence")
+            # 行按 (room, 连接) 唯一，匿名连接的 user_id 为 NULL
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS presence ("
+                " room TEXT NOT NULL, conn TEXT NOT NULL, user_id INTEGER,"
+                " expires REAL NOT NULL, PRIMARY KEY (room, conn))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS presence_expires ON presence (expires)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS presence_version ("
+                " room TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+
+    def join(self, room, user_id, conn_id, ttl=None):
+        with self._transaction() as db:
+            online = self._prune(db, room)
+            db.execute(
+                "INSERT INTO presence (room, conn, user_id, expires) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (room, conn) DO UPDATE SET user_id = excluded.user_id, expires = excluded.expires",
+                (room, conn_id, user_id, time.time() + (ttl or PRESENCE_TTL)),
+            )
+            joined = _joined(online, user_id)
+            if joined:
+                self._bump(db, room)
+            return self._version(db, room), _with_user(online, user_id), joined
+
+    def leave(self, room, user_id, conn_id):
+        with self._transaction() as db:
+            deleted = db.execute(
+                "DELETE FROM presence WHERE room = ? AND conn = ?", (room, conn_id)
+            ).rowcount
+            online = self._prune(db, room)
+            left = bool(deleted) and user_id is not None and user_id not in online
+            if left:
+                self._bump(db, room)
+            return self._version(db, room), sorted(online), left
+
+    def members(self, room):
+        with self._transaction() as db:
+            online = self._prune(db, room)
+            return self._version(db, room), sorted(online)
+
+    def _prune(self, db, room):
+        before = self._online(db, room)
+        db.execute("DELETE FROM presence WHERE room = ? AND expires <= ?", (room, time.time()))
+        online = self._online(db, room)
+        if online != before:
+            self._bump(db, room)
+        return online
+
+    def _online(self, db, room):
+        return {row[0] for row in db.execute(
+            "SELECT DISTINCT user_id FROM presence WHERE room = ? AND user_id IS NOT NULL", (room,)
+        )}
+
+    def _bump(self, db, room):
+        db.execute(
+            "INSERT INTO presence_version (room, version) VALUES (?, 1)"
+            " ON CONFLICT (room) DO UPDATE SET version = version + 1",
+            (room,),
+        )
+
+    def _version(self, db, room):
+        row = db.execute("SELECT version FROM presence_version WHERE room = ?", (room,)).fetchone()
+        return row[0] if row else 0
+
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")  # 先拿写锁，多个进程的“检查 → 修改”不会交错
+        return db
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+
+class RedisPresence(PresenceBackend):
+    """每个 room 一个有序集合：member = "<conn>|<user>"（匿名连接 user 为空），score = 过期时间；版本号是单独的计数器
+
+    “检查 → 修改”不是原子的，并发时偶尔会多发一条增量，客户端按版本号去重即可。
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", prefix="presence:", timeout=2.0, **options):
+        self.prefix = prefix
+        self._command = RespClient(url, timeout).command
+
+    def join(self, room, user_id, conn_id, ttl=None):
+        ttl = ttl or PRESENCE_TTL
+        key = self.prefix + room
+        online = self._prune(key)
+        self._command("ZADD", key, time.time() + ttl, _member(conn_id, user_id))
+        self._command("EXPIRE", key, int(ttl * 2))
+        joined = _joined(online, user_id)
+        if joined:
+            self._command("INCR", key + ":version")
+        return self._version(key), _with_user(online, user_id), joined
+
+    def leave(self, room, user_id, conn_id):
+        key = self.prefix + room
+        removed = self._command("ZREM", key, _member(conn_id, user_id))
+        online = self._prune(key)
+        left = bool(removed) and user_id is not None and user_id not in online
+        if left:
+            self._command("INCR", key + ":version")
+        return self._version(key), sorted(online), left
+
+    def members(self, room):
+        key = self.prefix + room
+        online = self._prune(key)
+        return self._version(key), sorted(online)
+
+    def _prune(self, key):
+        before = self._online(key)
+        if self._command("ZREMRANGEBYSCORE", key, "-inf", time.time()):
+            online = self._online(key)
+            if online != before:
+                self._command("INCR", key + ":version")
+            return online
+        return before
+
+    def _online(self, key):
+        members = self._command("ZRANGE", key, 0, -1) or []
+        users = (m.decode().rsplit("|", 1)[1] for m in members)
+        return {int(user) for user in users if user}
+
+    def _version(self, key):
+        return int(self._command("GET", key + ":version") or 0)
+
+
+def _member(conn_id, user_id):
+    return f"{conn_id}|{'' if user_id is None else user_id}"
+
+
+def _joined(online, user_id):
+    return user_id is not None and user_id not in online
+
+
+def _with_user(online, user_id):
+    return sorted(online if user_id is None else online | {user_id})
+
+
+class ProfileCache:
+    """user id → {"id", "username"} 的有界 LRU，只对缓存未命中的用户查库"""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or PROFILE_CACHE_SIZE
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, user_ids):
+        """按 user_ids 的顺序返回资料，不存在的用户跳过（需要在可以访问数据库的线程里调用）"""
+        found, missing = {}, []
+        with self._lock:
+            for user_id in user_ids:
+                profile = self._profiles.get(user_id)
+                if profile is None:
+                    missing.append(user_id)
+                else:
+                    self._profiles.move_to_end(user_id)
+                    found[user_id] = profile
+        if missing:
+            users = get_user_model().objects.filter(id__in=missing).values_list("id", "username")
+            with self._lock:
+                for user_id, username in users:
+                    found[user_id] = self._profiles[user_id] = {"id": user_id, "username": username}
+                while len(self._profiles) > self.max_size:
+                    self._profiles.popitem(last=False)
+        return [found[user_id] for user_id in user_ids if user_id in found]
+
+    def evict(self, user_id):
+        with self._lock:
+            self._profiles.pop(user_id, None)
+
+
+user_profiles = ProfileCache()
+
+
+def _evict_profile(sender, instance, **kwargs):
+    user_profiles.evict(instance.pk)
+
+
+post_save.connect(_evict_profile, sender=settings.AUTH_USER_MODEL, dispatch_uid="board_presence_profiles")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_presence():
+    """按 settings.BOARD_PRESENCE 创建（并缓存）presence 后端"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, "BOARD_PRESENCE", {})
+                backend = import_string(config.get("BACKEND", "board.presence.LocalPresence"))
+                _backend = backend(**config.get("OPTIONS", {}))
+    return _backend
@@ -0,0 +1,188 @@
+# board/render.py
+#
+# 纯 Python 的 board 光栅化（不依赖 Pillow）：
+#   - path / erase 按圆头粗线绘制，erase 恢复成背景色
+#   - rect / circle 画轮廓，线宽和浏览器一样不随缩放变化
+#   - text 在浏览器里也不按坐标绘制，这里跳过
+#   - 输出 RGBA PNG（zlib + 手写 chunk）
+# 都是纯计算，可以放在线程池里跑。
+
+import math
+import struct
+import zlib
+
+from .compaction import action_bbox, bbox_overlap
+from .strokes import stroke_points
+
+WHITE = (255, 255, 255, 255)
+TRANSPARENT = (0, 0, 0, 0)
+# 长线段切成小段再填充，避免斜线的包围盒过大
+MAX_SEGMENT_PIXELS = 8
+
+
+class Raster:
+    """RGBA 像素缓冲区"""
+
+    def __init__(self, width, height, background=TRANSPARENT):
+        self.width = width
+        self.height = height
+        self.background = bytes(background)
+        self.pixels = bytearray(self.background * (width * height))
+
+    def fill_capsule(self, ax, ay, bx, by, radius, color):
+        """填充线段 (a, b) 周围 radius 以内的像素（圆头线段）"""
+        if not all(map(math.isfinite, (ax, ay, bx, by, radius))):
+            return
+        # 先裁到画布外扩 radius 的范围（裁掉的部分离画布都超过 radius，不影响结果），
+        # 坐标再大切出的小段数也只和画布大小有关
+        clipped = _clip_segment(ax, ay, bx, by, -radius, -radius, self.width + radius, self.height + radius)
+        if clipped is None or not all(map(math.isfinite, clipped)):
+            return
+        ax, ay, bx, by = clipped
+        length = math.hypot(bx - ax, by - ay)
+        # radius 特别大时裁剪不起作用，再按画布大小限制段数（每段的填充范围本身已经限制在画布内）
+        max_steps = (self.width + self.height) // MAX_SEGMENT_PIXELS + 1
+        steps = max(1, min(max_steps, int(math.ceil(length / MAX_SEGMENT_PIXELS))))
+        for i in range(steps):
+            t0, t1 = i / steps, (i + 1) / steps
+            self._capsule(ax + (bx - ax) * t0, ay + (by - ay) * t0,
+                          ax + (bx - ax) * t1, ay + (by - ay) * t1, radius, color)
+
+    def _capsule(self, ax, ay, bx, by, radius, color):
+        x0 = max(0, int(math.floor(min(ax, bx) - radius)))
+        x1 = min(self.width - 1, int(math.ceil(max(ax, bx) + radius)))
+        y0 = max(0, int(math.floor(min(ay, by) - radius)))
+        y1 = min(self.height - 1, int(math.ceil(max(ay, by) + radius)))
+        if x0 > x1 or y0 > y1:
+            return
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        radius2 = radius * radius
+        pixels, width = self.pixels, self.width
+        for y in range(y0, y1 + 1):
+            py = y + 0.5
+            row = y * width
+            for x in range(x0, x1 + 1):
+                px = x + 0.5
+                if length2:
+                    t = ((px - ax) * dx + (py - ay) * dy) / length2
+                    t = 0.0 if t < 0 else 1.0 if t > 1 else t
+                    ex, ey = px - (ax + t * dx), py - (ay + t * dy)
+                else:
+                    ex, ey = px - ax, py - ay
+                if ex * ex + ey * ey <= radius2:
+                    offset = (row + x) * 4
+                    pixels[offset:offset + 4] = color
+
+    def to_png(self):
+        raw = bytearray()
+        stride = self.width * 4
+        for y in range(self.height):
+            raw.append(0)  # filter: none
+            raw += self.pixels[y * stride:(y + 1) * stride]
+        header = struct.pack("!IIBBBBB", self.width, self.height, 8, 6, 0, 0, 0)
+        return b"".join((
+            b"\x89PNG\r\n\x1a\n",
+            _chunk(b"IHDR", header),
+            _chunk(b"IDAT", zlib.compress(bytes(raw), 6)),
+            _chunk(b"IEND", b""),
+        ))
+
+
+def render_actions(actions, rect, width, height, background=TRANSPARENT):
+    """把 rect（画布坐标）范围内的操作画到 width × height 的 PNG 上"""
+    raster = Raster(width, height, background)
+    x0, y0, x1, y1 = rect
+    sx = width / ((x1 - x0) or 1)
+    sy = height / ((y1 - y0) or 1)
+    scale = min(sx, sy)
+
+    for action in actions:
+        if not action:
+            continue
+        bbox = action_bbox(action)
+        if bbox is None or not bbox_overlap(bbox, rect):
+            continue
+        data = action.get("data") or {}
+        op_type = action.get("type")
+        color = raster.background if op_type == "erase" else parse_color(data.get("color"))
+
+        if op_type in ("path", "erase"):
+            radius = max(0.5, _number(data.get("lineWidth"), 2) * scale / 2)
+            points = [((x - x0) * sx, (y - y0) * sy) for x, y in stroke_points(data)]
+            if len(points) == 1:
+                points = points * 2
+            for (ax, ay), (bx, by) in zip(points, points[1:]):
+                raster.fill_capsule(ax, ay, bx, by, radius, color)
+        elif op_type == "rect":
+            # 浏览器里 rect / circle 的线宽是 lineWidth / scale，即屏幕上固定像素
+            radius = max(0.5, _number(data.get("lineWidth"), 2) / 2)
+            left, top = (_number(data.get("x")) - x0) * sx, (_number(data.get("y")) - y0) * sy
+            right = left + _number(data.get("width")) * sx
+            bottom = top + _number(data.get("height")) * sy
+            corners = [(left, top), (right, top), (right, bottom), (left, bottom), (left, top)]
+            for (ax, ay), (bx, by) in zip(corners, corners[1:]):
+                raster.fill_capsule(ax, ay, bx, by, radius, color)
+        elif op_type == "circle":
+            radius = max(0.5, _number(data.get("lineWidth"), 2) / 2)
+            cx, cy = (_number(data.get("x")) - x0) * sx, (_number(data.get("y")) - y0) * sy
+            r = abs(_number(data.get("radius"))) * scale
+            n = max(12, min(256, int(r)))
+            ring = [(cx + r * math.cos(2 * math.pi * k / n), cy + r * math.sin(2 * math.pi * k / n))
+                    for k in range(n + 1)]
+            for (ax, ay), (bx, by) in zip(ring, ring[1:]):
+                raster.fill_capsule(ax, ay, bx, by, radius, color)
+    return raster.to_png()
+
+
+def content_bbox(actions):
+    """所有可绘制对象的并集包围盒，没有时返回 None"""
+    boxes = [action_bbox(a) for a in actions if a and a.get("type") != "erase"]
+    boxes = [b for b in boxes if b is not None]
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def parse_color(value):
+    """#rgb / #rrggbb → RGBA 字节，无法解析时为黑色"""
+    if isinstance(value, str) and value.startswith("#"):
+        digits = value[1:]
+        if len(digits) == 3:
+            digits = "".join(c * 2 for c in digits)
+        if len(digits) == 6:
+            try:
+                return bytes.fromhex(digits) + b"\xff"
+            except ValueError:
+                pass
+    return b"\x00\x00\x00\xff"
+
+
+def _clip_segment(ax, ay, bx, by, x0, y0, x1, y1):
+    """把线段裁到矩形 [x0, x1] × [y0, y1] 内（Liang–Barsky），完全在外面时返回 None"""
+    dx, dy = bx - ax, by - ay
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, ax - x0), (dx, x1 - ax), (-dy, ay - y0), (dy, y1 - ay)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    return ax + dx * t0, ay + dy * t0, ax + dx * t1, ay + dy * t1
+
+
+def _chunk(kind, data):
+    return struct.pack("!I", len(data)) + kind + data + struct.pack("!I", zlib.crc32(kind + data))
+
+
+def _number(value, default=0):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else default
@@ -0,0 +1,123 @@
+# board/spatial.py
+#
+# board 对象的空间索引（均匀网格哈希）：
+#   - 每个对象按包围盒登记到覆盖的格子里，增删都是 O(格子数)
+#   - 视口查询只扫描视口覆盖的格子
+#   - 没有包围盒的对象（如 text）和跨越太多格子的超大对象单独存放，查询时总是参与判断
+
+import math
+from collections import defaultdict
+
+from django.conf import settings
+
+# 网格边长（画布坐标单位）
+INDEX_CELL_SIZE = getattr(settings, "BOARD_INDEX_CELL_SIZE", 256)
+# 单个对象最多登记多少个格子，超过的按超大对象处理
+MAX_OBJECT_CELLS = 64
+# 视口查询最多扫描多少个格子，超过时直接遍历全部对象
+MAX_QUERY_CELLS = 4096
+
+
+class GridIndex:
+    """key → 包围盒 (minx, miny, maxx, maxy) 的网格索引"""
+
+    def __init__(self, cell_size=None):
+        self.cell_size = cell_size or INDEX_CELL_SIZE
+        self.cells = defaultdict(set)
+        self.boxes = {}
+        self.unbounded = set()   # 没有包围盒，任何视口都返回
+        self.large = set()       # 跨越格子太多，查询时逐个比较
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def add(self, key, bbox):
+        self.boxes[key] = bbox
+        if bbox is None:
+            self.unbounded.add(key)
+            return
+        cells = self._cells(bbox, MAX_OBJECT_CELLS)
+        if cells is None:
+            self.large.add(key)
+            return
+        for cell in cells:
+            self.cells[cell].add(key)
+
+    def remove(self, key):
+        if key not in self.boxes:
+            return
+        bbox = self.boxes.pop(key)
+        if bbox is None:
+            self.unbounded.discard(key)
+            return
+        if key in self.large:
+            self.large.discard(key)
+            return
+        for cell in self._cells(bbox, MAX_OBJECT_CELLS):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.boxes.clear()
+        self.unbounded.clear()
+        self.large.clear()
+
+    def query(self, rect):
+        """返回包围盒与 rect 相交的 key 集合（含没有包围盒的对象）"""
+        cells = self._cells(rect, MAX_QUERY_CELLS)
+        if cells is None:
+            candidates = self.boxes.keys()
+        else:
+            candidates = set(self.large)
+            for cell in cells:
+                candidates.update(self.cells.get(cell, ()))
+        result = set(self.unbounded)
+        for key in candidates:
+            bbox = self.boxes[key]
+            if bbox is not None and _overlap(bbox, rect):
+                result.add(key)
+        return result
+
+    def _cells(self, bbox, limit):
+        if not all(math.isfinite(v) for v in bbox):
+            return None
+        size = self.cell_size
+        x0, y0 = int(bbox[0] // size), int(bbox[1] // size)
+        x1, y1 = int(bbox[2] // size), int(bbox[3] // size)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > limit:
+            return None
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def viewport_rect(pan, width, height, margin=0.5):
+    """由 pan（offsetX, offsetY, scale）和屏幕尺寸算出画布坐标下的视口，四周各放宽 margin 倍"""
+    data = (pan or {}).get("data") or {}
+    offset_x = _number(data.get("offsetX"), 0)
+    offset_y = _number(data.get("offsetY"), 0)
+    scale = _number(data.get("scale"), 1) or 1
+    x0, y0 = -offset_x / scale, -offset_y / scale
+    x1, y1 = (width - offset_x) / scale, (height - offset_y) / scale
+    mx, my = (x1 - x0) * margin, (y1 - y0) * margin
+    return (x0 - mx, y0 - my, x1 + mx, y1 + my)
+
+
+def parse_rect(value):
+    """[x0, y0, x1, y1] → 规范化的元组，格式不对返回 None"""
+    if not isinstance(value, (list, tuple)) or len(value) != 4:
+        return None
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+        return None
+    x0, y0, x1, y1 = value
+    return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+
+def _overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _number(value, default):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else default
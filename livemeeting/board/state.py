@@ -0,0 +1,603 @@
+# board/state.py
+#
+# 每个 board 在本进程内维护一份权威的内存状态：
+#   - 收到的操作直接在内存里 O(1) 应用，并分配一个 board 内单调递增的 seq
+#   - 后台任务按时间/数量策略把新操作批量插入 BoardAction（write-behind，只追加）
+#   - 最后一个连接断开、进程退出时强制落盘
+#   - 保留最近一段日志，断线重连时只补发缺失的尾部
+#   - 日志超过数量/时间阈值后在线程里压缩成快照（BoardSnapshot），加载 = 快照 + 尾部日志
+#   - 操作列表上维护一份空间索引，支持按视口取对象；每个对象有一个只增不减的顺序号（order）
+#   - 乐观并发：每个图形有唯一 id 和所属用户，undo / redo 指明目标 id，与当前状态冲突的操作
+#     直接拒绝；落盘时 (board, seq) 唯一约束充当 compare-and-swap，冲突时重新加载并重放后重试
+#   - 会话信息（共享屏幕 / 共享视频）随状态一起加载、缓存，共享和停止时原地更新并写回数据库
+#   - 视图位置（pan）按用户单独保存在内存里，不进操作日志；每个 board 每隔一段时间批量写回一次 BoardViewport
+
+import asyncio
+import atexit
+import logging
+import math
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from livemeeting.metrics import database_sync_to_async
+
+from .compaction import action_bbox, compact_indexed, undo_expired, write_snapshot
+from .models import Board, BoardAction, BoardSnapshot, BoardViewport
+from .spatial import GridIndex
+from .tiles import render_cache
+
+# 脏数据最多在内存里停留多久（秒）
+FLUSH_INTERVAL = getattr(settings, "BOARD_STATE_FLUSH_INTERVAL", 2.0)
+# 累积多少条未落盘的操作后立即写回
+FLUSH_MAX_PENDING = getattr(settings, "BOARD_STATE_FLUSH_MAX_PENDING", 50)
+# 内存里保留多少条最近的日志用于增量同步
+TAIL_BUFFER = getattr(settings, "BOARD_STATE_TAIL_BUFFER", 1000)
+# 距上次快照累积多少条日志后压缩
+SNAPSHOT_EVERY = getattr(settings, "BOARD_SNAPSHOT_EVERY", 500)
+# 距上次快照超过多少秒且有新日志时压缩
+SNAPSHOT_MAX_AGE = getattr(settings, "BOARD_SNAPSHOT_MAX_AGE", 600)
+# 视图位置最多多久写回一次（秒）
+VIEWPORT_FLUSH_INTERVAL = getattr(settings, "BOARD_VIEWPORT_FLUSH_INTERVAL", 5.0)
+# 落盘遇到 seq 冲突时最多重新加载重试几次
+FLUSH_CONFLICT_RETRIES = 3
+
+logger = logging.getLogger(__name__)
+
+# 带 id、可以被 undo / redo 的图形
+DRAWABLE_TYPES = ("path", "erase", "rect", "circle", "text")
+
+
+class BoardSession:
+    """board 的会话信息：当前共享屏幕的用户、共享视频的用户和地址、主持人（只存用户 id）
+
+    主持人是 board 的创建者，跟随模式下其他用户的视图随主持人平移。
+    """
+
+    def __init__(self, sharescreen=None, sharevideo_user=None, sharevideo_url=None, presenter=None):
+        self.sharescreen = sharescreen
+        self.sharevideo_user = sharevideo_user
+        self.sharevideo_url = sharevideo_url
+        self.presenter = presenter
+
+    @property
+    def sharevideo(self):
+        if self.sharevideo_user and self.sharevideo_url:
+            return {"user_id": self.sharevideo_user, "video_url": self.sharevideo_url}
+        return None
+
+
+class BoardState:
+    """单个 board 的内存状态，只能在事件循环线程里修改"""
+
+    def __init__(self, board_id, entries=(), base=(), base_seq=0, base_time=None, session=None, viewports=None):
+        self.board_id = board_id
+        self.session = session or BoardSession()
+        self.viewports = viewports or {}   # 用户 id → {"offsetX", "offsetY", "scale"}
+        self.viewport_dirty = set()        # 还没写回的用户 id
+        self.viewport_flush = time.monotonic()
+        self.connections = 0
+        self.compacting = False
+        self.flush_lock = asyncio.Lock()
+        self.reload(entries, base, base_seq, base_time)
+
+    def reload(self, entries=(), base=(), base_seq=0, base_time=None):
+        """丢弃内存里的全部状态，从快照 + 日志重新折叠"""
+        self.actions = []
+        self.orders = []           # 与 actions 一一对应的顺序号
+        self.ids = {}              # 图形 id → 顺序号
+        self.next_order = 0
+        self.index = GridIndex()   # order → 包围盒
+        self.pan = None            # 旧日志里全局的 pan，没有自己视图位置的用户以它为准
+        self.seq = base_seq        # 已分配的最大 seq
+        self.pending = []          # 未落盘的 (seq, action)
+        self.recent = deque()      # 最近的 (seq, action)
+        self.recent_floor = base_seq  # seq 大于它的日志都在 recent 里
+        self.snapshot_seq = base_seq  # 最新快照对应的 seq，数据库里只有它之后的日志
+        self.snapshot_time = base_time or time.time()
+        for action in base:
+            self._fold(action)
+        for seq, action in entries:
+            self._fold(action)
+            self._remember(seq, action)
+            self.seq = seq
+        self.last_flush = time.monotonic()
+
+    @property
+    def dirty(self):
+        return bool(self.pending)
+
+    def resolve(self, action):
+        """检查操作能否应用在当前状态上，并补全它的目标；冲突时返回 False
+
+        - 图形：没有 id 时分配一个，id 已存在（客户端重发）时拒绝；记下加入时间 t
+        - undo：按 id 撤销，只能撤销自己的图形；目标已不存在（被撤销 / 清空）或过了撤销期限
+          （BOARD_UNDO_WINDOW，过期的图形可能已经在压缩时合并掉）时拒绝。
+          旧客户端不带 id 时撤销该用户自己最近的图形
+        - redo：重新加入 action，所属用户必须是自己，id 已存在时拒绝；加入时间按 redo 的时间重新记
+        """
+        op_type = action.get("type")
+        user = action.get("user")
+        now = time.time()
+        if op_type == "undo":
+            target = action.get("id")
+            if target is None:
+                target = self._last_owned(user)
+                if target is None:
+                    return False
+                action["id"] = target
+            if target not in self.ids:
+                return False
+            found = self._find(target)
+            if undo_expired(found, now):
+                return False
+            owner = found.get("user")
+            return owner is None or owner == user
+        if op_type == "redo":
+            inner = action.get("action")
+            if not isinstance(inner, dict) or inner.get("type") not in DRAWABLE_TYPES:
+                return False
+            if inner.get("user") is not None and inner.get("user") != user:
+                return False
+            inner.setdefault("id", uuid.uuid4().hex)
+            inner["t"] = int(now)
+            return inner["id"] not in self.ids
+        if op_type in DRAWABLE_TYPES:
+            action.setdefault("id", uuid.uuid4().hex)
+            action["t"] = int(now)
+            return action["id"] not in self.ids
+        return True
+
+    def apply(self, action):
+        """应用一条操作（调用前先 resolve），返回分配给它的 seq"""
+        self._fold(action)
+        self.seq += 1
+        self.pending.append((self.seq, action))
+        self._remember(self.seq, action)
+        return self.seq
+
+    def set_viewport(self, user, data):
+        """记录用户的视图位置，格式不对时返回 None；只改内存，由 BoardStateStore 定期写回"""
+        view = normalize_viewport(data)
+        if view is None or user is None:
+            return None
+        self.viewports[user] = view
+        self.viewport_dirty.add(user)
+        return view
+
+    def viewport(self, user):
+        """用户的视图位置，没有保存过时用旧的全局 pan"""
+        view = self.viewports.get(user)
+        if view is None and self.pan is not None:
+            view = normalize_viewport(self.pan.get("data"))
+        return view
+
+    def damage(self, action):
+        """应用 action 会改变画面的区域 [bbox, ...]；None 表示整个画面"""
+        op_type = action.get("type")
+        if op_type == "pan":
+            return []
+        if op_type == "clear":
+            return None
+        if op_type == "undo":
+            target = self._find(action.get("id"))
+        elif op_type == "redo":
+            target = action.get("action")
+        else:
+            target = action
+        bbox = action_bbox(target) if isinstance(target, dict) else None
+        return [bbox] if bbox is not None else []
+
+    def tail(self, since):
+        """返回 seq > since 的日志；内存里不够时返回 None"""
+        if since < self.recent_floor:
+            return None
+        return [(seq, action) for seq, action in self.recent if seq > since]
+
+    def snapshot(self):
+        """返回当前的操作列表（与旧 Board.state 格式一致）"""
+        state = list(self.actions)
+        if self.pan is not None:
+            state.append(self.pan)
+        return state
+
+    def query(self, rect, below=None):
+        """返回包围盒与 rect 相交的 [(order, action)]，按绘制顺序；below 只取顺序号更小的对象"""
+        hits = sorted(
+            order for order in self.index.query(rect)
+            if below is None or order < below
+        )
+        # orders 严格递增，二分查找对象位置
+        return [(order, self.actions[bisect_left(self.orders, order)]) for order in hits]
+
+    def rebase(self, base, entries, orders=None):
+        """用压缩后的快照替换已折叠的状态，再重放快照之后的日志
+
+        orders 是快照里每个对象原来的顺序号，重放的日志也尽量沿用原顺序号，
+        这样客户端已经按顺序号加载的对象不会失效。
+        """
+        reuse = {id(action): order for action, order in zip(self.actions, self.orders)}
+        self._reset()
+        self.pan = None
+        for action, order in zip(base, orders or [None] * len(base)):
+            self._fold(action, order)
+        for _, action in entries:
+            self._fold(action, reuse=reuse)
+
+    def _fold(self, action, order=None, reuse=None):
+        op_type = action.get("type")
+        if op_type == "undo":
+            target = action.get("id")
+            if target is None:
+                # 旧日志里的 undo 没有 id，撤销最后一个
+                if self.actions:
+                    self._remove(len(self.actions) - 1)
+            elif target in self.ids:
+                self._remove(bisect_left(self.orders, self.ids[target]))
+        elif op_type == "redo":
+            if action.get("action"):
+                self._push(action["action"], order, reuse)
+        elif op_type == "clear":
+            self._reset()
+        elif op_type == "pan":
+            # pan 只保留最新一条，单独存放，不进入操作列表
+            self.pan = action
+        else:
+            self._push(action, order, reuse)
+
+    def _push(self, action, order=None, reuse=None):
+        if order is None and reuse:
+            order = reuse.pop(id(action), None)
+        # 顺序号必须严格递增，沿用不了就分配新的
+        if order is None or (self.orders and order <= self.orders[-1]):
+            order = self.next_order
+        self.next_order = max(self.next_order, order + 1)
+        # 旧数据里的图形没有 id，按顺序号补一个（同样的日志折叠出同样的 id）
+        action.setdefault("id", f"o{order}")
+        self.actions.append(action)
+        self.orders.append(order)
+        self.ids[action["id"]] = order
+        self.index.add(order, action_bbox(action))
+
+    def _remove(self, position):
+        action = self.actions.pop(position)
+        order = self.orders.pop(position)
+        self.index.remove(order)
+        if self.ids.get(action.get("id")) == order:
+            del self.ids[action["id"]]
+
+    def _find(self, action_id):
+        order = self.ids.get(action_id)
+        if order is None:
+            return None
+        return self.actions[bisect_left(self.orders, order)]
+
+    def _last_owned(self, user):
+        for action in reversed(self.actions):
+            if action.get("user") in (None, user):
+                return action.get("id")
+        return None
+
+    def _reset(self):
+        self.actions = []
+        self.orders = []
+        self.ids = {}
+        self.index.clear()
+
+    def _remember(self, seq, action):
+        self.recent.append((seq, action))
+        if len(self.recent) > TAIL_BUFFER:
+            self.recent_floor = self.recent.popleft()[0]
+
+
+class BoardStateStore:
+    """进程内所有 board 的状态表，负责加载、引用计数和后台落盘"""
+
+    def __init__(self):
+        self._states = {}
+        self._locks = {}
+        self._flusher = None
+        atexit.register(self.flush_all_sync)
+
+    def get(self, board_id):
+        return self._states.get(str(board_id))
+
+    async def acquire(self, board_id):
+        """连接建立时调用：加载（或复用）board 状态并增加引用计数"""
+        key = str(board_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            state = self._states.get(key)
+            if state is None:
+                session, viewports, (base_seq, base, base_time, entries) = await self._load_with_session(key)
+                state = BoardState(
+                    key, entries, base=base, base_seq=base_seq, base_time=base_time,
+                    session=session, viewports=viewports,
+                )
+                self._states[key] = state
+            state.connections += 1
+        self._ensure_flusher()
+        return state
+
+    async def release(self, board_id):
+        """连接断开时调用：最后一个连接离开时落盘并释放内存"""
+        key = str(board_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            state = self._states.get(key)
+            if state is None:
+                return
+            state.connections -= 1
+            if state.connections > 0:
+                return
+            await self.flush_viewports(state)
+            await self.flush(state)
+            if state.connections <= 0 and not state.dirty and not state.viewport_dirty:
+                del self._states[key]
+
+    def apply(self, state, action):
+        """应用操作并返回 seq，与当前状态冲突时返回 None；
+        攒够一批时立即安排落盘，受影响的缩略图/瓦片作废"""
+        if not state.resolve(action):
+            return None
+        render_cache.invalidate(state.board_id, state.damage(action))
+        seq = state.apply(action)
+        if len(state.pending) >= FLUSH_MAX_PENDING:
+            asyncio.ensure_future(self.flush(state))
+        return seq
+
+    def set_viewport(self, state, user_id, data):
+        """更新视图位置，返回规范化后的位置；同一 board 的视图位置每 VIEWPORT_FLUSH_INTERVAL 秒最多写一次"""
+        return state.set_viewport(user_id, data)
+
+    async def flush_viewports(self, state):
+        if not state.viewport_dirty:
+            return
+        users, state.viewport_dirty = state.viewport_dirty, set()
+        state.viewport_flush = time.monotonic()
+        try:
+            await self._save_viewports(state.board_id, {user: state.viewports[user] for user in users})
+        except Exception:
+            state.viewport_dirty |= users
+            raise
+
+    async def tail(self, state, since):
+        """增量同步：返回 seq > since 的日志，无法补齐时返回 None"""
+        if since > state.seq or since < state.snapshot_seq:
+            return None
+        entries = state.tail(since)
+        if entries is not None:
+            return entries
+        # 内存里不够，先落盘再从数据库取
+        await self.flush(state)
+        return await self._load_tail(state.board_id, since)
+
+    async def flush(self, state):
+        # 同一个 board 的落盘串行执行，失败时把这批日志放回队首
+        async with state.flush_lock:
+            for _ in range(FLUSH_CONFLICT_RETRIES):
+                if not state.pending:
+                    return
+                batch, state.pending = state.pending, []
+                try:
+                    await self._save(state.board_id, batch)
+                except IntegrityError:
+                    # 这些 seq 已经被别的进程写入：重新加载，把本地未落盘的操作重放上去再试
+                    state.pending = batch + state.pending
+                    await self._resync(state)
+                    continue
+                except Exception:
+                    state.pending = batch + state.pending
+                    raise
+                state.last_flush = time.monotonic()
+                return
+            raise RuntimeError(f"board {state.board_id} 写入冲突，重试 {FLUSH_CONFLICT_RETRIES} 次后放弃")
+
+    async def _resync(self, state):
+        base_seq, base, base_time, entries = await self._load(state.board_id)
+        pending = state.pending
+        state.reload(entries, base, base_seq, base_time)
+        for _, action in pending:
+            if state.resolve(action):
+                state.apply(action)
+        render_cache.invalidate(state.board_id, None)
+        # 已连接的客户端手里的 seq 已经失效，通知它们重新加载
+        await get_channel_layer().group_send(
+            f"board_{state.board_id}",
+            {"type": "board.message", "message": {"type": "resync"}},
+        )
+
+    async def compact(self, state):
+        """把当前状态压缩成快照：压缩计算放在线程池，写库放在 DB 线程"""
+        if state.compacting:
+            return
+        state.compacting = True
+        try:
+            await self.flush(state)
+            if state.pending:
+                return  # 还在高频写入，下一轮再压缩
+            seq = state.seq
+            orders = list(state.orders)
+            loop = asyncio.get_running_loop()
+            indexed = await loop.run_in_executor(None, compact_indexed, state.snapshot())
+            compacted = [action for _, action in indexed]
+            await self._write_snapshot(state.board_id, seq, compacted)
+            state.snapshot_seq = seq
+            state.snapshot_time = time.time()
+            # 压缩期间又来的新操作重放到压缩结果上
+            tail = state.tail(seq)
+            if tail is not None:
+                state.rebase(compacted, tail, [orders[i] if i < len(orders) else None for i, _ in indexed])
+        finally:
+            state.compacting = False
+
+    def should_compact(self, state):
+        behind = state.seq - state.snapshot_seq
+        if behind >= SNAPSHOT_EVERY:
+            return True
+        return behind > 0 and time.time() - state.snapshot_time >= SNAPSHOT_MAX_AGE
+
+    async def flush_all(self):
+        for state in list(self._states.values()):
+            await self.flush(state)
+
+    def flush_all_sync(self):
+        """进程退出时的兜底落盘（atexit）"""
+        for state in list(self._states.values()):
+            if state.pending:
+                try:
+                    self._save_rows(state.board_id, state.pending)
+                    state.pending = []
+                except Exception as exc:
+                    logger.error("board %s 退出时落盘失败: %s", state.board_id, exc)
+            if state.viewport_dirty:
+                try:
+                    self._save_viewport_rows(state.board_id, {u: state.viewports[u] for u in state.viewport_dirty})
+                    state.viewport_dirty = set()
+                except Exception as exc:
+                    logger.error("board %s 退出时保存视图位置失败: %s", state.board_id, exc)
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self):
+        tick = min(FLUSH_INTERVAL, 1.0)
+        while self._states:
+            await asyncio.sleep(tick)
+            now = time.monotonic()
+            for state in list(self._states.values()):
+                if state.pending and (len(state.pending) >= FLUSH_MAX_PENDING
+                                      or now - state.last_flush >= FLUSH_INTERVAL):
+                    try:
+                        await self.flush(state)
+                    except Exception as exc:
+                        logger.warning("board %s 后台落盘失败: %s", state.board_id, exc)
+                if state.viewport_dirty and now - state.viewport_flush >= VIEWPORT_FLUSH_INTERVAL:
+                    try:
+                        await self.flush_viewports(state)
+                    except Exception as exc:
+                        logger.warning("board %s 保存视图位置失败: %s", state.board_id, exc)
+                if not state.compacting and self.should_compact(state):
+                    asyncio.ensure_future(self._compact_logged(state))
+                # release 时落盘失败的 board，补写成功后在这里释放
+                if state.connections <= 0 and not state.dirty and not state.viewport_dirty:
+                    self._states.pop(state.board_id, None)
+
+    async def _compact_logged(self, state):
+        try:
+            await self.compact(state)
+        except Exception as exc:
+            logger.warning("board %s 压缩快照失败: %s", state.board_id, exc)
+
+    async def set_sharescreen(self, state, user_id):
+        state.session.sharescreen = user_id
+        await self._save_session(state.board_id, current_sharescreen_id=user_id)
+
+    async def set_sharevideo(self, state, user_id, video_url):
+        state.session.sharevideo_user, state.session.sharevideo_url = user_id, video_url
+        await self._save_session(
+            state.board_id, current_sharevideo_user_id=user_id, current_sharevideo_url=video_url
+        )
+
+    @database_sync_to_async
+    def _save_session(self, board_id, **fields):
+        Board.objects.filter(id=board_id).update(**fields)
+
+    @database_sync_to_async
+    def _load(self, board_id):
+        return load_board_rows(board_id)
+
+    @database_sync_to_async
+    def _load_with_session(self, board_id):
+        # 会话查询同时确认 board 存在，日志加载不必再查一次
+        return load_board_session(board_id), load_board_viewports(board_id), load_board_rows(board_id, check=False)
+
+    @database_sync_to_async
+    def _save_viewports(self, board_id, viewports):
+        self._save_viewport_rows(board_id, viewports)
+
+    def _save_viewport_rows(self, board_id, viewports):
+        BoardViewport.objects.bulk_create(
+            [
+                BoardViewport(
+                    board_id=board_id, user_id=user_id,
+                    offset_x=view["offsetX"], offset_y=view["offsetY"], scale=view["scale"],
+                )
+                for user_id, view in viewports.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["board", "user"],
+            update_fields=["offset_x", "offset_y", "scale", "updated_at"],
+        )
+
+    @database_sync_to_async
+    def _load_tail(self, board_id, since):
+        rows = BoardAction.objects.filter(board_id=board_id, seq__gt=since).order_by("seq")
+        return list(rows.values_list("seq", "data"))
+
+    @database_sync_to_async
+    def _write_snapshot(self, board_id, seq, state):
+        write_snapshot(board_id, seq, state)
+
+    @database_sync_to_async
+    def _save(self, board_id, batch):
+        self._save_rows(board_id, batch)
+
+    def _save_rows(self, board_id, batch):
+        with transaction.atomic():
+            BoardAction.objects.bulk_create([
+                BoardAction(board_id=board_id, seq=seq, type=action.get("type", ""), data=action)
+                for seq, action in batch
+            ])
+
+
+def load_board_session(board_id):
+    """一次查询取出会话信息（只取外键 id，不加载用户对象）"""
+    row = Board.objects.filter(id=board_id).values_list(
+        "current_sharescreen_id", "current_sharevideo_user_id", "current_sharevideo_url", "created_by_id"
+    ).first()
+    if row is None:
+        raise Board.DoesNotExist(f"Board {board_id} does not exist")
+    return BoardSession(*row)
+
+
+def load_board_viewports(board_id):
+    """用户 id → 视图位置"""
+    rows = BoardViewport.objects.filter(board_id=board_id).values_list("user_id", "offset_x", "offset_y", "scale")
+    return {user_id: {"offsetX": x, "offsetY": y, "scale": scale} for user_id, x, y, scale in rows}
+
+
+def normalize_viewport(data):
+    """客户端发来的 {offsetX, offsetY, scale} → 只含这三个数字的字典，格式不对返回 None"""
+    if not isinstance(data, dict):
+        return None
+    values = [data.get("offsetX"), data.get("offsetY"), data.get("scale", 1)]
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) for v in values):
+        return None
+    if values[2] <= 0:
+        return None
+    return {"offsetX": values[0], "offsetY": values[1], "scale": values[2]}
+
+
+def load_board_rows(board_id, check=True):
+    """返回 (快照 seq, 快照状态, 快照时间戳, 快照之后的日志)"""
+    if check and not Board.objects.filter(id=board_id).exists():
+        raise Board.DoesNotExist(f"Board {board_id} does not exist")
+    snapshot = BoardSnapshot.objects.filter(board_id=board_id).order_by("-seq").first()
+    base_seq = snapshot.seq if snapshot else 0
+    rows = BoardAction.objects.filter(board_id=board_id, seq__gt=base_seq).order_by("seq")
+    return (
+        base_seq,
+        snapshot.state if snapshot else [],
+        snapshot.created_at.timestamp() if snapshot else None,
+        list(rows.values_list("seq", "data")),
+    )
+
+
+board_states = BoardStateStore()
@@ -0,0 +1,155 @@
+# board/strokes.py
+#
+# path / erase 笔画的服务端处理：
+#   1. Ramer–Douglas–Peucker 简化，去掉误差在容差内的点
+#   2. 坐标按 quantum 量化成整数
+#   3. 差分编码成扁平数组 pts = [x0, y0, dx1, dy1, ...]，data.q 记录 quantum
+# 存储和广播都用压缩格式，只在客户端绘制时展开（board.js strokePoints）。
+# 旧数据里的 points: [{x, y}, ...] 格式仍然兼容。
+# 客户端发来的笔画在编码前校验：坐标、线宽不是有限数或超出 BOARD_STROKE_MAX_COORD 时整条拒绝（InvalidStroke），
+# redo 带回的已编码笔画（pts / q）同样按这个范围严格校验，不合格的不会进入状态和日志。
+
+from django.conf import settings
+
+# 简化容差（画布坐标单位）
+STROKE_TOLERANCE = getattr(settings, "BOARD_STROKE_TOLERANCE", 0.5)
+# 坐标量化精度
+STROKE_QUANTUM = getattr(settings, "BOARD_STROKE_QUANTUM", 0.1)
+# 坐标和线宽的绝对值上限（画布坐标单位）
+STROKE_MAX_COORD = getattr(settings, "BOARD_STROKE_MAX_COORD", 1e7)
+
+STROKE_TYPES = ("path", "erase")
+
+
+class InvalidStroke(ValueError):
+    """笔画里有非有限数、超出范围的坐标，或者 pts / q 格式不对"""
+
+
+def encode_action(action):
+    """返回压缩后的新 action；不是笔画时原样返回，已编码的笔画校验后原样返回。
+    坐标或线宽不合法时抛出 InvalidStroke"""
+    if not isinstance(action, dict) or action.get("type") not in STROKE_TYPES:
+        return action
+    data = action.get("data")
+    if not isinstance(data, dict):
+        return action
+    line_width = data.get("lineWidth")
+    if _is_number(line_width) and not _in_range(line_width):
+        raise InvalidStroke(f"lineWidth 超出范围: {line_width!r}")
+    if not isinstance(data.get("points"), list):
+        if "pts" in data or "q" in data:
+            if _decode_pts(data) is None:
+                raise InvalidStroke("pts / q 格式不对或超出范围")
+        return action
+    points = [
+        (p["x"], p["y"]) for p in data["points"]
+        if isinstance(p, dict) and _is_number(p.get("x")) and _is_number(p.get("y"))
+    ]
+    if not all(_in_range(x) and _in_range(y) for x, y in points):
+        raise InvalidStroke("坐标不是有限数或超出范围")
+    if not points:
+        return action
+
+    encoded = {key: value for key, value in data.items() if key not in ("points", "pts", "q")}
+    encoded["q"] = STROKE_QUANTUM
+    encoded["pts"] = delta_encode(quantize(simplify(points, STROKE_TOLERANCE), STROKE_QUANTUM))
+    return dict(action, data=encoded)
+
+
+def stroke_points(data):
+    """从任一格式的笔画数据里取出 [(x, y), ...]；pts / q 不合法时返回空列表，不合法的 points 跳过"""
+    if not isinstance(data, dict):
+        return []
+    if "pts" in data:
+        return _decode_pts(data) or []
+    points = data.get("points")
+    return [
+        (p["x"], p["y"]) for p in points if isinstance(p, dict)
+        and _is_number(p.get("x")) and _is_number(p.get("y")) and _in_range(p["x"]) and _in_range(p["y"])
+    ] if isinstance(points, list) else []
+
+
+def _decode_pts(data):
+    """展开 pts / q，格式不对（pts 不是整数列表、q 不是正的有限数）或坐标超出范围时返回 None"""
+    pts, q = data.get("pts"), data.get("q", 1)
+    if not isinstance(pts, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in pts):
+        return None
+    if not _is_number(q) or not 0 < q <= STROKE_MAX_COORD:
+        return None
+    points = delta_decode(pts)
+    # 先用整数比较，避免超大整数乘 q 时溢出
+    limit = STROKE_MAX_COORD / q
+    if not all(abs(x) <= limit and abs(y) <= limit for x, y in points):
+        return None
+    return [(x * q, y * q) for x, y in points]
+
+
+def simplify(points, tolerance):
+    """Ramer–Douglas–Peucker（非递归），保留首尾点"""
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return list(points)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    tolerance2 = tolerance * tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = points[first]
+        bx, by = points[last]
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        max_dist, index = -1.0, -1
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if length2 == 0:
+                dist = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                cross = dx * (py - ay) - dy * (px - ax)
+                dist = cross * cross / length2
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if max_dist > tolerance2:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def quantize(points, quantum):
+    """量化成整数坐标，并去掉量化后重复的相邻点"""
+    result = []
+    for x, y in points:
+        q = (round(x / quantum), round(y / quantum))
+        if not result or result[-1] != q:
+            result.append(q)
+    return result
+
+
+def delta_encode(points):
+    flat = []
+    px = py = 0
+    for x, y in points:
+        flat.append(x - px)
+        flat.append(y - py)
+        px, py = x, y
+    return flat
+
+
+def delta_decode(flat):
+    points = []
+    x = y = 0
+    for i in range(0, len(flat) - 1, 2):
+        x += flat[i]
+        y += flat[i + 1]
+        points.append((x, y))
+    return points
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _in_range(value):
+    # NaN 的比较总是 False，inf 和超大整数也都在这里挡掉
+    return abs(value) <= STROKE_MAX_COORD
@@ -1,3 +1,505 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from .codec import (
+    TAG_BATCH, TAG_DEFLATE_JSON, TAG_JSON, TAG_PAN, TAG_STROKE, _STROKE_HEADER, _write_varints,
+    decode_binary, encode_binary, encode_binary_batch, encode_binary_message,
+)
+from . import tiles
+from . import compaction
+from .compaction import action_bbox, compact_actions
+from .models import Board, BoardAction, BoardSnapshot
+from .presence import LocalPresence, SQLitePresence
+from .render import WHITE, Raster
+from .state import BoardState, BoardStateStore
+from .strokes import (
+    InvalidStroke, delta_decode, delta_encode, encode_action, quantize, simplify, stroke_points,
+)
+
+
+def stroke(points, **data):
+    return encode_action({"type": "path", "data": {"points": points, "lineWidth": 2, "color": "#ff0000", **data}})
+
+
+class BinaryCodecTests(SimpleTestCase):
+    def test_stroke_round_trip(self):
+        message = dict(stroke([{"x": 0, "y": 0}, {"x": 10.5, "y": -3.2}, {"x": 20, "y": 7}], id="a1"), seq=7)
+        frame = encode_binary_message(message)
+        self.assertEqual(frame[0], TAG_STROKE)
+        decoded = decode_binary(frame)
+        self.assertEqual(decoded["type"], "path")
+        self.assertEqual(decoded["seq"], 7)
+        self.assertEqual(decoded["data"]["color"], "#ff0000")
+        self.assertEqual(decoded["data"]["id"], "a1")
+        self.assertEqual(len(decoded["data"]["points"]), 3)
+        for point, (x, y) in zip(decoded["data"]["points"], [(0, 0), (10.5, -3.2), (20, 7)]):
+            self.assertAlmostEqual(point["x"], x, places=6)
+            self.assertAlmostEqual(point["y"], y, places=6)
+
+    def test_erase_and_non_hex_color_round_trip(self):
+        message = encode_action({"type": "erase", "data": {"points": [{"x": 1, "y": 1}], "color": "white"}})
+        decoded = decode_binary(encode_binary_message(message))
+        self.assertEqual(decoded["type"], "erase")
+        self.assertEqual(decoded["data"]["color"], "white")
+
+    def test_pan_round_trip(self):
+        frame = encode_binary_message({"type": "pan", "data": {"offsetX": 1.5, "offsetY": -2, "scale": 2}, "user": 3})
+        self.assertEqual(frame[0], TAG_PAN)
+        self.assertEqual(
+            decode_binary(frame),
+            {"type": "pan", "data": {"offsetX": 1.5, "offsetY": -2.0, "scale": 2.0}, "user": 3},
+        )
+
+    def test_seq_beyond_32_bits_survives(self):
+        message = dict(stroke([{"x": 0, "y": 0}]), seq=2 ** 40)
+        self.assertEqual(decode_binary(encode_binary_message(message))["seq"], 2 ** 40)
+
+    def test_unsupported_messages_are_not_compacted(self):
+        self.assertIsNone(encode_binary_message({"type": "clear"}))
+        self.assertIsNone(encode_binary_message({"type": "path", "data": {"points": [{"x": 0, "y": 0}]}}))
+
+    def test_json_frames(self):
+        self.assertEqual(decode_binary(encode_binary('{"type":"clear"}')), {"type": "clear"})
+        self.assertEqual(decode_binary(bytes([TAG_DEFLATE_JSON]) + zlib.compress(b'{"a":1}')), {"a": 1})
+
+    def test_batch_frame_layout(self):
+        messages = [dict(stroke([{"x": 0, "y": 0}]), seq=1), {"type": "clear", "seq": 2}]
+        frame = encode_binary_batch(messages)
+        self.assertEqual(frame[0], TAG_BATCH)
+        # 第一个子帧：varint 长度 + STROKE 帧
+        length = frame[1]
+        self.assertEqual(decode_binary(frame[2:2 + length])["seq"], 1)
+        rest = frame[2 + length:]
+        self.assertEqual(rest[1], TAG_JSON)
+        self.assertEqual(json.loads(rest[2:2 + rest[0] - 1]), {"type": "clear", "seq": 2})
+
+    def test_bad_frames_raise_value_error(self):
+        header = _STROKE_HEADER.pack(TAG_STROKE, 0, 0, 1.0, b"\0\0\0", 1.0) + _write_varints([0])
+        bad = [
+            b"",
+            bytes([0x7F]),
+            bytes([TAG_JSON]) + b"{not json",
+            bytes([TAG_DEFLATE_JSON]) + b"not zlib",
+            header[:5],
+            _STROKE_HEADER.pack(TAG_STROKE, 0, 0, 1.0, b"\0\0\0", 1.0) + _write_varints([4, 1]),
+            # extra 不是对象，或者 m / d 不是对象
+            header + b"[1,2]",
+            header + b"3",
+            header + b'{"d":[1]}',
+            header + b'{"m":"x"}',
+        ]
+        for frame in bad:
+            with self.assertRaises(ValueError, msg=frame):
+                decode_binary(frame)
+
+
+class PresenceBackendMixin:
+    """LocalPresence / SQLitePresence 共用的行为测试"""
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.presence = self.make_backend()
+
+    def test_join_and_leave_per_connection(self):
+        version, users, joined = self.presence.join("b1", 1, "c1")
+        self.assertEqual((users, joined), ([1], True))
+        _, users, joined = self.presence.join("b1", 1, "c2")
+        self.assertEqual((users, joined), ([1], False))
+        _, users, left = self.presence.leave("b1", 1, "c1")
+        self.assertEqual((users, left), ([1], False))
+        v2, users, left = self.presence.leave("b1", 1, "c2")
+        self.assertEqual((users, left), ([], True))
+        self.assertGreater(v2, version)
+
+    def test_anonymous_connections(self):
+        self.presence.join("b1", 1, "c1")
+        version, users, joined = self.presence.join("b1", None, "anon")
+        self.assertEqual((users, joined), ([1], False))
+        self.assertEqual(self.presence.heartbeat("b1", None, "anon")[1], [1])
+        v2, users, left = self.presence.leave("b1", None, "anon")
+        self.assertEqual((users, left, v2), ([1], False, version))
+        self.assertEqual(self.presence.join("b2", None, "anon")[1], [])
+
+    def test_expired_connections_bump_version(self):
+        version, _, _ = self.presence.join("b1", 2, "c1", ttl=0.05)
+        time.sleep(0.1)
+        v2, users = self.presence.members("b1")
+        self.assertEqual(users, [])
+        self.assertGreater(v2, version)
+
+    def test_rooms_are_independent(self):
+        self.presence.join("b1", 1, "c1")
+        self.presence.join("b2", 2, "c2")
+        self.assertEqual(self.presence.members("b1")[1], [1])
+        self.assertEqual(self.presence.members("b2")[1], [2])
+
+
+class LocalPresenceTests(PresenceBackendMixin, SimpleTestCase):
+    def make_backend(self):
+        return LocalPresence()
+
+
+class SQLitePresenceTests(PresenceBackendMixin, SimpleTestCase):
+    def make_backend(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        return SQLitePresence(path=os.path.join(self.directory.name, "presence.sqlite3"))
+
+    def test_shared_between_instances(self):
+        other = SQLitePresence(path=self.presence.path)
+        self.presence.join("b1", 1, "c1")
+        self.assertEqual(other.join("b1", 2, "c2")[1], [1, 2])
+
+    def test_rebuilds_table_with_not_null_user(self):
+        path = os.path.join(self.directory.name, "old.sqlite3")
+        with sqlite3.connect(path) as db:
+            db.execute(
+                "CREATE TABLE presence (room TEXT NOT NULL, conn TEXT NOT NULL, user_id INTEGER NOT NULL,"
+                " expires REAL NOT NULL, PRIMARY KEY (room, conn))"
+            )
+        presence = SQLitePresence(path=path)
+        self.assertEqual(presence.join("b1", None, "anon")[1], [])
+
+
+class RasterTests(SimpleTestCase):
+    def test_huge_segment_is_clipped_to_the_raster(self):
+        raster = Raster(64, 64)
+        started = time.monotonic()
+        raster.fill_capsule(-1e12, -1e12, 1e12, 1e12, 2, WHITE)
+        self.assertLess(time.monotonic() - started, 1)
+        clipped = Raster(64, 64)
+        clipped.fill_capsule(-10, -10, 80, 80, 2, WHITE)
+        self.assertEqual(raster.pixels, clipped.pixels)
+        self.assertNotEqual(raster.pixels, Raster(64, 64).pixels)
+
+    def test_segment_outside_or_non_finite_draws_nothing(self):
+        raster = Raster(16, 16)
+        raster.fill_capsule(-100, 50, 100, 50, 2, WHITE)
+        raster.fill_capsule(0, 0, float("inf"), 5, 2, WHITE)
+        raster.fill_capsule(0, 0, 5, 5, float("nan"), WHITE)
+        self.assertEqual(raster.pixels, Raster(16, 16).pixels)
+
+    def test_huge_radius_is_bounded(self):
+        raster = Raster(16, 16)
+        raster.fill_capsule(0, 0, 1e12, 0, 1e9, WHITE)
+        self.assertEqual(raster.pixels, bytearray(bytes(WHITE) * 256))
+
+
+class RenderCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.cache = tiles.RenderCache(self.root)
+
+    def test_renders_are_shared_between_processes(self):
+        self.assertTrue(self.cache.put(1, (0, 0, 0), 5, b"png-bytes"))
+        self.assertTrue(self.cache.put(1, tiles.THUMBNAIL, 5, b"thumb"))
+        other = tiles.RenderCache(self.root)
+        self.assertEqual(other.get(1, (0, 0, 0)), (5, b"png-bytes"))
+        self.assertEqual(other.get(1, tiles.THUMBNAIL), (5, b"thumb"))
+        self.assertIsNone(other.get(1, (0, 1, 0)))
+        self.assertIsNone(other.get(2, tiles.THUMBNAIL))
+
+    def test_key_names_round_trip(self):
+        for key in (tiles.THUMBNAIL, (0, 0, 0), (-4, -3, 12)):
+            self.assertEqual(tiles.parse_key_name(tiles.key_name(key)), key)
+        self.assertIsNone(tiles.parse_key_name("junk"))
+
+    async def wait_for_unlinks(self, board_id):
+        for _ in range(200):
+            if not self.cache._unlinking[str(board_id)]:
+                return
+            await asyncio.sleep(0.01)
+
+    async def test_invalidate_removes_only_damaged_tiles(self):
+        with mock.patch.object(tiles, "RENDER_DELAY", 3600):
+            self.cache.put(1, (0, 0, 0), 1, b"a")
+            self.cache.put(1, (0, 5, 5), 1, b"b")
+            self.cache.put(1, tiles.THUMBNAIL, 1, b"t")
+            loop_thread = threading.get_ident()
+            disk_calls = []
+            def record(name):
+                real = getattr(os, name)
+                def call(*args):
+                    disk_calls.append((name, threading.get_ident()))
+                    return real(*args)
+                return mock.patch.object(tiles.os, name, call)
+            with record("listdir"), record("unlink"):
+                self.cache.invalidate(1, [(10, 10, 20, 20)])
+                self.assertIsNone(self.cache.get(1, (0, 0, 0)))
+                await self.wait_for_unlinks(1)
+            self.assertNotIn(loop_thread, [thread for _, thread in disk_calls])
+            self.assertFalse(os.path.exists(os.path.join(self.root, "1", "0_0_0.png")))
+            self.assertIsNone(self.cache.get(1, tiles.THUMBNAIL))
+            self.assertEqual(self.cache.get(1, (0, 5, 5)), (1, b"b"))
+            self.assertEqual(self.cache._stale["1"], {(0, 0, 0), tiles.THUMBNAIL})
+            self.cache._tasks["1"].cancel()
+
+    async def test_invalidate_lists_files_written_by_other_processes(self):
+        with mock.patch.object(tiles, "RENDER_DELAY", 3600):
+            tiles.RenderCache(self.root).put(1, (0, 0, 0), 1, b"a")
+            self.cache.invalidate(1, None)
+            for _ in range(200):
+                if self.cache._stale["1"]:
+                    break
+                await asyncio.sleep(0.01)
+            await self.wait_for_unlinks(1)
+            self.assertIsNone(self.cache.get(1, (0, 0, 0)))
+            self.assertEqual(os.listdir(os.path.join(self.root, "1")), [])
+            self.cache._tasks["1"].cancel()
+
+    def test_result_rendered_before_invalidation_is_dropped(self):
+        generation = self.cache.generation(1)
+        self.cache._generations["1"] += 1
+        self.assertFalse(self.cache.put(1, (0, 0, 0), 1, b"old", generation))
+        self.assertIsNone(self.cache.get(1, (0, 0, 0)))
+
+    def test_files_per_board_are_capped(self):
+        with mock.patch.object(tiles, "RENDER_MAX_FILES", 10):
+            for x in range(12):
+                self.cache.put(1, (0, x, 0), 1, b"p")
+            self.assertLessEqual(len(os.listdir(os.path.join(self.root, "1"))), 10)
+            self.assertEqual(self.cache.get(1, (0, 11, 0)), (1, b"p"))
+
+
+class RenderViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(tiles.render_cache, "root", directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user("alice", password="x")
+        self.board = Board.objects.create(name="b", created_by=self.user)
+        BoardAction.objects.create(board=self.board, seq=1, type="path", data=stroke([{"x": 10, "y": 10}, {"x": 60, "y": 40}]))
+
+    async def test_miss_returns_placeholder_then_rendered_png(self):
+        await self.async_client.aforce_login(self.user)
+        url = f"/board/{self.board.id}/thumbnail.png?v=1"
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Cache-Control"], "no-store")
+        self.assertEqual(response.content, tiles.PLACEHOLDER_PNG)
+        for _ in range(200):
+            if tiles.render_cache.get(self.board.id, tiles.THUMBNAIL) is not None:
+                break
+            await asyncio.sleep(0.01)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+        self.assertEqual(response["ETag"], f'"{self.board.id}-1"')
+        self.assertIn("immutable", response["Cache-Control"])
+
+    async def test_unknown_board_is_404(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/board/999/tiles/0/0/0.png")
+        self.assertEqual(response.status_code, 404)
+
+
+def eraser(points, id):
+    return dict(encode_action({"type": "erase", "data": {"points": points, "lineWidth": 40}}), id=id)
+
+
+class CompactionTests(TestCase):
+    def test_keeps_erased_strokes_and_idle_erasers(self):
+        actions = [
+            dict(stroke([{"x": 0, "y": 0}, {"x": 10, "y": 0}]), id="p1"),
+            {"type": "pan", "data": {"offsetX": 1, "offsetY": 0, "scale": 1}},
+            eraser([{"x": 0, "y": 0}, {"x": 10, "y": 0}], id="e1"),
+            eraser([{"x": 900, "y": 900}], id="e2"),
+            {"type": "pan", "data": {"offsetX": 2, "offsetY": 0, "scale": 1}},
+        ]
+        compacted = compact_actions(actions)
+        self.assertEqual([a.get("id") for a in compacted[:-1]], ["p1", "e1", "e2"])
+        self.assertEqual(compacted[-1]["data"]["offsetX"], 2)
+
+    def test_merges_erased_strokes_past_the_undo_window(self):
+        now = 10 ** 6
+        old, recent = now - compaction.UNDO_WINDOW - 1, now - 10
+        actions = [
+            dict(stroke([{"x": 0, "y": 0}, {"x": 10, "y": 0}]), id="p1", t=old),
+            dict(stroke([{"x": 0, "y": 50}, {"x": 10, "y": 50}]), id="p2", t=old),
+            dict(stroke([{"x": 0, "y": 90}, {"x": 100, "y": 90}]), id="p3", t=old),
+            dict(eraser([{"x": 0, "y": 0}, {"x": 10, "y": 0}], id="e1"), t=old),
+            dict(eraser([{"x": 0, "y": 50}, {"x": 10, "y": 50}], id="e2"), t=recent),
+            dict(eraser([{"x": 0, "y": 90}, {"x": 4, "y": 90}], id="e3"), t=old),
+        ]
+        compacted = compact_actions(actions, now=now)
+        # p1 被过期的 e1 擦干净，两者都删掉；e2 还能撤销，p2 保留；e3 只擦了 p3 的一部分，都保留
+        self.assertEqual([a["id"] for a in compacted], ["p2", "p3", "e2", "e3"])
+        # 没有时间戳的旧数据不合并
+        legacy = [{k: v for k, v in a.items() if k != "t"} for a in actions]
+        self.assertEqual(len(compact_actions(legacy, now=now)), len(actions))
+
+    def test_undo_is_refused_past_the_window(self):
+        state = BoardState("1")
+        action = dict(stroke([{"x": 0, "y": 0}, {"x": 5, "y": 5}]), id="a", user=1)
+        self.assertTrue(state.resolve(action))
+        state.apply(action)
+        self.assertAlmostEqual(action["t"], time.time(), delta=2)
+        action["t"] -= compaction.UNDO_WINDOW + 1
+        self.assertFalse(state.resolve({"type": "undo", "id": "a", "user": 1}))
+        action["t"] += 2
+        self.assertTrue(state.resolve({"type": "undo", "id": "a", "user": 1}))
+
+    async def test_undo_eraser_after_compaction(self):
+        user = await User.objects.acreate(username="alice")
+        board = await Board.objects.acreate(name="b", created_by=user)
+        with mock.patch("board.state.atexit.register"):
+            store = BoardStateStore()
+        state = await store.acquire(board.id)
+        try:
+            for action in (
+                dict(stroke([{"x": 0, "y": 0}, {"x": 10, "y": 0}]), id="p1"),
+                eraser([{"x": 0, "y": 0}, {"x": 10, "y": 0}], id="e1"),
+                eraser([{"x": 900, "y": 900}], id="e2"),
+            ):
+                self.assertIsNotNone(store.apply(state, dict(action, user=user.id)))
+            await store.compact(state)
+            snapshot = await BoardSnapshot.objects.filter(board=board).alatest("seq")
+            self.assertEqual([a["id"] for a in snapshot.state], ["p1", "e1", "e2"])
+
+            # 内存状态和从快照重新加载的状态都能撤销橡皮擦，被擦掉的笔画回来
+            reloaded = BoardState(board.id, base=snapshot.state, base_seq=snapshot.seq)
+            for target in (state, reloaded):
+                for eraser_id in ("e1", "e2"):
+                    undo = {"type": "undo", "id": eraser_id, "user": user.id}
+                    self.assertTrue(target.resolve(undo))
+                    target.apply(undo)
+                self.assertEqual([a["id"] for a in target.snapshot()], ["p1"])
+        finally:
+            await store.release(board.id)
+
+
+class StrokeEncodingTests(SimpleTestCase):
+    def test_simplify_drops_collinear_points_and_keeps_corners(self):
+        points = [(0, 0), (1, 0.01), (2, 0), (3, 0), (3, 5)]
+        self.assertEqual(simplify(points, 0.5), [(0, 0), (3, 0), (3, 5)])
+        self.assertEqual(simplify(points[:2], 0.5), points[:2])
+        self.assertEqual(simplify(points, 0), points)
+
+    def test_quantize_merges_duplicates(self):
+        self.assertEqual(quantize([(0.01, 0.02), (0.04, 0.0), (1.26, -0.25)], 0.1), [(0, 0), (13, -2)])
+
+    def test_delta_round_trip(self):
+        points = [(0, 0), (5, -3), (5, -3), (-100, 40)]
+        flat = delta_encode(points)
+        self.assertEqual(flat, [0, 0, 5, -3, 0, 0, -105, 43])
+        self.assertEqual(delta_decode(flat), points)
+        self.assertEqual(delta_decode(flat + [7]), points)
+
+    def test_encoded_stroke_stays_within_tolerance(self):
+        raw = [{"x": i * 0.37, "y": (i % 7) * 1.3} for i in range(200)]
+        encoded = stroke(raw)
+        self.assertNotIn("points", encoded["data"])
+        self.assertEqual(encoded["data"]["color"], "#ff0000")
+        decoded = stroke_points(encoded["data"])
+        self.assertLess(len(decoded), len(raw))
+        self.assertAlmostEqual(decoded[0][0], raw[0]["x"], delta=0.05)
+        self.assertAlmostEqual(decoded[-1][1], raw[-1]["y"], delta=0.05)
+
+    def test_non_strokes_and_bad_data_pass_through(self):
+        for action in (
+            {"type": "rect", "data": {"x": 1}},
+            {"type": "path", "data": {"points": "nope"}},
+            {"type": "path", "data": {"points": [{"x": "a", "y": 1}]}},
+            "not a dict",
+        ):
+            self.assertIs(encode_action(action), action)
+        self.assertEqual(stroke_points({"points": [{"x": 1, "y": 2}, {"x": True, "y": 0}]}), [(1, 2)])
+
+    def test_rejects_non_finite_and_out_of_range_strokes(self):
+        for data in (
+            {"points": [{"x": 0, "y": 0}, {"x": float("inf"), "y": 1}]},
+            {"points": [{"x": float("nan"), "y": 0}]},
+            {"points": [{"x": 10 ** 400, "y": 0}]},
+            {"points": [{"x": 0, "y": 0}], "lineWidth": float("inf")},
+            {"pts": [0, 0, "1", 2], "q": 0.1},
+            {"pts": [0, 0, True, 2], "q": 0.1},
+            {"pts": [0, 0, 10 ** 400, 0], "q": 0.1},
+            {"pts": [0, 0, 1, 1], "q": float("nan")},
+            {"pts": [0, 0, 1, 1], "q": 0},
+            {"pts": "0,0", "q": 0.1},
+            {"q": 0.1},
+        ):
+            with self.assertRaises(InvalidStroke, msg=data):
+                encode_action({"type": "path", "data": data})
+
+    def test_client_pts_are_validated_or_replaced(self):
+        encoded = stroke([{"x": 0, "y": 0}, {"x": 5, "y": 5}])
+        self.assertIs(encode_action(encoded), encoded)
+        mixed = encode_action({"type": "path", "data": {"points": [{"x": 1, "y": 1}], "pts": ["x"], "q": "y"}})
+        self.assertEqual(mixed["data"]["pts"], [10, 10])
+        self.assertEqual(mixed["data"]["q"], 0.1)
+
+    def test_stored_bad_strokes_decode_to_nothing(self):
+        for data in ({"pts": [0, "1"], "q": 0.1}, {"pts": [0, 0], "q": float("inf")}, {"pts": [10 ** 400, 0], "q": 0.1}):
+            self.assertEqual(stroke_points(data), [])
+            self.assertIsNone(action_bbox({"type": "path", "data": data}))
+        self.assertEqual(stroke_points({"points": [{"x": float("nan"), "y": 0}, {"x": 1, "y": 2}]}), [(1, 2)])
+
+
+class UndoRedoTests(SimpleTestCase):
+    def setUp(self):
+        self.state = BoardState("1")
+
+    def draw(self, user, id):
+        action = dict(stroke([{"x": 0, "y": 0}, {"x": 5, "y": 5}]), id=id, user=user)
+        self.assertTrue(self.state.resolve(action))
+        self.state.apply(action)
+        return action
+
+    def submit(self, action):
+        if not self.state.resolve(action):
+            return False
+        self.state.apply(action)
+        return True
+
+    def ids(self):
+        return [a["id"] for a in self.state.snapshot()]
+
+    def test_undo_by_id_only_once_and_only_own(self):
+        self.draw(1, "a")
+        self.draw(2, "b")
+        self.assertFalse(self.submit({"type": "undo", "id": "a", "user": 2}))
+        self.assertTrue(self.submit({"type": "undo", "id": "a", "user": 1}))
+        # 两个标签页同时撤销同一个图形：第二个被拒绝
+        self.assertFalse(self.submit({"type": "undo", "id": "a", "user": 1}))
+        self.assertFalse(self.submit({"type": "undo", "id": "missing", "user": 1}))
+        self.assertEqual(self.ids(), ["b"])
+
+    def test_undo_without_id_targets_own_last_drawing(self):
+        self.draw(1, "a")
+        self.draw(2, "b")
+        undo = {"type": "undo", "user": 1}
+        self.assertTrue(self.submit(undo))
+        self.assertEqual(undo["id"], "a")
+        self.assertFalse(self.submit({"type": "undo", "user": 1}))
+
+    def test_redo_restores_once_and_only_own(self):
+        original = self.draw(1, "a")
+        self.submit({"type": "undo", "id": "a", "user": 1})
+        self.assertFalse(self.submit({"type": "redo", "action": original, "user": 2}))
+        self.assertTrue(self.submit({"type": "redo", "action": original, "user": 1}))
+        self.assertFalse(self.submit({"type": "redo", "action": original, "user": 1}))
+        self.assertFalse(self.submit({"type": "redo", "action": {"type": "clear"}, "user": 1}))
+        self.assertEqual(self.ids(), ["a"])
+
+    def test_clear_drops_history(self):
+        self.draw(1, "a")
+        self.submit({"type": "clear", "user": 1})
+        self.assertEqual(self.ids(), [])
+        self.assertFalse(self.submit({"type": "undo", "id": "a", "user": 1}))
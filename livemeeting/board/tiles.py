@@ -0,0 +1,326 @@
+# board/tiles.py
+#
+# board 缩略图和栅格瓦片：
+#   - 渲染结果存成文件 <BOARD_RENDER_DIR>/<board>/<key>.png（第一行是渲染时的 board seq，后面是 PNG），
+#     同一台机器上的所有 worker 共用，一个 worker 渲染过的其他 worker 直接读
+#   - 每个结果记录渲染时的 board seq（version），页面用 ?v=<version> 引用，命中时可以长期缓存
+#   - 渲染只在后台进行：视图（async）没有可用结果时安排渲染，立即返回 202 + 占位图，客户端稍后重试。
+#     操作列表在事件循环线程里复制（和 consumer 修改状态在同一个线程），栅格化在线程池里跑
+#   - 新操作到达时只作废（删除）与它的包围盒相交的瓦片和缩略图；
+#     作废掉的条目由后台任务延迟 BOARD_RENDER_DELAY 秒后重新渲染
+#   - 每个 board 目录里有哪些文件记在进程内（第一次写入或作废时在线程池里列一次目录），
+#     作废时在内存里挑出受影响的 key，删除文件交给线程池，事件循环线程上不做磁盘 IO；
+#     删除完成前 get 就把这些 key 当作没有
+#   - /board/<id>/tiles/...、thumbnail.png 由前端路由固定到该 board 的 worker（livemeeting/router.py），
+#     作废和渲染都在持有内存状态的进程里，generation 检查在进程内就够了
+#   - 每个 board 最多保留 BOARD_RENDER_MAX_FILES 个文件，超过时删掉最早写入的
+# 瓦片坐标：zoom 级别 z 下画布缩放为 2**z，瓦片 (x, y) 覆盖画布上
+#   [x, y, x + 1, y + 1] * TILE_SIZE / 2**z
+
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from livemeeting.metrics import database_sync_to_async
+
+from .compaction import bbox_overlap
+from .models import BoardAction, BoardSnapshot
+from .render import WHITE, content_bbox, render_actions
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = getattr(settings, "BOARD_TILE_SIZE", 256)
+THUMBNAIL_SIZE = getattr(settings, "BOARD_THUMBNAIL_SIZE", (320, 200))
+# 渲染结果目录（所有 worker 共用）
+RENDER_DIR = getattr(settings, "BOARD_RENDER_DIR", os.path.join(settings.BASE_DIR, "board_renders"))
+# 每个 board 最多保留多少个渲染文件
+RENDER_MAX_FILES = getattr(settings, "BOARD_RENDER_MAX_FILES", 512)
+# 作废后多久在后台重新渲染（秒），期间的新操作合并成一次渲染
+RENDER_DELAY = getattr(settings, "BOARD_RENDER_DELAY", 5.0)
+
+MIN_ZOOM = -4
+MAX_ZOOM = 3
+THUMBNAIL = "thumb"
+# 还没渲染好时返回的占位图（1×1 透明）
+PLACEHOLDER_PNG = render_actions([], (0, 0, 1, 1), 1, 1)
+
+
+def tile_rect(zoom, x, y):
+    span = TILE_SIZE / 2 ** zoom
+    return (x * span, y * span, (x + 1) * span, (y + 1) * span)
+
+
+def render_tile(actions, zoom, x, y):
+    return render_actions(actions, tile_rect(zoom, x, y), TILE_SIZE, TILE_SIZE)
+
+
+def render_thumbnail(actions):
+    width, height = THUMBNAIL_SIZE
+    bbox = content_bbox(actions)
+    if bbox is None:
+        return render_actions([], (0, 0, width, height), width, height, WHITE)
+    # 按缩略图的宽高比扩展包围盒，四周留 5% 边距
+    x0, y0, x1, y1 = bbox
+    w, h = max(x1 - x0, 1), max(y1 - y0, 1)
+    if w / h < width / height:
+        w = h * width / height
+    else:
+        h = w * height / width
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    w, h = w * 1.1, h * 1.1
+    rect = (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+    return render_actions(actions, rect, width, height, WHITE)
+
+
+def render_key(actions, key):
+    if key == THUMBNAIL:
+        return render_thumbnail(actions)
+    return render_tile(actions, *key)
+
+
+def key_name(key):
+    return THUMBNAIL if key == THUMBNAIL else "{}_{}_{}".format(*key)
+
+
+def parse_key_name(name):
+    """key_name 的逆操作，不认识的文件名返回 None"""
+    if name == THUMBNAIL:
+        return THUMBNAIL
+    try:
+        zoom, x, y = (int(part) for part in name.split("_"))
+    except ValueError:
+        return None
+    return zoom, x, y
+
+
+class RenderCache:
+    """(board, key) → (version, png)，存在共享目录里；作废次数、已有 / 待渲染的 key 记在进程内。
+    get / put 会读写文件，可以在线程池里调用；invalidate / request 只在事件循环线程里调用"""
+
+    def __init__(self, root=None):
+        self.root = str(root or RENDER_DIR)
+        self._generations = defaultdict(int)   # 每次作废 +1，渲染期间被作废的结果不写回
+        self._keys = {}                        # 目录里已有的 key，还没列过目录的 board 没有条目
+        self._unlinking = defaultdict(set)     # 已作废、文件还在等线程池删除的 key
+        self._stale = defaultdict(set)         # 被作废、等待后台重新渲染的 key
+        self._rendering = set()                # 视图请求触发、正在渲染的 (board, key)
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def _path(self, board_id, key):
+        return os.path.join(self.root, str(board_id), key_name(key) + ".png")
+
+    def get(self, board_id, key):
+        board_id = str(board_id)
+        with self._lock:
+            if key in self._unlinking.get(board_id, ()):
+                return None
+        try:
+            with open(self._path(board_id, key), "rb") as f:
+                return int(f.readline()), f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._keys.get(board_id, set()).discard(key)
+            return None
+        except ValueError:
+            return None
+
+    def generation(self, board_id):
+        with self._lock:
+            return self._generations[str(board_id)]
+
+    def put(self, board_id, key, version, png, generation=None):
+        """写入共享目录；渲染期间 board 又被作废过时放弃并返回 False"""
+        board_id = str(board_id)
+        if generation is not None and generation != self.generation(board_id):
+            return False
+        path = self._path(board_id, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(b"%d\n" % version)
+            f.write(png)
+        os.replace(temp, path)
+        # 写入和作废之间没有锁：写完再检查一次，这期间被作废过就删掉刚写的文件
+        if generation is not None and generation != self.generation(board_id):
+            _unlink(path)
+            return False
+        with self._lock:
+            self._unlinking[board_id].discard(key)
+            if board_id in self._keys:
+                self._keys[board_id].add(key)
+        self._prune(board_id)
+        return True
+
+    def _list(self, board_id):
+        """列目录，返回其中的 key 并记下来（在线程池里调用）"""
+        try:
+            names = os.listdir(os.path.join(self.root, board_id))
+        except FileNotFoundError:
+            names = []
+        keys = {parse_key_name(name[:-len(".png")]) for name in names if name.endswith(".png")}
+        keys.discard(None)
+        with self._lock:
+            self._keys.setdefault(board_id, set()).update(keys)
+        return keys
+
+    def _prune(self, board_id):
+        keys = self._list(board_id)
+        if len(keys) <= RENDER_MAX_FILES:
+            return
+        mtimes = {}
+        for key in keys:
+            try:
+                mtimes[key] = os.stat(self._path(board_id, key)).st_mtime
+            except FileNotFoundError:
+                pass
+        pruned = sorted(mtimes, key=mtimes.get)[:len(mtimes) - RENDER_MAX_FILES * 9 // 10]
+        with self._lock:
+            self._keys[board_id].difference_update(pruned)
+        for key in pruned:
+            _unlink(self._path(board_id, key))
+
+    def invalidate(self, board_id, boxes):
+        """作废与 boxes 相交的条目；boxes 为 None 时作废整个 board，为空时什么都不做"""
+        if boxes is not None and not boxes:
+            return
+        board_id = str(board_id)
+        with self._lock:
+            self._generations[board_id] += 1
+            listed = board_id in self._keys
+        if listed:
+            self._drop(board_id, boxes)
+        else:
+            asyncio.ensure_future(self._drop_unlisted(board_id, boxes))
+
+    def _drop(self, board_id, boxes):
+        with self._lock:
+            keys = self._keys[board_id]
+            stale = {key for key in keys if _damaged(key, boxes)}
+            keys -= stale
+            self._unlinking[board_id] |= stale
+            self._stale[board_id] |= stale
+        if stale:
+            asyncio.get_running_loop().run_in_executor(None, self._unlink_keys, board_id, stale)
+            self._schedule(board_id)
+
+    async def _drop_unlisted(self, board_id, boxes):
+        """本进程还没列过这个 board 的目录：先在线程池里列出来"""
+        await asyncio.get_running_loop().run_in_executor(None, self._list, board_id)
+        self._drop(board_id, boxes)
+
+    def _unlink_keys(self, board_id, keys):
+        for key in keys:
+            _unlink(self._path(board_id, key))
+        with self._lock:
+            self._unlinking[board_id] -= keys
+
+    def request(self, board_id, key):
+        """视图没有可用结果时调用：马上在后台渲染（同一个 key 正在渲染时不重复安排）"""
+        board_id = str(board_id)
+        if (board_id, key) in self._rendering:
+            return
+        self._rendering.add((board_id, key))
+        asyncio.ensure_future(self._render_requested(board_id, key))
+
+    async def _render_requested(self, board_id, key):
+        try:
+            await self._render(board_id, [key])
+        except Exception as exc:
+            logger.warning("board %s 渲染 %s 失败: %s", board_id, key, exc)
+        finally:
+            self._rendering.discard((board_id, key))
+
+    def _schedule(self, board_id):
+        task = self._tasks.get(board_id)
+        if task is None or task.done():
+            self._tasks[board_id] = asyncio.ensure_future(self._rerender(board_id))
+
+    async def _rerender(self, board_id):
+        while True:
+            await asyncio.sleep(RENDER_DELAY)
+            with self._lock:
+                keys = self._stale.pop(board_id, set())
+            if not keys:
+                return
+            try:
+                await self._render(board_id, keys)
+            except Exception as exc:
+                logger.warning("board %s 重新渲染失败: %s", board_id, exc)
+                return
+            with self._lock:
+                if not self._stale.get(board_id):
+                    return
+
+    async def _render(self, board_id, keys):
+        """用当前状态的副本渲染 keys 并写入；写入前被作废的 key 放回待渲染集合"""
+        loop = asyncio.get_running_loop()
+        generation = self.generation(board_id)
+        version, actions = await snapshot_actions(board_id)
+        for key in keys:
+            try:
+                png = await loop.run_in_executor(None, render_key, actions, key)
+            except Exception as exc:
+                logger.warning("board %s 渲染 %s 失败: %s", board_id, key, exc)
+                continue
+            if not await loop.run_in_executor(None, self.put, board_id, key, version, png, generation):
+                with self._lock:
+                    self._stale[board_id].add(key)
+                self._schedule(board_id)
+
+
+def _damaged(key, boxes):
+    return boxes is None or key == THUMBNAIL or any(bbox_overlap(tile_rect(*key), box) for box in boxes)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+async def snapshot_actions(board_id):
+    """返回 (seq, 操作列表)：本进程已加载的 board 在事件循环线程里复制内存状态
+    （已折叠的操作不会再被修改，浅复制列表即可），否则在数据库线程里从快照 + 日志折叠"""
+    from .state import board_states
+
+    state = board_states.get(board_id)
+    if state is not None:
+        return state.seq, state.snapshot()
+    return await database_sync_to_async(_load_actions)(board_id)
+
+
+def _load_actions(board_id):
+    from .state import BoardState, load_board_rows
+
+    base_seq, base, _, entries = load_board_rows(board_id)
+    state = BoardState(board_id, entries, base=base, base_seq=base_seq)
+    return state.seq, state.snapshot()
+
+
+def render_versions(boards):
+    """给每个 board 加上 render_version（当前 seq），用于缩略图 URL 的 ?v="""
+    from .state import board_states
+
+    last_action = BoardAction.objects.filter(board=OuterRef("pk")).order_by("-seq").values("seq")[:1]
+    last_snapshot = BoardSnapshot.objects.filter(board=OuterRef("pk")).order_by("-seq").values("seq")[:1]
+    boards = list(boards.annotate(render_version=Greatest(
+        Coalesce(Subquery(last_action), Value(0)),
+        Coalesce(Subquery(last_snapshot), Value(0)),
+    )))
+    for board in boards:
+        state = board_states.get(board.id)
+        if state is not None:
+            board.render_version = state.seq
+    return boards
+
+
+render_cache = RenderCache()
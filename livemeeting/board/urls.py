@@ -1,11 +1,24 @@
 # board/urls.py
 
-from django.urls import path
+from django.urls import path, register_converter
 from . import views
 
 from django.urls import path
 from . import views
 
+
+class SignedIntConverter:
+    regex = "-?[0-9]+"
+
+    def to_python(self, value):
+        return int(value)
+
+    def to_url(self, value):
+        return str(value)
+
+
+register_converter(SignedIntConverter, "signed")
+
 urlpatterns = [
     path("", views.board_room, name="board_room"),  # 默认进入自己的 Board
     path("<int:board_id>/", views.board_room, name="board_room_with_id"),  # 根据 board_id 访问指定 Board
@@ -14,4 +27,6 @@ urlpatterns = [
     path('user_list/', views.user_list, name='user_list'),
     path('check_permissions/<int:board_id>/', views.check_permissions, name='check_permissions'),
     path("upload_temp_video/", views.upload_temp_video, name="upload_temp_video"),
+    path("<int:board_id>/thumbnail.png", views.board_thumbnail, name="board_thumbnail"),
+    path("<int:board_id>/tiles/<signed:zoom>/<signed:x>/<signed:y>.png", views.board_tile, name="board_tile"),
 ]
@@ -1,14 +1,19 @@
 # board/views.py
+import logging
 from django.shortcuts import render, get_object_or_404, redirect
 from .models import Board
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_GET
 from django.contrib import messages
 from django.contrib.auth.models import User
+from .tiles import MAX_ZOOM, MIN_ZOOM, PLACEHOLDER_PNG, THUMBNAIL, render_cache, render_versions
+
+logger = logging.getLogger(__name__)
 
 # 显示所有可访问的 Boards
 def boards_list(request):
-    boards = Board.objects.all()
+    boards = render_versions(Board.objects.all())
     return render(request, "board/boards_list.html", {"boards": boards})
 
 from django.shortcuts import render, get_object_or_404
@@ -22,17 +27,17 @@ from board.models import Board, BoardUserPermission
 @login_required
 def check_permissions(request, board_id):
     user = request.user
-    print(f"Checking permissions for user: {user.username} on board: {board_id}")
+    logger.debug("Checking permissions for user: %s on board: %s", user.username, board_id)
     
     # 直接通过 BoardUser 表查询用户权限
     try:
         board_user = BoardUser.objects.get(board_id=board_id, user=user)
-        print(f"Permission found: is_authorized={board_user.is_authorized}")
+        logger.debug("Permission found: is_authorized=%s", board_user.is_authorized)
         return JsonResponse({
             'can_edit': board_user.is_authorized  # 直接返回 is_authorized 字段
         })
     except BoardUser.DoesNotExist:
-        print(f"No permission found for user: {user.username} on board: {board_id}")
+        logger.debug("No permission found for user: %s on board: %s", user.username, board_id)
         return JsonResponse({
             'can_edit': False
         })
@@ -41,7 +46,7 @@ def check_permissions(request, board_id):
 @login_required
 def board_room(request, board_id=None):
     user = request.user
-    boards = Board.objects.all()
+    boards = render_versions(Board.objects.all())
 
     # 创建一个包含有权限进入的 board 的 ID 列表
     boards_with_access = [board.id for board in boards if board.users.filter(id=user.id).exists()]
@@ -59,7 +64,8 @@ def board_room(request, board_id=None):
         board.users.add(user)
         board.save()
 
-    print(f"Users for board {board.name}: {[user.username for user in board.users.all()]}")
+    if logger.isEnabledFor(logging.DEBUG):   # 列出用户要多查一次库，只在调试时做
+        logger.debug("Users for board %s: %s", board.name, [u.username for u in board.users.all()])
 
     # 用户是否有操作权限
     user_has_permission = BoardUser.objects.filter(
@@ -162,4 +168,44 @@ def upload_temp_video(request):
 
     video_url = f"{settings.MEDIA_URL}temp_videos/{filename}"
     return JsonResponse({"video_url": video_url})
- 
\ No newline at end of file
+ 
+
+# ================= 缩略图 / 瓦片 =================
+# URL 带 ?v=<board seq>，与当前渲染版本一致时允许浏览器永久缓存，否则按 ETag 协商。
+# 视图是 async 的，在事件循环线程里读 board 状态；还没渲染好时在后台渲染，先返回 202 + 占位图
+@login_required
+@require_GET
+async def board_thumbnail(request, board_id):
+    return await _render_response(request, board_id, THUMBNAIL)
+
+
+@login_required
+@require_GET
+async def board_tile(request, board_id, zoom, x, y):
+    if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+        raise Http404("Unsupported zoom level")
+    return await _render_response(request, board_id, (zoom, x, y))
+
+
+async def _render_response(request, board_id, key):
+    entry = render_cache.get(board_id, key)
+    if entry is None:
+        if not await Board.objects.filter(pk=board_id).aexists():
+            raise Http404("Board not found")
+        render_cache.request(board_id, key)
+        response = HttpResponse(PLACEHOLDER_PNG, content_type="image/png", status=202)
+        response["Retry-After"] = "1"
+        response["Cache-Control"] = "no-store"
+        return response
+    version, png = entry
+    etag = f'"{board_id}-{version}"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(png, content_type="image/png")
+    response["ETag"] = etag
+    if request.GET.get("v") == str(version):
+        response["Cache-Control"] = "private, max-age=31536000, immutable"
+    else:
+        response["Cache-Control"] = "private, no-cache"
+    return response
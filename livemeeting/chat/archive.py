@@ -0,0 +1,255 @@
+# chat/archive.py
+#
+# 聊天消息的冷存储（归档层）：
+#   - manage.py archive_chat 把超过 CHAT_ARCHIVE_AFTER_DAYS 天的消息从 Message 表移到按聊天室分目录的段文件里，
+#     热表只保留最近的消息
+#   - 段文件只追加、写完不再修改：<CHAT_ARCHIVE_DIR>/<room_id>/<序号>.jsonl.gz，
+#     每 ARCHIVE_BLOCK_ROWS 条消息压成一个独立的 gzip member（JSON lines），
+#     旁边的 <序号>.idx.json 记录每块的字节偏移、长度和首尾 (timestamp, id)，读一页只解压用到的块，
+#     以及整个段的 id 范围（"ids": [最小, 最大]）
+#   - 段内按 (timestamp, id) 有序；正常情况下每次归档的都比已有的段新、比热表里剩下的旧，
+#     历史分页（chat/history.py）先查热表，不够一页再接着从段文件往前读。
+#     补录了旧时间的消息时段之间、段和热表之间的范围会重叠，读取时按 key 归并，顺序仍然正确
+#   - 先写段文件和索引（索引最后写，写完才算这个段存在），再从热表删除；
+#     中途退出时下次运行按最新段索引里的 id 范围和最后一条的 key 删掉热表里已经归档的消息，不用解压段文件
+#   - 归档的消息不再出现在全文搜索里（FTS 索引随热表删除同步删除）
+
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+
+# 段文件根目录
+ARCHIVE_DIR = getattr(settings, "CHAT_ARCHIVE_DIR", os.path.join(settings.BASE_DIR, "chat_archive"))
+# 每块多少条消息（每块单独压缩，是读取的最小单位）
+ARCHIVE_BLOCK_ROWS = getattr(settings, "CHAT_ARCHIVE_BLOCK_ROWS", 256)
+# 每个段最多多少条消息
+ARCHIVE_SEGMENT_ROWS = getattr(settings, "CHAT_ARCHIVE_SEGMENT_ROWS", 50000)
+# 进程内缓存多少个解压后的块
+ARCHIVE_BLOCK_CACHE = 64
+
+
+def record_key(record):
+    return datetime.fromisoformat(record["timestamp"]), record["id"]
+
+
+def message_record(msg):
+    """Message → 段文件里的一行"""
+    return {
+        "id": msg.id,
+        "uid": msg.uid.hex,
+        "user": msg.user.username if msg.user else None,
+        "content": msg.content,
+        "timestamp": msg.timestamp.isoformat(),
+    }
+
+
+class Segment:
+    """一个段文件和它的块索引"""
+
+    def __init__(self, path, index):
+        self.path = path
+        self.blocks = index["blocks"]   # [{"offset", "length", "count", "first": [iso, id], "last": [iso, id]}]
+        self.ids = index.get("ids")     # [最小 id, 最大 id]，早期的段没有
+        self.first = _key(self.blocks[0]["first"])
+        self.last = _key(self.blocks[-1]["last"])
+
+    def block_range(self, i):
+        block = self.blocks[i]
+        return _key(block["first"]), _key(block["last"])
+
+    def read_block(self, i):
+        return _block_cache.get(self.path, self.blocks[i])
+
+    def iter_before(self, key):
+        """key 之前（不含）的消息，从新到旧，按需解压"""
+        for i in range(len(self.blocks) - 1, -1, -1):
+            first, _ = self.block_range(i)
+            if key is not None and first >= key:
+                continue
+            for record in reversed(self.read_block(i)):
+                if key is None or record_key(record) < key:
+                    yield record
+
+    def iter_after(self, key):
+        """key 之后（不含）的消息，从旧到新，按需解压"""
+        for i in range(len(self.blocks)):
+            _, last = self.block_range(i)
+            if last <= key:
+                continue
+            for record in self.read_block(i):
+                if record_key(record) > key:
+                    yield record
+
+
+class RoomArchive:
+    """一个聊天室的所有段，按写入顺序（文件序号）"""
+
+    def __init__(self, room_id, root=None):
+        self.room_id = room_id
+        self.directory = os.path.join(root or ARCHIVE_DIR, str(room_id))
+        self.segments = _load_segments(self.directory)
+
+    def __bool__(self):
+        return bool(self.segments)
+
+    @property
+    def first(self):
+        """归档里最早一条的 key，没有归档时为 None"""
+        return min((segment.first for segment in self.segments), default=None)
+
+    @property
+    def last(self):
+        """归档里最新一条的 key，没有归档时为 None"""
+        return max((segment.last for segment in self.segments), default=None)
+
+    def before(self, key=None, count=50):
+        """key 之前（不含）最新的 count 条，从新到旧"""
+        segments = sorted((s for s in self.segments if key is None or s.first < key), key=lambda s: s.last)
+        return _merge(segments, lambda segment: segment.iter_before(key), count, newest=True)
+
+    def after(self, key, count=50):
+        """key 之后（不含）最旧的 count 条，从旧到新"""
+        segments = sorted((s for s in self.segments if s.last > key), key=lambda s: s.first, reverse=True)
+        return _merge(segments, lambda segment: segment.iter_after(key), count, newest=False)
+
+    def latest_range(self):
+        """最后写入的段的 (最小 id, 最大 id, 最后一条的 key)，没有归档时为 None（归档中途退出后的恢复用）
+
+        段是热表里按 (timestamp, id) 最旧的一批，所以热表里 id 在这个范围内、key 不超过最后一条的就是这个段里的消息。
+        """
+        if not self.segments:
+            return None
+        segment = self.segments[-1]
+        if segment.ids is None:
+            # 没有记录 id 范围的旧段只能解压一遍
+            ids = [record["id"] for i in range(len(segment.blocks)) for record in segment.read_block(i)]
+            return min(ids), max(ids), segment.last
+        return segment.ids[0], segment.ids[1], segment.last
+
+    def append(self, records):
+        """写一个新段（records 按 (timestamp, id) 从旧到新），返回段文件路径"""
+        os.makedirs(self.directory, exist_ok=True)
+        number = len(self.segments) + 1
+        path = os.path.join(self.directory, f"{number:08d}.jsonl.gz")
+        blocks = []
+        ids = [min(r["id"] for r in records), max(r["id"] for r in records)]
+        with open(path + ".tmp", "wb") as f:
+            for start in range(0, len(records), ARCHIVE_BLOCK_ROWS):
+                chunk = records[start:start + ARCHIVE_BLOCK_ROWS]
+                data = gzip.compress("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk).encode())
+                blocks.append({
+                    "offset": f.tell(),
+                    "length": len(data),
+                    "count": len(chunk),
+                    "first": [chunk[0]["timestamp"], chunk[0]["id"]],
+                    "last": [chunk[-1]["timestamp"], chunk[-1]["id"]],
+                })
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        index_path = path[:-len(".jsonl.gz")] + ".idx.json"
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"room": self.room_id, "ids": ids, "blocks": blocks}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(index_path + ".tmp", index_path)
+        self.segments.append(Segment(path, {"ids": ids, "blocks": blocks}))
+        _segment_cache.pop(self.directory, None)
+        return path
+
+
+def _merge(pending, iterate, count, newest):
+    """按 key 归并多个段的输出，取前 count 条
+
+    pending 按可能最先输出的顺序排在末尾（往前读时按 last 升序，往后读时按 first 降序）；
+    范围和当前输出不重叠的段不会被打开，通常同时只读一个段。
+    """
+    pick = max if newest else min
+    active = []   # [当前记录, 它的 key, 迭代器]
+    found = []
+    while len(found) < count:
+        # 还没打开的段里可能有比当前候选更靠前的消息时打开它
+        while pending:
+            bound = pending[-1].last if newest else pending[-1].first
+            if active:
+                head = pick(entry[1] for entry in active)
+                if (bound < head) if newest else (bound > head):
+                    break
+            iterator = iterate(pending.pop())
+            record = next(iterator, None)
+            if record is not None:
+                active.append([record, record_key(record), iterator])
+        if not active:
+            break
+        entry = pick(active, key=lambda entry: entry[1])
+        found.append(entry[0])
+        record = next(entry[2], None)
+        if record is None:
+            active.remove(entry)
+        else:
+            entry[0], entry[1] = record, record_key(record)
+    return found
+
+
+def _key(pair):
+    return datetime.fromisoformat(pair[0]), pair[1]
+
+
+def _load_segments(directory):
+    """读目录下所有有索引的段；目录没变（mtime 相同）时用缓存"""
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    with _segment_lock:
+        cached = _segment_cache.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return list(cached[1])
+    segments = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".idx.json"):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            index = json.load(f)
+        if index["blocks"]:
+            segments.append(Segment(os.path.join(directory, name[:-len(".idx.json")] + ".jsonl.gz"), index))
+    with _segment_lock:
+        _segment_cache[directory] = (mtime, segments)
+    return list(segments)
+
+
+class _BlockCache:
+    """解压后的块的 LRU 缓存（段文件只追加不修改，按 路径 + 偏移 缓存不会过期）"""
+
+    def __init__(self, size):
+        self.size = size
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, block):
+        key = (path, block["offset"])
+        with self._lock:
+            records = self._blocks.get(key)
+            if records is not None:
+                self._blocks.move_to_end(key)
+                return records
+        with open(path, "rb") as f:
+            f.seek(block["offset"])
+            data = gzip.decompress(f.read(block["length"]))
+        records = [json.loads(line) for line in data.decode().splitlines() if line]
+        with self._lock:
+            self._blocks[key] = records
+            while len(self._blocks) > self.size:
+                self._blocks.popitem(last=False)
+        return records
+
+
+_segment_cache = {}
+_segment_lock = threading.Lock()
+_block_cache = _BlockCache(ARCHIVE_BLOCK_CACHE)
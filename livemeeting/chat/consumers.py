@@ -1,43 +1,79 @@
 # chat/consumers.py
 
 import json
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.utils import timezone
+from livemeeting.metrics import active_sockets, database_sync_to_async, messages_in, messages_out
+from livemeeting.outbox import OutboxMixin
+from .history import history_page, parse_cursor
 from .models import ChatRoom, Message
+from .search import SearchUnavailable, search_messages
+from .writer import chat_writer
 
-class ChatConsumer(AsyncWebsocketConsumer):
+logger = logging.getLogger(__name__)
+
+class ChatConsumer(OutboxMixin, AsyncWebsocketConsumer):
+    metrics_name = "chat"
 
     async def connect(self):
+        # 广播消息经有界队列发送（见 livemeeting/outbox.py）
+        self.open_outbox()
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.group_name = f"chat_{self.room_name}"
 
         # 加入组
         await self.channel_layer.group_add(self.group_name, self.channel_name)
+        # 房间只在连接时查一次，之后收发消息都用缓存的 id
+        self.room_id = await self.get_room_id()
         await self.accept()
+        active_sockets.inc(consumer="chat")
+        self.counted = True
 
-        # 发送历史消息
-        messages = await self.get_history()
-        for msg in messages:
-            await self.send(text_data=json.dumps(msg))
+        # 历史消息：只取最近一页，合成一帧发送；更早的由客户端用 load_older 按需翻页
+        await self.send_history()
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        self.close_outbox()
+        if getattr(self, 'counted', False):
+            active_sockets.dec(consumer="chat")
 
     async def receive(self, text_data):
         data = json.loads(text_data)
+        msg_type = data.get('type')
+        messages_in.inc(consumer="chat", type=msg_type if msg_type in ('ack', 'load_older', 'search') else "message")
+        if msg_type == 'ack':
+            self.outbox.ack(data.get('n'))
+            return
+        if msg_type == 'load_older':
+            cursor = parse_cursor(data.get('before'))
+            if cursor is not None:
+                await self.send_history(cursor)
+            return
+        if msg_type == 'search':
+            await self.send_search(data)
+            return
         content = data.get('message')
         if not content:
             return
 
         user = self.scope['user']
-        # 保存消息到数据库
-        message_obj = await self.save_message(user, content)
+        # 时间和 id 由服务器分配，先广播，写库交给本进程的批量 writer（chat/writer.py）
+        message_obj = Message(
+            room_id=self.room_id,
+            user_id=user.pk if user.is_authenticated else None,
+            content=content,
+            timestamp=timezone.now(),
+        )
+        chat_writer.put(message_obj)
 
         # 广播消息给组内所有人
         await self.channel_layer.group_send(
             self.group_name,
             {
                 "type": "chat.message",
+                "id": message_obj.uid.hex,
                 "user": user.username if user.is_authenticated else "guest",
                 "message": content,
                 "timestamp": message_obj.timestamp.strftime("%H:%M")
@@ -46,32 +82,68 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def chat_message(self, event):
         # 发送给当前客户端
-        await self.send(text_data=json.dumps({
+        self.enqueue({
+            "id": event.get("id"),
             "user": event["user"],
             "message": event["message"],
             "timestamp": event["timestamp"]
-        }))
+        })
 
     @database_sync_to_async
-    def save_message(self, user, content):
+    def get_room_id(self):
         room, _ = ChatRoom.objects.get_or_create(name=self.room_name)
-        return Message.objects.create(
-            room=room,
-            user=user if user.is_authenticated else None,
-            content=content
-        )
+        return room.id
+
+    async def send_history(self, before=None):
+        """发送一页历史消息：{"type": "history", "messages": [...], "before": 游标, "older": 是否是翻页}
+
+        messages 按时间从早到晚；before 是这一页最早一条的游标，没有更早的消息时为 null。
+        """
+        if before is None and chat_writer.has_unsaved(self.room_id):
+            # 本进程刚收到、还没写库（或者正在写）的消息也要出现在第一页里
+            try:
+                await chat_writer.flush()
+            except Exception as exc:
+                logger.warning("聊天室 %s 加载历史前写入消息失败: %s", self.room_name, exc)
+        messages, cursor = await self.get_history(before)
+        await self.send(text_data=json.dumps({
+            "type": "history",
+            "messages": messages,
+            "before": cursor,
+            "older": before is not None,
+        }))
+        messages_out.inc(consumer="chat", type="history")
+
+    async def send_search(self, data):
+        """{"type": "search", "q": 搜索词, "page": 页码, "all": 是否搜所有聊天室} →
+        {"type": "search_results", "q", "page", "results": [...], "has_more", "truncated"}
+
+        页码不是整数时按第 1 页，超出范围（见 chat/search.py 的 max_page）返回空结果
+        """
+        page = data.get('page', 1)
+        if not isinstance(page, int) or isinstance(page, bool):
+            page = 1
+        query = str(data.get('q') or '')
+        try:
+            results, has_more, truncated = await self.search(query, None if data.get('all') else self.room_id, page)
+        except SearchUnavailable:
+            results, has_more, truncated = [], False, False
+        await self.send(text_data=json.dumps({
+            "type": "search_results",
+            "q": query,
+            "page": page,
+            "results": results,
+            "has_more": has_more,
+            "truncated": truncated,
+        }))
+        messages_out.inc(consumer="chat", type="search_results")
 
     @database_sync_to_async
-    def get_history(self):
-        room, _ = ChatRoom.objects.get_or_create(name=self.room_name)
-        # 使用 select_related 避免 lazy load 导致 async 报错
-        messages = room.messages.select_related('user').order_by('timestamp').all()
-        # 转成 dict，方便 async context 发送
-        return [
-            {
-                "user": msg.user.username if msg.user else "guest",
-                "message": msg.content,
-                "timestamp": msg.timestamp.strftime("%H:%M")
-            }
-            for msg in messages
-        ]
+    def search(self, query, room_id, page):
+        return search_messages(query, room_id=room_id, page=page)
+
+    @database_sync_to_async
+    def get_history(self, before=None):
+        """按 (timestamp, id) 倒序取 before 之前的一页，返回 (消息列表, 下一页游标)"""
+        messages, cursor, _ = history_page(self.room_id, before=before)
+        return messages, cursor
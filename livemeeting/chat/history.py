@@ -0,0 +1,113 @@
+# chat/history.py
+#
+# 聊天历史的 keyset 分页，WebSocket（load_older）和 HTTP（/chat/<id>/history）共用：
+#   - 按 (timestamp, id) 排序，游标是某条消息的 '<ISO 时间>|<id>'，客户端原样带回
+#   - before=游标 取这条之前的一页，after=游标 取这条之后的一页，都不带时取最新一页
+#   - 查询走 Message 上 (room, timestamp, id) 的联合索引，每页耗时和房间里的消息总数无关
+#   - 热表里不够一页时接着从归档段文件（chat/archive.py）里读；两边范围重叠时按 key 归并
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+from .archive import RoomArchive, record_key
+from .models import Message
+
+# 默认每页多少条
+CHAT_HISTORY_PAGE = getattr(settings, "CHAT_HISTORY_PAGE", 50)
+# HTTP 接口 ?limit= 的上限
+CHAT_HISTORY_MAX_PAGE = getattr(settings, "CHAT_HISTORY_MAX_PAGE", 200)
+
+
+def format_cursor(key):
+    """翻页游标：'<ISO 时间>|<id>'，key 是 (timestamp, id)"""
+    timestamp, pk = key
+    return f"{timestamp.isoformat()}|{pk}"
+
+
+def parse_cursor(cursor):
+    """解析 format_cursor 生成的游标，格式不对返回 None"""
+    if not isinstance(cursor, str) or "|" not in cursor:
+        return None
+    timestamp, _, pk = cursor.rpartition("|")
+    try:
+        timestamp, pk = datetime.fromisoformat(timestamp), int(pk)
+    except ValueError:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=dt_timezone.utc)
+    return timestamp, pk
+
+
+def message_dict(msg):
+    return {
+        "id": msg.uid.hex,
+        "user": msg.user.username if msg.user else "guest",
+        "message": msg.content,
+        "timestamp": msg.timestamp.strftime("%H:%M"),
+    }
+
+
+def _hot_entry(msg):
+    return (msg.timestamp, msg.id), message_dict(msg)
+
+
+def _archived_entry(record):
+    key = record_key(record)
+    return key, {
+        "id": record["uid"],
+        "user": record["user"] or "guest",
+        "message": record["content"],
+        "timestamp": key[0].strftime("%H:%M"),
+    }
+
+
+def _entry_key(entry):
+    return entry[0]
+
+
+def history_page(room_id, before=None, after=None, limit=CHAT_HISTORY_PAGE):
+    """取一页消息，返回 (按时间从早到晚的消息列表, before 游标, after 游标)
+
+    before / after 是 parse_cursor 的结果。返回的 before 游标用来取更早的一页，
+    after 游标用来取更新的一页，对应方向没有消息时为 None。同步调用，async 里包一层 database_sync_to_async。
+    """
+    # 使用 select_related 避免逐条查用户
+    query = Message.objects.filter(room_id=room_id).select_related('user')
+    archive = RoomArchive(room_id)
+    if after is not None:
+        # 往后翻；多取一条判断后面还有没有
+        timestamp, pk = after
+        query = query.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+        page = [_hot_entry(msg) for msg in query.order_by('timestamp', 'id')[:limit + 1]]
+        if archive and after < archive.last:
+            page = sorted(page + [_archived_entry(r) for r in archive.after(after, limit + 1)], key=_entry_key)
+        has_newer = len(page) > limit
+        page = page[:limit]
+        # 这一页之前还有没有消息（after 指向的消息可能已经被删除，不能直接当作有）
+        has_older = False
+        if page:
+            timestamp, pk = page[0][0]
+            has_older = bool(archive and archive.first < page[0][0]) or Message.objects.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk), room_id=room_id,
+            ).exists()
+    else:
+        # 往前翻：先查热表，不够一页（或者归档里有比这一页更新的消息）时再从归档里读
+        if before is not None:
+            timestamp, pk = before
+            query = query.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        page = [_hot_entry(msg) for msg in query.order_by('-timestamp', '-id')[:limit + 1]]
+        if archive and (len(page) <= limit or page[-1][0] < archive.last):
+            archived = [_archived_entry(r) for r in archive.before(before, limit + 1)]
+            page = sorted(page + archived, key=_entry_key, reverse=True)
+        has_older, has_newer = len(page) > limit, before is not None
+        page = page[:limit]
+        page.reverse()
+    if not page:
+        return [], None, None
+    return (
+        [message for _, message in page],
+        format_cursor(page[0][0]) if has_older else None,
+        format_cursor(page[-1][0]) if has_newer else None,
+    )
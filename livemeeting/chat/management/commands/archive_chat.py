@@ -0,0 +1,83 @@
+# chat/management/commands/archive_chat.py
+#
+# python manage.py archive_chat --older-than 90
+#
+# 把超过保留期的聊天消息移到归档段文件（chat/archive.py），热表只留最近的消息。
+# 可以放进 cron 定期执行；历史分页会自动从热表接着读归档，客户端感觉不到区别。
+#   --room <id>   只归档某个聊天室
+#   --vacuum      归档后 VACUUM，把删掉的行占的空间还给文件系统（SQLite）
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from chat.archive import ARCHIVE_SEGMENT_ROWS, RoomArchive, message_record
+from chat.models import ChatRoom, Message
+
+# 默认保留多少天的消息在热表里
+ARCHIVE_AFTER_DAYS = getattr(settings, "CHAT_ARCHIVE_AFTER_DAYS", 90)
+# 从热表删除时每批多少条（SQLite 单条语句的参数个数有上限）
+DELETE_BATCH = 500
+
+
+class Command(BaseCommand):
+    help = "把超过保留期的聊天消息移到按聊天室分的压缩段文件里"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=float, default=ARCHIVE_AFTER_DAYS, help="归档多少天以前的消息")
+        parser.add_argument("--room", type=int, default=None, help="只归档这个聊天室（id）")
+        parser.add_argument("--vacuum", action="store_true", help="归档后 VACUUM 数据库（SQLite）")
+
+    def handle(self, *args, **options):
+        if options["older_than"] < 0:
+            raise CommandError("--older-than 不能是负数")
+        cutoff = timezone.now() - timedelta(days=options["older_than"])
+        rooms = ChatRoom.objects.all()
+        if options["room"] is not None:
+            rooms = rooms.filter(pk=options["room"])
+            if not rooms.exists():
+                raise CommandError(f"聊天室 {options['room']} 不存在")
+
+        total = 0
+        for room_id in rooms.values_list("id", flat=True):
+            moved = self.archive_room(room_id, cutoff)
+            if moved:
+                self.stdout.write(f"聊天室 {room_id}: 归档 {moved} 条")
+            total += moved
+        self.stdout.write(self.style.SUCCESS(f"共归档 {total} 条消息（{cutoff:%Y-%m-%d %H:%M} 之前）"))
+
+        if options["vacuum"] and total and connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+
+    def archive_room(self, room_id, cutoff):
+        archive = RoomArchive(room_id)
+        latest = archive.latest_range()
+        if latest is not None:
+            # 上次在写完段文件、删除热表之前退出：这些消息已经归档了，按段索引里的 id 范围直接删掉
+            low, high, (timestamp, pk) = latest
+            Message.objects.filter(room_id=room_id, id__gte=low, id__lte=high).filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lte=pk)
+            ).delete()
+
+        moved = 0
+        while True:
+            batch = list(
+                Message.objects.filter(room_id=room_id, timestamp__lt=cutoff)
+                .select_related("user")
+                .order_by("timestamp", "id")[:ARCHIVE_SEGMENT_ROWS]
+            )
+            if not batch:
+                return moved
+            archive.append([message_record(msg) for msg in batch])
+            self.delete(room_id, [msg.id for msg in batch])
+            moved += len(batch)
+
+    def delete(self, room_id, ids):
+        with transaction.atomic():
+            for start in range(0, len(ids), DELETE_BATCH):
+                Message.objects.filter(room_id=room_id, id__in=ids[start:start + DELETE_BATCH]).delete()
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import uuid
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_uids(apps, schema_editor):
+    """给已有消息补上 uid"""
+    Message = apps.get_model('chat', 'Message')
+    rows = []
+    for message in Message.objects.only('id').iterator():
+        message.uid = uuid.uuid4()
+        rows.append(message)
+    Message.objects.bulk_update(rows, ['uid'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_alter_message_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='uid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_uids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:20
+
+from django.db import migrations
+
+# chat_message 的 FTS5 全文索引（external content，只存倒排索引不存正文），由触发器保持同步。
+# trigram 分词：中文没有空格分词，按三字组索引才能搜到句子中间的词；代价是搜索词至少 3 个字符。
+# room 列是 'r<room_id>r' 形式的标记，按聊天室过滤也走索引，不用逐条回表（正文来自视图 chat_message_fts_source）。
+FORWARD = [
+    """CREATE VIEW chat_message_fts_source AS
+        SELECT id, content, 'r' || room_id || 'r' AS room FROM chat_message""",
+    """CREATE VIRTUAL TABLE chat_message_fts USING fts5(
+        content, room, content='chat_message_fts_source', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, content, room) VALUES (new.id, new.content, 'r' || new.room_id || 'r');
+    END""",
+    """CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content, room)
+        VALUES ('delete', old.id, old.content, 'r' || old.room_id || 'r');
+    END""",
+    """CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF content, room_id ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content, room)
+        VALUES ('delete', old.id, old.content, 'r' || old.room_id || 'r');
+        INSERT INTO chat_message_fts(rowid, content, room) VALUES (new.id, new.content, 'r' || new.room_id || 'r');
+    END""",
+    # 已有的消息建索引
+    "INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')",
+]
+
+BACKWARD = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TABLE IF EXISTS chat_message_fts",
+    "DROP VIEW IF EXISTS chat_message_fts_source",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # 只有 SQLite 有 FTS5；其他数据库上搜索接口返回 501（chat/search.py）
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_room_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+    ]
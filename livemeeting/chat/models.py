@@ -1,7 +1,10 @@
 #chat/models.py:
 
+import uuid
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class ChatRoom(models.Model):
     name = models.CharField(max_length=200, unique=True)
@@ -17,7 +20,15 @@ class Message(models.Model):
     room = models.ForeignKey(ChatRoom, related_name='messages', on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # 时间和 uid 在收到消息时由服务器分配（先广播，之后由 chat/writer.py 批量写入）
+    timestamp = models.DateTimeField(default=timezone.now)
+    uid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # 历史消息按 (timestamp, id) 做 keyset 分页（chat/history.py）
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_msg_room_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username if self.user else 'guest'}: {self.content[:20]}"
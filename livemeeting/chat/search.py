@@ -0,0 +1,127 @@
+# chat/search.py
+#
+# 聊天消息全文搜索（HTTP /chat/search 和聊天 WebSocket 的 search 命令共用）：
+#   - 倒排索引是 SQLite FTS5 表 chat_message_fts（trigram 分词），由 chat_message 上的触发器同步，
+#     见 chat/migrations/0005_message_search_index.py；批量写入（chat/writer.py）同样会触发
+#   - 搜索词按空白切开，每个词作为短语匹配，多个词之间是 AND；少于 3 个字符的词无法用 trigram 索引，忽略
+#   - 按聊天室过滤也在索引里完成（room 列），不用逐条回表
+#   - 排序分两步，翻页深浅不影响耗时：
+#     先按 rowid 倒序从索引取最近 CHAT_SEARCH_MAX_RESULTS 条命中（只读倒排表的开头），
+#     再只对 rowid 不小于其中最旧一条的命中用 FTS5 的 bm25 打分排序（room 列权重为 0，同分时新的在前）。
+#     bm25 算 IDF 时仍会数一遍每个词的全部命中，但不再逐条打分排序：30 万条命中的常见词约 40ms（原来 300~500ms）。
+#     能翻到的结果最多 CHAT_SEARCH_MAX_RESULTS 条，更早的命中不参与排序，返回里的 truncated 表示有没有被截掉；
+#     页码超出范围时直接返回空结果
+#   - 结果带高亮片段（HTML 已转义，命中部分包在 <mark> 里）
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+
+from .models import Message
+
+# 每页最多多少条结果
+CHAT_SEARCH_PAGE = getattr(settings, "CHAT_SEARCH_PAGE", 20)
+# 参与排序（能翻到）的最近命中数上限
+CHAT_SEARCH_MAX_RESULTS = getattr(settings, "CHAT_SEARCH_MAX_RESULTS", 1000)
+# trigram 分词能索引的最短搜索词
+MIN_TERM_LENGTH = 3
+# 片段长度（字符），命中位置前面保留的字符数
+SNIPPET_CHARS = 80
+SNIPPET_BEFORE = 20
+
+
+class SearchUnavailable(Exception):
+    """当前数据库没有全文索引（不是 SQLite）"""
+
+
+def search_terms(text):
+    """用户输入里能用来搜索的词"""
+    return [term for term in (text or "").split() if len(term) >= MIN_TERM_LENGTH]
+
+
+def build_query(terms, room_id=None):
+    """FTS5 查询：每个词加引号作为短语，输入里的 FTS5 语法字符（AND、*、: 等）都按普通文本处理"""
+    query = "content:(" + " ".join('"' + term.replace('"', '""') + '"' for term in terms) + ")"
+    if room_id is not None:
+        query += f' AND room:"r{int(room_id)}r"'
+    return query
+
+
+def max_page(limit=CHAT_SEARCH_PAGE):
+    """能翻到的最大页码"""
+    return max(1, -(-CHAT_SEARCH_MAX_RESULTS // limit))
+
+
+def search_messages(text, room_id=None, page=1, limit=CHAT_SEARCH_PAGE):
+    """搜索消息，返回 (结果列表, 是否还有下一页, 是否有命中因为超过 CHAT_SEARCH_MAX_RESULTS 没有参与排序)
+
+    结果按相关度从高到低，每条是 {"id", "room", "room_name", "user", "timestamp", "snippet"}。
+    page 从 1 开始，超出 1..max_page(limit) 时返回空结果。同步调用，async 里包一层 database_sync_to_async。
+    """
+    if connection.vendor != "sqlite":
+        raise SearchUnavailable()
+    terms = search_terms(text)
+    if not terms or not 1 <= page <= max_page(limit):
+        return [], False, False
+
+    query = build_query(terms, room_id)
+    start = (page - 1) * limit
+    with connection.cursor() as cursor:
+        # 第一步：最近的 CHAT_SEARCH_MAX_RESULTS 条命中里最旧的 rowid，多取一条判断有没有被截掉
+        cursor.execute(
+            "SELECT rowid FROM chat_message_fts WHERE chat_message_fts MATCH %s"
+            " ORDER BY rowid DESC LIMIT 2 OFFSET %s",
+            [query, CHAT_SEARCH_MAX_RESULTS - 1],
+        )
+        rows = cursor.fetchall()
+        truncated = len(rows) > 1
+        floor = rows[0][0] if rows else 0
+        # 第二步：只给这个 rowid 范围里的命中打分；多取一条判断还有没有下一页
+        cursor.execute(
+            "SELECT rowid FROM chat_message_fts WHERE chat_message_fts MATCH %s AND rowid >= %s"
+            " ORDER BY bm25(chat_message_fts, 1.0, 0.0), rowid DESC LIMIT %s OFFSET %s",
+            [query, floor, min(limit + 1, CHAT_SEARCH_MAX_RESULTS - start), start],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    if not ids:
+        return [], False, truncated
+
+    messages = Message.objects.select_related("user", "room").in_bulk(ids)
+    pattern = _terms_pattern(terms)
+    results = [
+        {
+            "id": msg.uid.hex,
+            "room": msg.room_id,
+            "room_name": msg.room.name,
+            "user": msg.user.username if msg.user else "guest",
+            "timestamp": msg.timestamp.strftime("%Y-%m-%d %H:%M"),
+            "snippet": snippet(msg.content, pattern),
+        }
+        for msg in (messages[pk] for pk in ids if pk in messages)
+    ]
+    return results, has_more, truncated
+
+
+def snippet(content, pattern):
+    """截取第一个命中附近的一段，转义后把命中部分包在 <mark> 里"""
+    first = pattern.search(content)
+    start = max(0, first.start() - SNIPPET_BEFORE) if first else 0
+    end = start + SNIPPET_CHARS
+    parts = []
+    position = start
+    for match in pattern.finditer(content, start, end):
+        parts.append(escape(content[position:match.start()]))
+        parts.append("<mark>" + escape(match.group()) + "</mark>")
+        position = match.end()
+    parts.append(escape(content[position:end]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(content) else "")
+
+
+def _terms_pattern(terms):
+    # 长的词优先，避免一个词是另一个词的一部分时只标出短的
+    alternatives = sorted({re.escape(term) for term in terms}, key=len, reverse=True)
+    return re.compile("|".join(alternatives), re.IGNORECASE)
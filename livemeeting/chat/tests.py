@@ -1,3 +1,263 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from . import archive
+from .archive import RoomArchive, message_record
+from .history import format_cursor, history_page, parse_cursor
+from .models import ChatRoom, Message
+from . import search
+from .search import build_query, search_messages, search_terms
+from .writer import ChatWriter
+
+START = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def record(pk, minutes):
+    return {
+        "id": pk,
+        "uid": f"{pk:032x}",
+        "user": None,
+        "content": f"m{pk}",
+        "timestamp": (START + timedelta(minutes=minutes)).isoformat(),
+    }
+
+
+class ArchiveDirMixin:
+    """每个测试用单独的归档目录，块大小调小以覆盖跨块读取"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        for name, value in (("ARCHIVE_DIR", self.root), ("ARCHIVE_BLOCK_ROWS", 3)):
+            patcher = mock.patch.object(archive, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class ChatWriterTests(SimpleTestCase):
+    def make_writer(self):
+        with mock.patch("chat.writer.atexit.register"):
+            return ChatWriter()
+
+    async def test_flush_waits_for_batch_in_flight(self):
+        writer = self.make_writer()
+        saved, started, release = [], asyncio.Event(), asyncio.Event()
+
+        async def save(batch):
+            started.set()
+            await release.wait()
+            saved.extend(batch)
+
+        writer._save = save
+        writer.pending.append(Message(room_id=1, content="a"))
+        first = asyncio.ensure_future(writer.flush())
+        await started.wait()
+        # 这一批已经从 pending 取走但还没提交
+        self.assertEqual(writer.pending, [])
+        self.assertTrue(writer.has_unsaved(1))
+        self.assertFalse(writer.has_unsaved(2))
+
+        second = asyncio.ensure_future(writer.flush())
+        await asyncio.sleep(0)
+        self.assertFalse(second.done())
+        release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual([m.content for m in saved], ["a"])
+        self.assertFalse(writer.has_unsaved(1))
+
+    async def test_failed_batch_is_put_back_in_order(self):
+        writer = self.make_writer()
+
+        async def fail(batch):
+            raise RuntimeError("db down")
+
+        writer._save = fail
+        writer.pending.extend([Message(room_id=1, content="a"), Message(room_id=1, content="b")])
+        with self.assertRaises(RuntimeError):
+            await writer.flush()
+        self.assertEqual([m.content for m in writer.pending], ["a", "b"])
+        self.assertEqual(writer.inflight, [])
+
+
+class RoomArchiveTests(ArchiveDirMixin, SimpleTestCase):
+    def test_before_and_after_across_blocks(self):
+        RoomArchive(1).append([record(i, i) for i in range(1, 11)])
+        room = RoomArchive(1)
+        self.assertEqual([r["id"] for r in room.before(None, 4)], [10, 9, 8, 7])
+        key = archive.record_key(record(5, 5))
+        self.assertEqual([r["id"] for r in room.before(key, 10)], [4, 3, 2, 1])
+        self.assertEqual([r["id"] for r in room.after(key, 3)], [6, 7, 8])
+
+    def test_overlapping_segments_are_merged(self):
+        room = RoomArchive(1)
+        room.append([record(i, i * 2) for i in range(1, 6)])
+        # 补录的旧消息：时间落在第一个段中间
+        room.append([record(i, (i - 20) * 2 + 1) for i in range(20, 23)])
+        ids = [r["id"] for r in RoomArchive(1).before(None, 20)]
+        self.assertEqual(ids, [5, 4, 3, 22, 2, 21, 1, 20])
+
+    def test_index_records_id_range(self):
+        RoomArchive(7).append([record(40, 1), record(12, 2), record(33, 3)])
+        name = sorted(os.listdir(os.path.join(self.root, "7")))[0]
+        self.assertTrue(name.endswith(".idx.json"))
+        with open(os.path.join(self.root, "7", name)) as f:
+            self.assertEqual(json.load(f)["ids"], [12, 40])
+        with mock.patch.object(archive._block_cache, "get", side_effect=AssertionError("decompressed")):
+            low, high, last = RoomArchive(7).latest_range()
+        self.assertEqual((low, high, last), (12, 40, archive.record_key(record(33, 3))))
+
+    def test_empty_archive(self):
+        room = RoomArchive(99)
+        self.assertFalse(room)
+        self.assertIsNone(room.latest_range())
+        self.assertEqual(room.before(None, 5), [])
+
+
+class HistoryTests(ArchiveDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.room = ChatRoom.objects.create(name="lobby")
+        self.messages = [
+            Message.objects.create(room=self.room, content=f"m{i}", timestamp=START + timedelta(minutes=i))
+            for i in range(10)
+        ]
+
+    def contents(self, page):
+        return [m["message"] for m in page]
+
+    def test_cursor_round_trip(self):
+        key = (START, 42)
+        self.assertEqual(parse_cursor(format_cursor(key)), key)
+        self.assertEqual(parse_cursor("2024-01-01T00:00:00|42"), key)
+        for bad in (None, "", "abc", "2024-01-01|x", "x|1"):
+            self.assertIsNone(parse_cursor(bad))
+
+    def test_pages_backwards_and_forwards(self):
+        page, before, after = history_page(self.room.id, limit=4)
+        self.assertEqual(self.contents(page), ["m6", "m7", "m8", "m9"])
+        self.assertIsNone(after)
+        page, before, _ = history_page(self.room.id, before=parse_cursor(before), limit=4)
+        self.assertEqual(self.contents(page), ["m2", "m3", "m4", "m5"])
+        page, before, after = history_page(self.room.id, before=parse_cursor(before), limit=4)
+        self.assertEqual(self.contents(page), ["m0", "m1"])
+        self.assertIsNone(before)
+        page, _, _ = history_page(self.room.id, after=parse_cursor(after), limit=3)
+        self.assertEqual(self.contents(page), ["m2", "m3", "m4"])
+
+    def test_after_page_reports_older_messages_from_the_data(self):
+        cursor = (START - timedelta(minutes=1), 0)
+        page, before, _ = history_page(self.room.id, after=cursor, limit=3)
+        self.assertEqual(self.contents(page), ["m0", "m1", "m2"])
+        self.assertIsNone(before)
+        first = (self.messages[0].timestamp, self.messages[0].id)
+        page, before, _ = history_page(self.room.id, after=first, limit=3)
+        self.assertEqual(self.contents(page), ["m1", "m2", "m3"])
+        self.assertIsNotNone(before)
+        # 更早的消息只在归档里
+        RoomArchive(self.room.id).append([message_record(self.messages[0])])
+        self.messages[0].delete()
+        page, before, _ = history_page(self.room.id, after=first, limit=3)
+        self.assertEqual(self.contents(page), ["m1", "m2", "m3"])
+        self.assertIsNotNone(before)
+
+    def test_archive_command_keeps_history_intact(self):
+        out = io.StringIO()
+        cutoff_days = (datetime.now(dt_timezone.utc) - (START + timedelta(minutes=4, seconds=30))).total_seconds() / 86400
+        call_command("archive_chat", older_than=cutoff_days, stdout=out)
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 5)
+        self.assertTrue(RoomArchive(self.room.id))
+        page, before, _ = history_page(self.room.id, limit=7)
+        self.assertEqual(self.contents(page), [f"m{i}" for i in range(3, 10)])
+        page, before, _ = history_page(self.room.id, before=parse_cursor(before), limit=7)
+        self.assertEqual(self.contents(page), ["m0", "m1", "m2"])
+        self.assertIsNone(before)
+
+    def test_archive_command_recovers_after_interrupted_run(self):
+        # 上次写完段文件后、删除热表之前退出
+        old = Message.objects.filter(room=self.room).order_by("timestamp", "id")[:4]
+        RoomArchive(self.room.id).append([message_record(m) for m in old])
+        call_command("archive_chat", older_than=36500, stdout=io.StringIO())
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 6)
+        page, _, _ = history_page(self.room.id, limit=20)
+        self.assertEqual(self.contents(page), [f"m{i}" for i in range(10)])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.lobby = ChatRoom.objects.create(name="lobby")
+        self.other = ChatRoom.objects.create(name="other")
+
+    def post(self, room, content):
+        return Message.objects.create(room=room, content=content)
+
+    def test_terms_and_query_escaping(self):
+        self.assertEqual(search_terms("ab deploy  x\"y\""), ["deploy", 'x"y"'])
+        self.assertEqual(build_query(['a"b', "AND"], 3), 'content:("a""b" "AND") AND room:"r3r"')
+
+    def test_relevance_order_and_room_filter(self):
+        long = self.post(self.lobby, "deploy " + "filler words " * 30)
+        short = self.post(self.lobby, "deploy deploy now")
+        self.post(self.other, "deploy elsewhere")
+        self.post(self.lobby, "nothing here")
+        results, has_more, truncated = search_messages("deploy", room_id=self.lobby.id)
+        self.assertEqual([r["id"] for r in results], [short.uid.hex, long.uid.hex])
+        self.assertFalse(has_more)
+        self.assertFalse(truncated)
+        self.assertEqual(len(search_messages("deploy")[0]), 3)
+
+    def test_all_matches_are_reachable_by_paging(self):
+        Message.objects.bulk_create([Message(room=self.lobby, content=f"release note {i}") for i in range(250)])
+        seen = set()
+        page, has_more = 1, True
+        while has_more:
+            results, has_more, _ = search_messages("release", room_id=self.lobby.id, page=page, limit=40)
+            seen.update(r["id"] for r in results)
+            page += 1
+        self.assertEqual(len(seen), 250)
+        self.assertEqual(page, 8)
+
+    def test_only_newest_matches_are_ranked(self):
+        Message.objects.bulk_create([Message(room=self.lobby, content=f"release note {i}") for i in range(30)])
+        with mock.patch.object(search, "CHAT_SEARCH_MAX_RESULTS", 25):
+            self.assertEqual(search.max_page(10), 3)
+            seen = []
+            for page in (1, 2, 3):
+                results, has_more, truncated = search_messages("release", page=page, limit=10)
+                seen += [r["snippet"] for r in results]
+                self.assertTrue(truncated)
+            self.assertFalse(has_more)
+            self.assertEqual(search_messages("release", page=4, limit=10), ([], False, False))
+        self.assertEqual(len(seen), 25)
+        self.assertNotIn("<mark>release</mark> note 4", seen)
+        self.assertIn("<mark>release</mark> note 5", seen)
+
+    def test_out_of_range_page(self):
+        self.post(self.lobby, "deploy now")
+        self.assertEqual(search_messages("deploy", page=0), ([], False, False))
+        self.assertEqual(search_messages("deploy", page=2 ** 70), ([], False, False))
+        for page in ("0", str(2 ** 70)):
+            response = self.client.get("/chat/search", {"q": "deploy", "page": page})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get("/chat/search", {"q": "deploy"})
+        self.assertEqual(response.json()["truncated"], False)
+
+    def test_snippet_is_escaped_and_marked(self):
+        self.post(self.lobby, "<b>Deploy</b> & go")
+        results, _, _ = search_messages("deploy")
+        self.assertEqual(results[0]["snippet"], "&lt;b&gt;<mark>Deploy</mark>&lt;/b&gt; &amp; go")
+
+    def test_syntax_characters_and_short_terms(self):
+        self.post(self.lobby, "what AND * : (x)")
+        self.assertEqual(len(search_messages("AND *")[0]), 1)
+        self.assertEqual(search_messages("ab"), ([], False, False))
+        self.assertEqual(search_messages('"unterminated "quote')[0], [])
@@ -5,5 +5,7 @@ from . import views
 
 urlpatterns = [
     path("", views.chat_list, name="chat_list"),
+    path("search", views.chat_search, name="chat_search"),
     path("<int:chat_id>/", views.chat_room, name="chat_room"),
+    path("<int:chat_id>/history", views.chat_history, name="chat_history"),
 ]
@@ -1,7 +1,11 @@
 #chat/views.py
 
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
+from django.views.decorators.http import require_GET
+from .history import CHAT_HISTORY_MAX_PAGE, CHAT_HISTORY_PAGE, history_page, parse_cursor
 from .models import ChatRoom
+from .search import SearchUnavailable, max_page, search_messages
 
 def chat_list(request):
     # 获取所有聊天房间
@@ -9,7 +13,56 @@ def chat_list(request):
     return render(request, "chat/chat_list.html", {"rooms": rooms})
 
 def chat_room(request, chat_id):
-    # 进入某个聊天房间
+    # 进入某个聊天房间：只渲染最新一页，更早的消息由页面按需加载
     room = get_object_or_404(ChatRoom, pk=chat_id)
-    messages = room.messages.order_by('timestamp')  # 获取历史消息
+    messages, _, _ = history_page(room.id)
     return render(request, "chat/chat_room.html", {"room": room, "messages": messages})
+
+@require_GET
+def chat_history(request, chat_id):
+    """历史消息 JSON：?before=<游标> 往前翻，?after=<游标> 往后翻，?limit= 每页条数（有上限）
+
+    返回 {"messages": [...], "before": 更早一页的游标, "after": 更新一页的游标}，没有更多时为 null
+    """
+    room = get_object_or_404(ChatRoom, pk=chat_id)
+    before = after = None
+    if "before" in request.GET:
+        before = parse_cursor(request.GET["before"])
+        if before is None:
+            return JsonResponse({"error": "Invalid before cursor"}, status=400)
+    if "after" in request.GET:
+        after = parse_cursor(request.GET["after"])
+        if after is None:
+            return JsonResponse({"error": "Invalid after cursor"}, status=400)
+    if before is not None and after is not None:
+        return JsonResponse({"error": "Use either before or after"}, status=400)
+    try:
+        limit = int(request.GET.get("limit", CHAT_HISTORY_PAGE))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    limit = max(1, min(limit, CHAT_HISTORY_MAX_PAGE))
+
+    messages, before_cursor, after_cursor = history_page(room.id, before=before, after=after, limit=limit)
+    return JsonResponse({"messages": messages, "before": before_cursor, "after": after_cursor})
+
+@require_GET
+def chat_search(request):
+    """全文搜索：?q=<搜索词>&room=<聊天室 id，不带则搜所有聊天室>&page=<页码>
+
+    返回 {"results": [...], "page": 页码, "has_more": 是否还有下一页, "truncated": 是否有更早的命中没有参与排序}，
+    results 按相关度排序；页码超出 1..max_page() 返回 400
+    """
+    try:
+        room_id = int(request.GET["room"]) if request.GET.get("room") else None
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        return JsonResponse({"error": "Invalid room or page"}, status=400)
+    if not 1 <= page <= max_page():
+        return JsonResponse({"error": "Invalid room or page"}, status=400)
+    if room_id is not None:
+        get_object_or_404(ChatRoom, pk=room_id)
+    try:
+        results, has_more, truncated = search_messages(request.GET.get("q", ""), room_id=room_id, page=page)
+    except SearchUnavailable:
+        return JsonResponse({"error": "Search is not available on this database"}, status=501)
+    return JsonResponse({"results": results, "page": page, "has_more": has_more, "truncated": truncated})
@@ -0,0 +1,101 @@
+# chat/writer.py
+#
+# 聊天消息的批量写库（write-behind）：
+#   - consumer 收到消息后立即广播（时间和 uid 由服务器分配），Message 对象交给本进程的 writer
+#   - writer 每 CHAT_WRITE_INTERVAL 秒把攒下的消息 bulk_create 一次，攒满 CHAT_WRITE_BATCH 条立即写
+#   - 同一时刻只有一个写库任务，按到达顺序写入，失败时整批放回队首下次重试，顺序不变
+#   - 正在写的那一批从 pending 里取走后放在 inflight，has_unsaved 两边都查；
+#     flush 拿同一把锁，会先等正在写的那一批写完
+#   - 进程退出时（atexit）同步写完剩下的消息
+
+import asyncio
+import atexit
+import logging
+
+from django.conf import settings
+
+from livemeeting.metrics import database_sync_to_async
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+# 消息最多在内存里停留多久（秒）
+WRITE_INTERVAL = getattr(settings, "CHAT_WRITE_INTERVAL", 0.2)
+# 攒够多少条立即写
+WRITE_BATCH = getattr(settings, "CHAT_WRITE_BATCH", 200)
+
+
+class ChatWriter:
+    """进程内的聊天消息写队列，put 只在事件循环线程里调用"""
+
+    def __init__(self):
+        self.pending = []
+        self.inflight = []
+        self._wake = None
+        self._task = None
+        self._lock = None
+        atexit.register(self.flush_sync)
+
+    def put(self, message):
+        self.pending.append(message)
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        elif len(self.pending) >= WRITE_BATCH:
+            self._wake.set()
+
+    def has_unsaved(self, room_id):
+        """这个聊天室有没有已经广播、还没提交到数据库的消息（包括正在写的那一批）"""
+        return any(m.room_id == room_id for m in self.inflight) or any(m.room_id == room_id for m in self.pending)
+
+    async def flush(self):
+        """写入目前攒下的所有消息；有一批正在写时先等它写完"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self.pending:
+                self.inflight, self.pending = self.pending[:WRITE_BATCH], self.pending[WRITE_BATCH:]
+                try:
+                    await self._save(self.inflight)
+                except Exception:
+                    self.pending = self.inflight + self.pending
+                    raise
+                finally:
+                    self.inflight = []
+
+    def flush_sync(self):
+        """进程退出时的兜底写入（atexit）"""
+        rows = self.inflight + self.pending
+        if not rows:
+            return
+        try:
+            # inflight 那一批可能已经提交了，按 uid 去重
+            Message.objects.bulk_create(rows, ignore_conflicts=True)
+            self.inflight, self.pending = [], []
+        except Exception as exc:
+            logger.error("退出时写入 %d 条聊天消息失败: %s", len(rows), exc)
+
+    async def _run(self):
+        while self.pending:
+            if len(self.pending) < WRITE_BATCH:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), WRITE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.warning("聊天消息写入失败，%s 秒后重试: %s", WRITE_INTERVAL, exc)
+                await asyncio.sleep(WRITE_INTERVAL)
+
+    @database_sync_to_async
+    def _save(self, batch):
+        self._save_rows(batch)
+
+    def _save_rows(self, batch):
+        Message.objects.bulk_create(batch)
+
+
+chat_writer = ChatWriter()
@@ -0,0 +1,387 @@
+# livemeeting/channel_layer.py
+#
+# 单机多进程的 channel layer，不需要 Redis：
+#   - 同一台机器上的进程通过 unix socket 连到一个中转（hub）
+#   - hub 运行在第一个拿到文件锁（<path>.lock）的进程的事件循环里；runworkers 的父进程会先占住它，
+#     单独运行 daphne 时由第一个连上的进程担任。持有者退出后，其余进程重连时重新选举
+#   - 本进程的 channel 名带进程前缀（specific.<前缀>!xxx），hub 按前缀把消息转给对应进程
+#   - group 成员表在 hub 里；group_send 时每个有成员的进程只收到一帧（附带该进程的成员列表），
+#     由接收进程在本地分发；本进程的成员直接本地投递，不经过 hub
+#   - 每个 channel 的队列有上限（capacity / channel_capacity），超过 expiry 秒没被取走的消息丢弃，
+#     同时把该 channel 移出所有 group；本进程的 channel 队列满时 send 抛 ChannelFull，跨进程的由接收端丢弃
+#   - 进程断开时 hub 清掉它的所有 group 成员资格，不会留下死连接
+# 不带 "!" 的普通 channel 只在本进程内投递。
+# 消息用 marshal 编码（channels 规范里的基本类型：dict / list / str / bytes / 数字 / None）。
+# socket 路径默认按部署区分：<临时目录>/livemeeting-<uid>/channels-<BASE_DIR 的哈希>.sock，
+# 同一台机器上的多个部署、多个用户互不相连；也可以在 CONFIG 里用 path 指定。
+# socket、锁文件和所在目录都必须属于当前用户且其他用户不可写，否则拒绝连接（PermissionError），
+# 防止连到别人预先放好的 socket 上。
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import marshal
+import os
+import random
+import stat
+import string
+import struct
+import tempfile
+import time
+from copy import deepcopy
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# hub 给单个进程积压的待写字节数上限，超过时丢弃发往该进程的消息
+HUB_WRITE_BUFFER = 8 * 1024 * 1024
+# 连接 hub 失败时的重试间隔（秒）和次数
+CONNECT_RETRY = 0.05
+CONNECT_ATTEMPTS = 100
+# 过期清理最多多久做一次（秒）
+CLEAN_INTERVAL = 1.0
+
+_HEADER = struct.Struct("!I")
+
+
+def default_socket_path():
+    """本部署的默认 socket 路径，不同 BASE_DIR、不同用户各不相同"""
+    digest = hashlib.sha1(str(settings.BASE_DIR).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"livemeeting-{os.getuid()}", f"channels-{digest}.sock")
+
+
+def _check_private(info, path, kind):
+    """info（os.stat 结果）必须是 kind 类型、属于当前用户、其他用户不可写"""
+    if not kind(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise PermissionError(f"{path} 不属于当前用户或对其他用户可写，拒绝使用")
+
+
+def _prepare_directory(path):
+    """创建 socket 所在目录（只有当前用户可访问），已存在时检查归属"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_private(os.lstat(directory), directory, stat.S_ISDIR)
+
+
+def _channel_process(channel):
+    """specific.<前缀>!xxx → 前缀；普通 channel 返回 None"""
+    if "!" not in channel:
+        return None
+    return channel[:channel.index("!")].rsplit(".", 1)[-1]
+
+
+async def _read_frame(reader):
+    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return marshal.loads(await reader.readexactly(length))
+
+
+def _frame(*parts):
+    data = marshal.dumps(parts)
+    return _HEADER.pack(len(data)) + data
+
+
+class ChannelHub:
+    """进程之间的中转：记录 group 成员，按进程前缀转发消息"""
+
+    def __init__(self, path, group_expiry=86400):
+        self.path = path
+        self.group_expiry = group_expiry
+        self.processes = {}   # 进程前缀 → StreamWriter
+        self.groups = {}      # group → {channel: 加入时间}
+        self.loop = None
+        self._server = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        if os.path.exists(self.path):
+            os.unlink(self.path)   # 上一个持有者留下的 socket 文件
+        umask = os.umask(0o077)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, self.path)
+        finally:
+            os.umask(umask)
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        for writer in self.processes.values():
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        process = None
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                op = frame[0]
+                if op == "hello":
+                    process = frame[1]
+                    self.processes[process] = writer
+                elif op == "send":
+                    _, channel, message = frame
+                    self._deliver(_channel_process(channel), [channel], message)
+                elif op == "group_add":
+                    _, group, channel = frame
+                    self.groups.setdefault(group, {})[channel] = time.time()
+                elif op == "group_discard":
+                    _, group, channel = frame
+                    self._discard(group, channel)
+                elif op == "group_send":
+                    _, group, message, origin = frame
+                    self._group_send(group, message, origin)
+                elif op == "flush":
+                    self.groups.clear()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, EOFError):
+            pass
+        except asyncio.CancelledError:
+            pass   # 事件循环关闭
+        finally:
+            writer.close()
+            if process is not None and self.processes.get(process) is writer:
+                del self.processes[process]
+                for group in list(self.groups):
+                    for channel in [c for c in self.groups[group] if _channel_process(c) == process]:
+                        self._discard(group, channel)
+
+    def _group_send(self, group, message, origin):
+        members = self.groups.get(group)
+        if not members:
+            return
+        expired = time.time() - self.group_expiry
+        by_process = {}
+        for channel, joined in list(members.items()):
+            if joined < expired:
+                del members[channel]
+                continue
+            process = _channel_process(channel)
+            if process != origin:
+                by_process.setdefault(process, []).append(channel)
+        for process, channels in by_process.items():
+            self._deliver(process, channels, message)
+
+    def _deliver(self, process, channels, message):
+        writer = self.processes.get(process)
+        if writer is None or writer.transport.get_write_buffer_size() > HUB_WRITE_BUFFER:
+            return
+        writer.write(_frame("deliver", channels, message))
+
+    def _discard(self, group, channel):
+        members = self.groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self.groups[group]
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(self, path=None, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = str(path or default_socket_path())
+        self.group_expiry = group_expiry
+        self.process = "".join(random.choice(string.ascii_letters + string.digits) for _ in range(12))
+        self.channels = {}    # 本进程的 channel → asyncio.Queue[(过期时间, 消息)]
+        self.groups = {}      # group → {本进程的 channel: 加入时间}
+        self.hub = None       # 本进程担任 hub 时的 ChannelHub
+        self._lock_file = None
+        self._writer = None
+        self._loop = None     # 连接所在的事件循环；换了循环（测试、async_to_sync）时重新连接
+        self._connecting = None
+        self._last_clean = 0.0
+
+    # ========== channel layer API ==========
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        await self._ensure_connected()
+        process = _channel_process(channel)
+        if process is None or process == self.process:
+            self._put(channel, deepcopy(message), raise_full=True)
+            return
+        await self._request("send", channel, message)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        await self._ensure_connected()
+        self._clean_expired()
+        queue = self._queue(channel)
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+
+    async def new_channel(self, prefix="specific."):
+        await self._ensure_connected()
+        suffix = "".join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{prefix}{self.process}!{suffix}"
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+        await self._request("flush")
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if _channel_process(channel) == self.process:
+            self.groups.setdefault(group, {})[channel] = time.time()
+        await self._request("group_add", group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        members = self.groups.get(group)
+        if members:
+            members.pop(channel, None)
+            if not members:
+                self.groups.pop(group, None)
+        await self._request("group_discard", group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        await self._ensure_connected()
+        self._clean_expired()
+        expired = time.time() - self.group_expiry
+        for channel, joined in list(self.groups.get(group, {}).items()):
+            if joined < expired:
+                self.groups[group].pop(channel, None)
+                continue
+            self._put(channel, deepcopy(message), raise_full=False)
+        await self._request("group_send", group, message, self.process)
+
+    # ========== 本地队列 ==========
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _put(self, channel, message, raise_full):
+        try:
+            self._queue(channel).put_nowait((time.time() + self.expiry, message))
+        except asyncio.QueueFull:
+            if raise_full:
+                raise ChannelFull(channel)
+
+    def _clean_expired(self):
+        """丢弃过期消息；有消息过期的 channel 视为已经没人接收，移出所有 group"""
+        now = time.time()
+        if now - self._last_clean < CLEAN_INTERVAL:
+            return
+        self._last_clean = now
+        for channel, queue in list(self.channels.items()):
+            expired = False
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+                expired = True
+            if expired:
+                for group, members in list(self.groups.items()):
+                    if members.pop(channel, None) is not None:
+                        self._notify("group_discard", group, channel)
+                    if not members:
+                        self.groups.pop(group, None)
+            if queue.empty() and not queue._getters:   # 还有 receive() 在等的队列不能丢
+                self.channels.pop(channel, None)
+
+    # ========== hub 连接 ==========
+    async def ensure_hub(self):
+        """尝试担任 hub（拿到文件锁的进程），返回是否担任"""
+        loop = asyncio.get_running_loop()
+        if self.hub is not None and self.hub.loop is loop:
+            return True
+        if self._lock_file is None:
+            _prepare_directory(self.path)
+            lock_file = os.fdopen(os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600), "r+")
+            try:
+                _check_private(os.fstat(lock_file.fileno()), self.path + ".lock", stat.S_ISREG)
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except PermissionError:
+                lock_file.close()
+                raise
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        # 已经持有锁但 hub 跑在旧的事件循环里时，在当前循环重新启动
+        self.hub = ChannelHub(self.path, self.group_expiry)
+        await self.hub.start()
+        return True
+
+    async def _request(self, *parts):
+        await self._ensure_connected()
+        try:
+            self._writer.write(_frame(*parts))
+        except (ConnectionError, AttributeError):
+            pass   # hub 断开，重连时会重新登记 group
+
+    def _notify(self, *parts):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(_frame(*parts))
+
+    async def _ensure_connected(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 旧循环里的连接和队列都不能再用
+            self._loop, self._writer, self._connecting = loop, None, None
+            self.channels = {}
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        if self._connecting is None or self._connecting.done():
+            self._connecting = asyncio.ensure_future(self._connect())
+        await asyncio.shield(self._connecting)
+
+    async def _connect(self):
+        for _ in range(CONNECT_ATTEMPTS):
+            await self.ensure_hub()
+            try:
+                # 连接前确认 socket 是本用户的 hub 建的
+                _check_private(os.lstat(self.path), self.path, stat.S_ISSOCK)
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                break
+            except PermissionError:
+                raise
+            except OSError:
+                await asyncio.sleep(CONNECT_RETRY)
+        else:
+            raise ConnectionError(f"无法连接 channel hub: {self.path}")
+        writer.write(_frame("hello", self.process))
+        # 重连时重新登记本进程的 group 成员
+        for group, members in self.groups.items():
+            for channel in members:
+                writer.write(_frame("group_add", group, channel))
+        self._writer = writer
+        asyncio.ensure_future(self._read_loop(reader, writer))
+
+    async def _read_loop(self, reader, writer):
+        try:
+            while True:
+                _, channels, message = await _read_frame(reader)
+                for i, channel in enumerate(channels):
+                    self._put(channel, message if i == 0 else deepcopy(message), raise_full=False)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, EOFError):
+            pass
+        writer.close()
+        if self._writer is writer:
+            # hub 所在进程退出：马上重连（可能由本进程接任），不等下一次调用
+            self._writer = None
+            logger.warning("channel hub 连接断开，重新连接")
+            try:
+                await self._ensure_connected()
+            except (ConnectionError, PermissionError) as exc:
+                logger.error("%s", exc)
@@ -0,0 +1,45 @@
+# livemeeting/logs.py
+#
+# 日志采样：同一处日志（logger + 消息模板）在 interval 秒内最多输出 burst 条，
+# 多出来的丢弃，下一个窗口输出的第一条注明省略了多少条。ERROR 及以上不采样。
+# 在 settings.LOGGING 里作为 handler 的 filter 使用。
+
+import logging
+import threading
+import time
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, interval=10.0, burst=5, max_level="WARNING"):
+        super().__init__()
+        self.interval = float(interval)
+        self.burst = int(burst)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._windows = {}   # (logger, 模板) → [窗口开始时间, 本窗口已输出条数, 被省略条数]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10000:
+                    self._prune(now)
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.msg}（前 {self.interval:g} 秒内另有 {suppressed} 条相同日志被省略）"
+        return True
+
+    def _prune(self, now):
+        for key in [k for k, w in self._windows.items() if now - w[0] >= self.interval]:
+            del self._windows[key]
@@ -0,0 +1,192 @@
+# livemeeting/metrics.py
+#
+# 进程内的计数器 / 直方图，/metrics 以 Prometheus 文本格式输出：
+#   - livemeeting_messages_in_total / _out_total    各 consumer 收发的消息数（按消息类型）
+#   - livemeeting_fanout_batch_size / _seconds      board 批量广播每批的消息数、从入队到发出的延迟
+#   - livemeeting_db_call_seconds                   database_sync_to_async 调用的耗时（按函数）
+#   - livemeeting_active_sockets                    各 consumer 当前的连接数
+# 标签里不放 board id、房间名这类标识：/metrics 的读者不一定有权看到它们，而且标签组合会随房间数无限增长。
+#   - livemeeting_init_state_bytes                  board 初始状态推送的字节数
+# 记录只是加锁改字典，可以在事件循环和数据库线程里调用。
+# 多 worker（runworkers）时每个进程各自统计，抓取时用 /metrics?worker=<名字> 指定 worker（见 livemeeting/router.py）。
+# 没有设置 METRICS_TOKEN 时只允许本机（127.0.0.1 / ::1）直接抓取，而且请求里不能带任何转发头：
+# runworkers 用 --proxy-headers 启动 daphne，REMOTE_ADDR 取自 X-Forwarded-For，客户端可以伪造成 127.0.0.1；
+# 经 nginx / 前端路由转发的请求一律拒绝，这类部署需要设置 METRICS_TOKEN。
+
+import functools
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from channels.db import database_sync_to_async as _database_sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# 非空时 /metrics 要求请求头 Authorization: Bearer <METRICS_TOKEN>；为空时只允许本机访问
+METRICS_TOKEN = getattr(settings, "METRICS_TOKEN", None)
+# 没有 token 时允许访问的客户端地址
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+# 带这些头时 REMOTE_ADDR 可能是从请求头推出来的，不能用来判断是不是本机
+FORWARDED_HEADERS = ("HTTP_X_FORWARDED_FOR", "HTTP_X_REAL_IP", "HTTP_FORWARDED")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = [(label, value) for label, value in zip(self.labels, key)] + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            value = self._values.get(key, 0) + amount
+            if value:
+                self._values[key] = value
+            else:
+                self._values.pop(key, None)   # 归零的标签组合不再输出
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # 每个桶的计数（非累计）+ 超出最大桶的计数、总和
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def _render_value(self, key, counts):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            total += count
+            labels = self._format_labels(key, [("le", bound if bound == "+Inf" else _number(bound))])
+            lines.append(f"{self.name}_bucket{labels} {total}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(counts[-1])}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {total}")
+        return lines
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = []
+
+messages_in = Counter("livemeeting_messages_in_total", "收到的客户端消息数", ["consumer", "type"])
+messages_out = Counter("livemeeting_messages_out_total", "发给客户端的消息数", ["consumer", "type"])
+fanout_batch_size = Histogram("livemeeting_fanout_batch_size", "board 批量广播每批的消息数", buckets=SIZE_BUCKETS)
+fanout_seconds = Histogram("livemeeting_fanout_seconds", "board 消息从入队到广播发出的延迟（秒）")
+db_call_seconds = Histogram("livemeeting_db_call_seconds", "database_sync_to_async 调用耗时（秒）", ["helper"])
+active_sockets = Gauge("livemeeting_active_sockets", "当前的 WebSocket 连接数", ["consumer"])
+init_state_bytes = Histogram("livemeeting_init_state_bytes", "board 初始状态推送的字节数", buckets=BYTES_BUCKETS)
+
+
+def database_sync_to_async(func):
+    """channels.db.database_sync_to_async 加上耗时统计（含等待线程池的时间）"""
+    wrapped = _database_sync_to_async(func)
+    helper = func.__qualname__
+
+    @functools.wraps(func)
+    async def call(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await wrapped(*args, **kwargs)
+        finally:
+            db_call_seconds.observe(time.perf_counter() - start, helper=helper)
+
+    return call
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    if METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return HttpResponseForbidden()
+    elif request.META.get("REMOTE_ADDR") not in LOCAL_ADDRESSES or any(
+        header in request.META for header in FORWARDED_HEADERS
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,184 @@
+# livemeeting/outbox.py
+#
+# 每个 WebSocket 连接的有界发送队列（board / chat / sharescreen 的 consumer 共用）：
+#   - 广播来的消息先进本连接的队列，由单独的任务发出，处理 channel layer 消息的循环不会被慢客户端拖住
+#   - 流量控制靠客户端确认：客户端定期回 {"type": "ack", "n": <已收到的帧数>}，
+#     已发出未确认的帧超过 OUTBOX_WINDOW 时暂停发送，消息留在队列里
+#   - 排队期间由 consumer 提供的 coalesce 规则合并 / 丢弃被取代的消息（例如只保留最新的 pan）
+#   - 队列超过 OUTBOX_LIMIT 条，或最早的消息排队超过 OUTBOX_MAX_LAG 秒时，
+#     发送 {"type": "resync", "reason": "lag"} 后断开，客户端重连后补齐（board 按 ?since= 只补尾部）
+#   - 不管客户端发不发 ack，已发出未确认的字节数超过 OUTBOX_MAX_UNACKED_BYTES 时同样暂停发送；
+#     从没发过 ack 的客户端（旧版本页面）不受帧数窗口限制，但发满这个字节数后消息只能排队，
+#     最终按上面的规则 resync，不会在服务端无限缓冲
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .metrics import messages_out
+
+logger = logging.getLogger(__name__)
+
+# 已发出、客户端还没确认的帧数上限
+OUTBOX_WINDOW = getattr(settings, "OUTBOX_WINDOW", 256)
+# 已发出、客户端还没确认的字节数上限（对不发 ack 的客户端同样生效）
+OUTBOX_MAX_UNACKED_BYTES = getattr(settings, "OUTBOX_MAX_UNACKED_BYTES", 4 * 1024 * 1024)
+# 队列里最多积压多少条消息
+OUTBOX_LIMIT = getattr(settings, "OUTBOX_LIMIT", 1000)
+# 最早的消息最多排队多少秒
+OUTBOX_MAX_LAG = getattr(settings, "OUTBOX_MAX_LAG", 15)
+# 一次最多取多少条消息交给 deliver
+OUTBOX_BATCH = 200
+# 因积压断开时的 close code
+OUTBOX_CLOSE_CODE = 4008
+
+
+class Outbox:
+    """单个连接的发送队列，只在事件循环线程里使用"""
+
+    def __init__(self, deliver, overflow, coalesce=None):
+        self.deliver = deliver      # async (messages) → 把一批消息发给客户端
+        self.overflow = overflow    # async () → 积压过多时调用
+        self.coalesce = coalesce    # (queue, message) → 是否保留 message；可以从 queue 里删掉被取代的消息
+        self.queue = deque()        # (入队时间, 消息)
+        self.sent = 0               # 发给客户端的帧数（含不经过队列直接发送的）
+        self.sent_bytes = 0
+        self.acked = None           # 客户端确认收到的帧数，None 表示客户端不支持确认
+        self.acked_bytes = 0        # 确认收到的帧一共多少字节
+        self._frames = deque()      # 未确认的帧：(帧序号, 发完这一帧后的 sent_bytes)
+        self.closed = False
+        self._wake = asyncio.Event()
+        self._task = None
+
+    @property
+    def unacked_bytes(self):
+        return self.sent_bytes - self.acked_bytes
+
+    @property
+    def blocked(self):
+        if self.unacked_bytes >= OUTBOX_MAX_UNACKED_BYTES:
+            return True
+        return self.acked is not None and self.sent - self.acked >= OUTBOX_WINDOW
+
+    def record(self, size):
+        """记一帧发给客户端的数据（OutboxMixin.send 调用）"""
+        self.sent += 1
+        self.sent_bytes += size
+        self._frames.append((self.sent, self.sent_bytes))
+
+    def put(self, message):
+        if self.closed:
+            return
+        if self.coalesce is not None and not self.coalesce(self.queue, message):
+            return
+        self.queue.append((time.monotonic(), message))
+        self._wake.set()
+        if len(self.queue) > OUTBOX_LIMIT:
+            # 发送任务在等 ack 时由它醒来后处理
+            self._start(self._overflow())
+            return
+        self._start(self._run())
+
+    def ack(self, count):
+        if not isinstance(count, int) or isinstance(count, bool):
+            return
+        self.acked = max(self.acked or 0, min(count, self.sent))
+        while self._frames and self._frames[0][0] <= self.acked:
+            self.acked_bytes = self._frames.popleft()[1]
+        self._wake.set()
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self._frames.clear()
+        if self._task is not None:
+            self._task.cancel()
+
+    def _start(self, coro):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(coro)
+        else:
+            coro.close()
+
+    async def _run(self):
+        while self.queue and not self.closed:
+            if len(self.queue) > OUTBOX_LIMIT:
+                await self._overflow()
+                return
+            if self.blocked:
+                wait = OUTBOX_MAX_LAG - (time.monotonic() - self.queue[0][0])
+                if wait <= 0:
+                    await self._overflow()
+                    return
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            batch = [self.queue.popleft()[1] for _ in range(min(len(self.queue), OUTBOX_BATCH))]
+            await self.deliver(batch)
+
+    async def _overflow(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        await self.overflow()
+
+
+def drop_queued(queue, predicate):
+    """从队列里删掉满足条件的消息，返回删掉的条数"""
+    kept = [item for item in queue if not predicate(item[1])]
+    dropped = len(queue) - len(kept)
+    if dropped:
+        queue.clear()
+        queue.extend(kept)
+    return dropped
+
+
+class OutboxMixin:
+    """AsyncWebsocketConsumer 的混入：所有发出的帧都计数，广播消息经 enqueue 进有界队列
+
+    子类在 connect 开头调用 open_outbox()，收到 ack 时调用 self.outbox.ack(n)，
+    可以覆盖 deliver（一批消息怎么编码成帧）和 coalesce_outbox（合并规则）。
+    metrics_name 是 /metrics 里的 consumer 标签。
+    """
+    metrics_name = "websocket"
+
+    def open_outbox(self):
+        self.outbox = Outbox(self._deliver_counted, self.outbox_overflow, self.coalesce_outbox)
+
+    async def _deliver_counted(self, messages):
+        await self.deliver(messages)
+        for message in messages:
+            messages_out.inc(consumer=self.metrics_name, type=message.get("type", "message"))
+
+    def enqueue(self, message):
+        self.outbox.put(message)
+
+    def coalesce_outbox(self, queue, message):
+        return True
+
+    async def deliver(self, messages):
+        for message in messages:
+            await self.send(text_data=json.dumps(message))
+
+    async def outbox_overflow(self):
+        logger.warning("连接 %s 积压过多，断开并要求重新同步", self.channel_name)
+        await self.send(text_data=json.dumps({"type": "resync", "reason": "lag"}))
+        await self.close(code=OUTBOX_CLOSE_CODE)
+
+    def close_outbox(self):
+        if getattr(self, "outbox", None) is not None:
+            self.outbox.close()
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        outbox = getattr(self, "outbox", None)
+        if outbox is not None and (text_data is not None or bytes_data is not None):
+            outbox.record(len(text_data if text_data is not None else bytes_data))
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
@@ -0,0 +1,85 @@
+# livemeeting/resp.py
+#
+# 极简的 Redis 协议（RESP）客户端，board 的 presence 和 sharescreen 的房间登记共用。
+# 只依赖 socket，任何兼容 RESP 的服务（Redis、KeyDB 或本地替身）都可以；
+# 每个线程一条连接，命令都是同步阻塞调用。
+
+import socket
+import threading
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    def __init__(self, url="redis://127.0.0.1:6379/0", timeout=2.0):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def command(self, *args):
+        try:
+            return self._roundtrip(args)
+        except (OSError, ConnectionError):
+            # 连接断了就重连一次
+            self.close()
+            return self._roundtrip(args)
+
+    def _roundtrip(self, args):
+        conn, reader = self._connection()
+        payload = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        conn.sendall(b"".join(payload))
+        return read_reply(reader)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parsed = urlparse(self.url)
+            conn = socket.create_connection((parsed.hostname or "127.0.0.1", parsed.port or 6379), self.timeout)
+            reader = conn.makefile("rb")
+            self._local.conn, self._local.reader = conn, reader
+            if parsed.password:
+                self._roundtrip(("AUTH", parsed.password))
+            db = (parsed.path or "/0").lstrip("/")
+            if db and db != "0":
+                self._roundtrip(("SELECT", db))
+        return self._local.conn, self._local.reader
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        self._local.conn = self._local.reader = None
+
+
+def read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(body)
+        if count < 0:
+            return None
+        return [read_reply(reader) for _ in range(count)]
+    raise RespError(f"bad reply: {line!r}")
@@ -0,0 +1,211 @@
+# livemeeting/router.py
+#
+# 多 worker 部署的前端路由（由 manage.py runworkers 启动）：
+#   - 按请求路径把 ws/board/<id>/、ws/chat/<room>/、ws/sharescreen/<room>/ 用一致性哈希固定到某个 worker，
+#     同一个 board / 聊天室的内存状态（board/state.py）、presence 和 channels group 都只在一个进程里
+#   - board 的缩略图 / 瓦片（/board/<id>/thumbnail.png、/board/<id>/tiles/...）和 ws/board/<id>/ 固定到同一个 worker，
+#     由持有内存状态的进程渲染（board/tiles.py）
+#   - 其他请求（页面、API、静态文件）在 worker 之间轮流分配
+#   - worker 只按每条连接的第一个请求选定，所以普通 HTTP 请求转发时把 Connection 头改成 close：
+#     worker 回完这个响应就断开，客户端 keep-alive 的下一个请求（可能属于另一个 board）走新连接重新选 worker；
+#     WebSocket 等升级请求不改
+#   - worker 增减时只有少数 key 换了 worker；这些 key 上已有的连接被断开，
+#     客户端重连（board 带 ?since=）后落到新的 worker，旧 worker 在连接断开时把状态落盘
+#   - 退出时先停止接收新连接，再等已有连接结束（最多 drain_timeout 秒）
+# 只读取请求头定位 worker，之后原样转发字节，不解析 HTTP / WebSocket 帧。
+
+import asyncio
+import hashlib
+import logging
+import re
+from bisect import bisect
+from itertools import count
+
+# 每个 worker 在哈希环上的虚拟节点数，越多分布越均匀
+RING_REPLICAS = 64
+# 请求头最大字节数、读取请求头的超时（秒）
+MAX_HEAD_BYTES = 64 * 1024
+HEAD_TIMEOUT = 10
+PIPE_CHUNK = 64 * 1024
+
+# 名字匹配到下一个 "/" 为止，和 */routing.py 接受的房间名一致（包括 "-"、"." 等）
+AFFINITY_PATTERN = re.compile(r"^/ws/(board|chat|sharescreen)/([^/?]+)/")
+RENDER_PATTERN = re.compile(r"^/board/(\d+)/(?:thumbnail\.png|tiles/)")
+# /metrics?worker=<名字>：每个 worker 的指标分别抓取
+METRICS_PATTERN = re.compile(r"^/metrics/?\?(?:.*&)?worker=(\w+)")
+
+logger = logging.getLogger(__name__)
+
+
+def affinity_key(path):
+    """需要固定 worker 的连接返回 "<类型>:<名字>"，其他请求返回 None"""
+    match = AFFINITY_PATTERN.match(path)
+    if match:
+        return f"{match.group(1)}:{match.group(2)}"
+    match = RENDER_PATTERN.match(path)
+    return f"board:{match.group(1)}" if match else None
+
+
+def close_after_response(head):
+    """非升级请求的请求头里把 Connection 改成 close（去掉原来的 Connection / Keep-Alive），升级请求原样返回"""
+    lines = head[:-4].split(b"\r\n")
+    headers = [(line.split(b":", 1)[0].strip().lower(), line) for line in lines[1:]]
+    tokens = {
+        token.strip().lower()
+        for name, line in headers if name == b"connection"
+        for token in line.split(b":", 1)[-1].split(b",")
+    }
+    if b"upgrade" in tokens and any(name == b"upgrade" for name, _ in headers):
+        return head
+    kept = [line for name, line in headers if name not in (b"connection", b"keep-alive")]
+    return b"\r\n".join([lines[0]] + kept + [b"Connection: close"]) + b"\r\n\r\n"
+
+
+class HashRing:
+    """一致性哈希环：增删一个节点时只有约 1/N 的 key 换节点"""
+
+    def __init__(self, nodes=(), replicas=RING_REPLICAS):
+        self.replicas = replicas
+        self._points = []   # 有序的 (hash, node)
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len({node for _, node in self._points})
+
+    def add(self, node):
+        self._points.extend((_hash(f"{node}#{i}"), node) for i in range(self.replicas))
+        self._points.sort()
+
+    def remove(self, node):
+        self._points = [point for point in self._points if point[1] != node]
+
+    def get(self, key):
+        if not self._points:
+            return None
+        i = bisect(self._points, (_hash(key),))
+        return self._points[i % len(self._points)][1]
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class Connection:
+    """一条被转发的客户端连接"""
+
+    def __init__(self, worker, key, writers):
+        self.worker = worker
+        self.key = key
+        self.writers = writers
+        self.done = asyncio.Event()
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+class FrontRouter:
+    """监听对外端口，把连接转发到 worker 的 unix socket"""
+
+    def __init__(self):
+        self.workers = {}          # 名字 → unix socket 路径
+        self.ring = HashRing()
+        self.connections = set()
+        self._round_robin = count()
+        self._server = None
+
+    # ========== worker 增减 ==========
+    def add_worker(self, name, socket_path):
+        self.workers[name] = socket_path
+        self.ring.add(name)
+        self._rebalance()
+
+    def remove_worker(self, name):
+        """移出哈希环；固定到它的连接立即断开，其余连接留给 drain_worker 等待"""
+        self.workers.pop(name, None)
+        self.ring.remove(name)
+        self._rebalance()
+
+    async def drain_worker(self, name, timeout):
+        await self._wait([c for c in self.connections if c.worker == name], timeout)
+
+    def _rebalance(self):
+        moved = [c for c in self.connections if c.key is not None and self.ring.get(c.key) != c.worker]
+        for conn in moved:
+            conn.close()
+        if moved:
+            logger.info("重新分配 worker，断开 %d 个需要迁移的连接", len(moved))
+
+    # ========== 对外服务 ==========
+    async def serve(self, host, port):
+        self._server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD_BYTES)
+        return self._server
+
+    async def drain(self, timeout):
+        """停止接收新连接，等已有连接结束，超时后强制断开"""
+        if self._server is not None:
+            self._server.close()
+        await self._wait(list(self.connections), timeout)
+
+    async def _wait(self, connections, timeout):
+        if not connections:
+            return
+        _, pending = await asyncio.wait([asyncio.ensure_future(c.done.wait()) for c in connections], timeout=timeout)
+        for task in pending:
+            task.cancel()
+        for conn in connections:
+            if not conn.done.is_set():
+                conn.close()
+
+    def pick(self, key):
+        if key is not None:
+            return self.ring.get(key)
+        names = sorted(self.workers)
+        return names[next(self._round_robin) % len(names)] if names else None
+
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEAD_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        request_line = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+        path = request_line[1] if len(request_line) > 1 else "/"
+        key = affinity_key(path)
+        metrics = METRICS_PATTERN.match(path)
+        worker = metrics.group(1) if metrics and metrics.group(1) in self.workers else self.pick(key)
+        try:
+            if worker is None:
+                raise ConnectionError("no worker available")
+            upstream_reader, upstream_writer = await asyncio.open_unix_connection(self.workers[worker])
+        except (OSError, ConnectionError) as exc:
+            logger.warning("无法转发 %s: %s", path, exc)
+            writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            writer.close()
+            return
+
+        conn = Connection(worker, key, (writer, upstream_writer))
+        self.connections.add(conn)
+        try:
+            upstream_writer.write(close_after_response(head))
+            await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+        finally:
+            conn.close()
+            self.connections.discard(conn)
+            conn.done.set()
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(PIPE_CHUNK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        # 一个方向结束时关闭另一端，让对向的 _pipe 也退出
+        writer.close()
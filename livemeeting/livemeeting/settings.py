@@ -138,11 +138,39 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# 在线用户登记后端（board/presence.py）：LocalPresence / SQLitePresence / RedisPresence
+# 多个 worker 时改用 SQLitePresence（同一台机器）或 RedisPresence，例如
+#   {"BACKEND": "board.presence.RedisPresence", "OPTIONS": {"url": "redis://127.0.0.1:6379/0"}}
+BOARD_PRESENCE = {
+    "BACKEND": "board.presence.LocalPresence",
+}
+BOARD_PRESENCE_TTL = 30              # 秒，连接多久没续期视为离线
+BOARD_PRESENCE_HEARTBEAT = 10        # 秒，连接续期间隔
+BOARD_PRESENCE_PROFILE_CACHE = 1024  # 在线列表用户名缓存的容量（用户数）
+
+# 屏幕共享房间登记后端（sharescreen/registry.py）：LocalRooms / SQLiteRooms / RedisRooms
+# 多个 worker 时改用 SQLiteRooms（同一台机器）或 RedisRooms，OPTIONS 同 BOARD_PRESENCE
+SHARESCREEN_ROOMS = {
+    "BACKEND": "sharescreen.registry.LocalRooms",
+}
+SHARESCREEN_LEASE_TTL = 15  # 秒，owner 租约 / viewer 登记多久没续期失效
+SHARESCREEN_HEARTBEAT = 5   # 秒，续期间隔
+
 # channels layer 配置
 CHANNEL_LAYERS = {
     "default": {
-        # 开发测试可以用 InMemory
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        # 单机多进程（runworkers）：进程之间通过 unix socket 中转，不需要 Redis（livemeeting/channel_layer.py）
+        "BACKEND": "livemeeting.channel_layer.UnixSocketChannelLayer",
+        "CONFIG": {
+            "capacity": 100,   # 每个 channel 最多积压多少条消息
+            "expiry": 60,      # 秒，消息多久没被取走就丢弃
+            # socket 路径，默认 <临时目录>/livemeeting-<uid>/channels-<BASE_DIR 的哈希>.sock（每个部署一个）；
+            # 所在目录必须属于运行用户且其他用户不可写
+            # "path": BASE_DIR / "run" / "channels.sock",
+        },
+
+        # 开发测试也可以用 InMemory（只能单进程）
+        # "BACKEND": "channels.layers.InMemoryChannelLayer",
 
         # 生产环境推荐 Redis
         # "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -152,6 +180,67 @@ CHANNEL_LAYERS = {
     }
 }
 
+# board 内存状态回写策略（board/state.py）
+BOARD_STATE_FLUSH_INTERVAL = 2.0     # 秒，脏数据最长停留时间
+BOARD_STATE_FLUSH_MAX_PENDING = 50   # 累积多少条操作后立即写回
+BOARD_SNAPSHOT_EVERY = 500           # 累积多少条日志后压缩成快照
+BOARD_SNAPSHOT_MAX_AGE = 600         # 秒，快照最长多久刷新一次
+BOARD_INIT_CHUNK_BYTES = 64 * 1024   # 初始状态分块推送，每块最大字节数
+BOARD_COMPRESS_MIN_BYTES = 4 * 1024  # 开启压缩的连接里，超过此大小的帧才压缩
+BOARD_STROKE_TOLERANCE = 0.5         # 笔画简化容差（画布坐标单位）
+BOARD_STROKE_QUANTUM = 0.1           # 笔画坐标量化精度
+BOARD_STROKE_MAX_COORD = 1e7         # 笔画坐标、线宽的绝对值上限，超出或不是有限数的笔画被拒绝
+BOARD_UNDO_WINDOW = 3600             # 图形加入多少秒后不能再撤销；过期后被橡皮擦完全盖住的笔画在压缩时删除
+BOARD_FANOUT_TICK = 0.03             # 秒，广播合并窗口
+BOARD_FANOUT_MAX_BATCH = 200         # 单批最多消息数，攒满立即发送
+BOARD_INDEX_CELL_SIZE = 256          # 空间索引网格边长（画布坐标单位）
+BOARD_TILE_SIZE = 256                # 栅格瓦片边长（像素）
+BOARD_THUMBNAIL_SIZE = (320, 200)    # 缩略图尺寸（像素）
+BOARD_RENDER_DIR = BASE_DIR / 'board_renders'  # 缩略图/瓦片渲染结果目录，所有 worker 共用
+BOARD_RENDER_MAX_FILES = 512         # 每个 board 最多保留多少个渲染文件
+BOARD_RENDER_DELAY = 5.0             # 秒，作废后延迟多久在后台重新渲染
+BOARD_VIEWPORT_FLUSH_INTERVAL = 5.0  # 秒，每个 board 的视图位置最多多久写回一次
+
+# 每个 WebSocket 连接的发送队列（livemeeting/outbox.py，board / chat / sharescreen 共用）
+OUTBOX_WINDOW = 256    # 已发出、客户端未确认的帧数上限，超过后消息留在队列里合并
+OUTBOX_MAX_UNACKED_BYTES = 4 * 1024 * 1024  # 已发出、未确认的字节数上限，不发 ack 的客户端同样受限
+OUTBOX_LIMIT = 1000    # 队列最多积压的消息数，超过后要求客户端重新同步并断开
+OUTBOX_MAX_LAG = 15    # 秒，最早的消息排队超过此时间同样断开
+
+# 聊天历史（chat/history.py）
+CHAT_HISTORY_PAGE = 50         # 进入房间时推送最近多少条，客户端往前翻页每次也取这么多
+CHAT_HISTORY_MAX_PAGE = 200    # /chat/<id>/history?limit= 的上限
+CHAT_WRITE_INTERVAL = 0.2      # 秒，消息先广播，最多攒这么久批量写库（chat/writer.py）
+CHAT_WRITE_BATCH = 200         # 攒够多少条立即写库
+CHAT_SEARCH_PAGE = 20          # 全文搜索每页结果数（chat/search.py，SQLite FTS5）
+CHAT_SEARCH_MAX_RESULTS = 1000 # 全文搜索只对最近这么多条命中排序分页，更早的翻不到（控制每次搜索的耗时）
+CHAT_ARCHIVE_AFTER_DAYS = 90   # manage.py archive_chat 默认把多少天以前的消息移到归档段文件（chat/archive.py）
+CHAT_ARCHIVE_DIR = BASE_DIR / 'chat_archive'  # 归档段文件目录，每个聊天室一个子目录
+
+# /metrics（livemeeting/metrics.py，Prometheus 文本格式）
+METRICS_TOKEN = None   # 设置后抓取时需要带 Authorization: Bearer <token>；不设置时只允许本机直接访问（经代理转发的请求一律拒绝）
+
+# 日志：各模块用 logging 分级输出，高频日志按位置采样（livemeeting/logs.py）
+LOG_LEVEL = "INFO"
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        # 同一处日志每 10 秒最多 5 条，ERROR 及以上不采样
+        "sampled": {"()": "livemeeting.logs.SampleFilter", "interval": 10, "burst": 5},
+    },
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain", "filters": ["sampled"]},
+    },
+    "loggers": {
+        name: {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False}
+        for name in ("board", "chat", "sharescreen", "livemeeting")
+    },
+}
+
 LOGIN_URL = '/'  # 或者你定义的登录页面 URL
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
@@ -0,0 +1,277 @@
+import asyncio
+import fcntl
+import json
+import os
+import shutil
+import socket
+import tempfile
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from chat.routing import websocket_urlpatterns as chat_patterns
+from livemeeting import metrics
+from livemeeting import outbox as outbox_module
+from livemeeting.channel_layer import UnixSocketChannelLayer, default_socket_path
+from livemeeting.outbox import Outbox
+from livemeeting.router import FrontRouter, HashRing, affinity_key, close_after_response
+
+
+class AffinityKeyTests(SimpleTestCase):
+    def test_board_chat_and_sharescreen_paths(self):
+        self.assertEqual(affinity_key("/ws/board/12/"), "board:12")
+        self.assertEqual(affinity_key("/ws/chat/lobby/"), "chat:lobby")
+        self.assertEqual(affinity_key("/ws/sharescreen/42/?x=1"), "sharescreen:42")
+
+    def test_room_names_with_non_word_characters(self):
+        # 路由接受的房间名（chat/routing.py）都要能固定 worker
+        for name in ("team-a", "v1.2", "a_b-c.d"):
+            self.assertIsNotNone(chat_patterns[0].pattern.match(f"ws/chat/{name}/"))
+            self.assertEqual(affinity_key(f"/ws/chat/{name}/"), f"chat:{name}")
+
+    def test_board_renders_follow_the_board(self):
+        self.assertEqual(affinity_key("/board/12/thumbnail.png?v=3"), "board:12")
+        self.assertEqual(affinity_key("/board/12/tiles/-1/0/2.png"), "board:12")
+        self.assertIsNone(affinity_key("/board/12/"))
+
+    def test_other_paths_are_not_pinned(self):
+        self.assertIsNone(affinity_key("/boards/"))
+        self.assertIsNone(affinity_key("/ws/other/1/"))
+        self.assertIsNone(affinity_key("/ws/chat/"))
+
+
+class HashRingTests(SimpleTestCase):
+    def test_same_key_same_node(self):
+        ring = HashRing(["w0", "w1", "w2"])
+        self.assertEqual(ring.get("chat:team-a"), ring.get("chat:team-a"))
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        ring = HashRing(["w0", "w1", "w2"])
+        keys = [f"board:{i}" for i in range(300)]
+        before = {key: ring.get(key) for key in keys}
+        ring.remove("w1")
+        for key in keys:
+            if before[key] != "w1":
+                self.assertEqual(ring.get(key), before[key])
+            else:
+                self.assertIn(ring.get(key), ("w0", "w2"))
+
+
+class FrontRouterTests(SimpleTestCase):
+    def test_plain_requests_are_closed_after_one_response(self):
+        head = b"GET /board/1/thumbnail.png HTTP/1.1\r\nHost: x\r\nConnection: keep-alive\r\nKeep-Alive: timeout=5\r\n\r\n"
+        self.assertEqual(
+            close_after_response(head),
+            b"GET /board/1/thumbnail.png HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n",
+        )
+        upgrade = b"GET /ws/board/1/ HTTP/1.1\r\nConnection: keep-alive, Upgrade\r\nUpgrade: websocket\r\n\r\n"
+        self.assertEqual(close_after_response(upgrade), upgrade)
+
+    async def test_keep_alive_requests_are_routed_one_by_one(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        heads = []
+
+        async def worker(reader, writer):
+            # 和 daphne 一样：请求带 Connection: close 时回完就断开
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                heads.append(head)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+                if b"Connection: close" in head:
+                    break
+            writer.close()
+
+        router = FrontRouter()
+        servers = []
+        for name in ("w0", "w1"):
+            path = os.path.join(directory, f"{name}.sock")
+            servers.append(await asyncio.start_unix_server(worker, path))
+            router.add_worker(name, path)
+        front = await router.serve("127.0.0.1", 0)
+        port = front.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /board/1/thumbnail.png HTTP/1.1\r\nHost: x\r\n\r\n")
+            writer.write(b"GET /board/2/thumbnail.png HTTP/1.1\r\nHost: x\r\n\r\n")
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 2)
+            writer.close()
+        finally:
+            front.close()
+            for server in servers:
+                server.close()
+        # worker 只收到第一个请求并在回复后断开，客户端要用新连接发第二个请求
+        self.assertEqual(response.count(b"HTTP/1.1 200 OK"), 1)
+        self.assertEqual(len(heads), 1)
+        self.assertIn(b"Connection: close", heads[0])
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, "run", "channels.sock")
+        self.layers = []
+
+    def make_layer(self, **config):
+        layer = UnixSocketChannelLayer(path=self.path, **config)
+        self.layers.append(layer)
+        return layer
+
+    async def close_layers(self):
+        for layer in self.layers:
+            await layer.close()
+            if layer.hub is not None:
+                layer.hub.close()
+            if layer._lock_file is not None:
+                layer._lock_file.close()
+
+    def test_default_path_is_per_deployment(self):
+        with override_settings(BASE_DIR="/srv/a"):
+            first = default_socket_path()
+        with override_settings(BASE_DIR="/srv/b"):
+            second = default_socket_path()
+        self.assertNotEqual(first, second)
+        self.assertEqual(os.path.dirname(first), os.path.dirname(second))
+        self.assertIn(str(os.getuid()), os.path.dirname(first))
+
+    async def test_send_and_group_send_between_processes(self):
+        hub, other = self.make_layer(), self.make_layer()
+        try:
+            channel = await hub.new_channel()
+            remote = await other.new_channel()
+            self.assertIsNotNone(hub.hub)
+            self.assertIsNone(other.hub)
+            self.assertEqual(os.stat(os.path.dirname(self.path)).st_mode & 0o777, 0o700)
+
+            await other.send(channel, {"type": "hello", "n": 1})
+            self.assertEqual(await asyncio.wait_for(hub.receive(channel), 2), {"type": "hello", "n": 1})
+
+            await hub.group_add("room", channel)
+            await other.group_add("room", remote)
+            await asyncio.sleep(0.05)
+            await hub.group_send("room", {"type": "broadcast"})
+            self.assertEqual(await asyncio.wait_for(hub.receive(channel), 2), {"type": "broadcast"})
+            self.assertEqual(await asyncio.wait_for(other.receive(remote), 2), {"type": "broadcast"})
+        finally:
+            await self.close_layers()
+
+    async def test_rejects_socket_of_another_user(self):
+        hub = self.make_layer()
+        try:
+            await hub.new_channel()
+            other = self.make_layer()
+            with mock.patch("livemeeting.channel_layer.os.getuid", return_value=os.getuid() + 1):
+                with self.assertRaises(PermissionError):
+                    await other.new_channel()
+        finally:
+            await self.close_layers()
+
+    async def test_rejects_world_writable_socket_and_directory(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o700)
+        planted = socket.socket(socket.AF_UNIX)
+        self.addCleanup(planted.close)
+        planted.bind(self.path)
+        planted.listen()
+        os.chmod(self.path, 0o777)
+        # 锁被别人占着，本进程不会接任 hub，只能连已有的 socket
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            with self.assertRaises(PermissionError):
+                await self.make_layer().new_channel()
+        await self.close_layers()
+
+        os.chmod(os.path.dirname(self.path), 0o777)
+        with self.assertRaises(PermissionError):
+            await self.make_layer().new_channel()
+
+
+class OutboxTests(SimpleTestCase):
+    def setUp(self):
+        for name, value in (("OUTBOX_MAX_UNACKED_BYTES", 100), ("OUTBOX_LIMIT", 5), ("OUTBOX_WINDOW", 1000)):
+            patcher = mock.patch.object(outbox_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.delivered = []
+        self.overflowed = 0
+        self.outbox = Outbox(self.deliver, self.overflow)
+
+    async def deliver(self, messages):
+        for message in messages:
+            self.outbox.record(len(json.dumps(message)))
+            self.delivered.append(message["n"])
+
+    async def overflow(self):
+        self.overflowed += 1
+
+    async def put_all(self, count):
+        for n in range(count):
+            self.outbox.put({"n": n, "pad": "x" * 30})
+            await asyncio.sleep(0)
+
+    async def test_client_without_acks_is_capped_by_bytes(self):
+        await self.put_all(3)
+        # 每帧约 30 多字节，发满 100 字节后暂停
+        self.assertEqual(self.delivered, [0, 1, 2])
+        self.assertTrue(self.outbox.blocked)
+        await self.put_all(6)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.delivered, [0, 1, 2])
+        self.assertEqual(self.overflowed, 1)
+        self.assertTrue(self.outbox.closed)
+
+    async def test_acks_release_the_byte_cap(self):
+        await self.put_all(4)
+        self.assertEqual(len(self.delivered), 3)
+        self.outbox.ack(3)
+        self.assertEqual(self.outbox.unacked_bytes, 0)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.delivered, [0, 1, 2, 3])
+        self.assertEqual(self.overflowed, 0)
+
+    async def test_partial_ack_counts_bytes_of_acked_frames(self):
+        await self.put_all(3)
+        sizes = self.outbox.sent_bytes
+        self.outbox.ack(1)
+        self.assertEqual(self.outbox.unacked_bytes, sizes - len(json.dumps({"n": 0, "pad": "x" * 30})))
+        self.outbox.ack(99)
+        self.assertEqual(self.outbox.acked, 3)
+        self.assertEqual(self.outbox.unacked_bytes, 0)
+
+
+class MetricsViewTests(SimpleTestCase):
+    def get(self, remote_addr="127.0.0.1", **headers):
+        return metrics.metrics_view(RequestFactory().get("/metrics", REMOTE_ADDR=remote_addr, headers=headers))
+
+    def test_without_token_only_local_clients(self):
+        with mock.patch.object(metrics, "METRICS_TOKEN", None):
+            self.assertEqual(self.get("127.0.0.1").status_code, 200)
+            self.assertEqual(self.get("::1").status_code, 200)
+            self.assertEqual(self.get("10.0.0.5").status_code, 403)
+            self.assertEqual(self.get("").status_code, 403)
+
+    def test_without_token_forwarded_requests_are_denied(self):
+        # daphne --proxy-headers 把 REMOTE_ADDR 换成 X-Forwarded-For 的第一项，客户端可以伪造
+        with mock.patch.object(metrics, "METRICS_TOKEN", None):
+            self.assertEqual(self.get("127.0.0.1", **{"X-Forwarded-For": "127.0.0.1, 203.0.113.9"}).status_code, 403)
+            self.assertEqual(self.get("127.0.0.1", **{"X-Real-IP": "203.0.113.9"}).status_code, 403)
+            self.assertEqual(self.get("127.0.0.1", Forwarded="for=127.0.0.1").status_code, 403)
+
+    def test_token_required_when_set(self):
+        with mock.patch.object(metrics, "METRICS_TOKEN", "s3cret"):
+            self.assertEqual(self.get("127.0.0.1").status_code, 403)
+            self.assertEqual(self.get("10.0.0.5", Authorization="Bearer wrong").status_code, 403)
+            self.assertEqual(self.get("10.0.0.5", Authorization="Bearer s3cret").status_code, 200)
+
+    def test_socket_gauge_has_no_room_label(self):
+        metrics.active_sockets.inc(consumer="chat", room="secret-room")
+        self.addCleanup(metrics.active_sockets.dec, consumer="chat")
+        with mock.patch.object(metrics, "METRICS_TOKEN", None):
+            body = self.get().content.decode()
+        self.assertNotIn("secret-room", body)
+        self.assertIn('livemeeting_active_sockets{consumer="chat"}', body)
@@ -5,6 +5,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from . import views  # 导入 index 视图
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,6 +13,7 @@ urlpatterns = [
     path('chat/', include('chat.urls')),
     path("users/", include("users.urls")),
     path("sharescreen/", include("sharescreen.urls")),
+    path("metrics", metrics_view, name="metrics"),  # Prometheus 抓取
     path('', views.index, name='index'),  # 添加根路径 '/'
 ]
 
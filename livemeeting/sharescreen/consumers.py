@@ -1,49 +1,116 @@
 #sharescreen /consumers.py:
 
+import asyncio
 import json
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-rooms = {}  # {room_name: {'owner': channel_name, 'viewers': set()}}
+from livemeeting.metrics import active_sockets, database_sync_to_async, messages_in, messages_out
+from livemeeting.outbox import OutboxMixin
 
-class ShareScreenConsumer(AsyncWebsocketConsumer):
+from .registry import HEARTBEAT, get_rooms
+
+# 房间的 owner / viewers 登记在可插拔的后端里（见 sharescreen/registry.py），多个 worker 共享
+
+# 客户端能发的信令类型，/metrics 按类型计数
+CLIENT_TYPES = {'offer', 'answer', 'candidate', 'ack'}
+
+logger = logging.getLogger(__name__)
+
+class ShareScreenConsumer(OutboxMixin, AsyncWebsocketConsumer):
+    metrics_name = "sharescreen"
     async def connect(self):
+        # 转发来的信令经有界队列发送（见 livemeeting/outbox.py）
+        self.open_outbox()
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f"sharescreen_{self.room_name}"
-
-        if self.room_name not in rooms:
-            rooms[self.room_name] = {'owner': None, 'viewers': set()}
+        self.is_owner = False
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
+        active_sockets.inc(consumer="sharescreen")
+        self.counted = True
 
-        if rooms[self.room_name]['owner'] is None:
-            self.is_owner = True
-            rooms[self.room_name]['owner'] = self.channel_name
-            await self.send(json.dumps({'type': 'role', 'role': 'owner'}))
+        if await self.claim_owner():
+            await self.become_owner()
         else:
-            self.is_owner = False
-            rooms[self.room_name]['viewers'].add(self.channel_name)
-            await self.send(json.dumps({'type': 'role', 'role': 'viewer'}))
-            # 通知 owner
-            owner_channel = rooms[self.room_name]['owner']
-            if owner_channel:
-                await self.channel_layer.send(owner_channel, {
-                    'type': 'new_viewer',
-                    'viewer_id': self.channel_name
-                })
+            await self.become_viewer()
+        self.heartbeat_task = asyncio.ensure_future(self.lease_heartbeat())
 
     async def disconnect(self, close_code):
+        if getattr(self, 'heartbeat_task', None) is not None:
+            self.heartbeat_task.cancel()
+        self.close_outbox()
+        if getattr(self, 'counted', False):
+            active_sockets.dec(consumer="sharescreen")
         if self.is_owner:
-            rooms[self.room_name]['owner'] = None
-            await self.channel_layer.group_send(self.room_group_name, {'type': 'owner_left'})
+            # 租约已经被别人接手时不再通知
+            if await self.release_owner():
+                await self.channel_layer.group_send(self.room_group_name, {'type': 'owner_left'})
         else:
-            rooms[self.room_name]['viewers'].discard(self.channel_name)
+            await self.remove_viewer()
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
+    async def become_owner(self):
+        """拿到租约后调用：告诉客户端，再把已经在等的 viewer 交给它发 offer（例如接手离开 / 崩溃的 owner）"""
+        self.is_owner = True
+        await self.send(json.dumps({'type': 'role', 'role': 'owner'}))
+        messages_out.inc(consumer="sharescreen", type="role")
+        for viewer in await self.get_viewers():
+            if viewer == self.channel_name:
+                continue
+            await self.send(json.dumps({'type': 'new_viewer_joined', 'viewer_id': viewer}))
+            messages_out.inc(consumer="sharescreen", type="new_viewer_joined")
+
+    async def take_over(self):
+        """viewer 在 owner 离开后抢租约，抢到的一个成为新 owner，并通知其他 viewer 重新建立连接"""
+        if self.is_owner or not await self.claim_owner():
+            return False
+        logger.info("sharescreen %s 的 owner 转给 %s", self.room_name, self.channel_name)
+        await self.remove_viewer()
+        await self.channel_layer.group_send(self.room_group_name, {'type': 'owner_changed', 'owner': self.channel_name})
+        await self.become_owner()
+        return True
+
+    async def become_viewer(self):
+        self.is_owner = False
+        await self.add_viewer()
+        await self.send(json.dumps({'type': 'role', 'role': 'viewer'}))
+        messages_out.inc(consumer="sharescreen", type="role")
+        # 通知 owner
+        owner_channel = await self.get_owner()
+        if owner_channel:
+            await self.channel_layer.send(owner_channel, {
+                'type': 'new_viewer',
+                'viewer_id': self.channel_name
+            })
+
+    async def lease_heartbeat(self):
+        """owner 续租；viewer 续期自己的登记，并收回崩溃进程留下的过期租约（广播 owner_left，各 viewer 随后抢租约）"""
+        while True:
+            await asyncio.sleep(HEARTBEAT)
+            try:
+                if self.is_owner:
+                    if not await self.claim_owner():
+                        # 续租太晚，租约已被别人接手
+                        logger.warning("sharescreen %s 的 owner 租约已失效，降为 viewer", self.room_name)
+                        await self.become_viewer()
+                    continue
+                await self.add_viewer()
+                if await self.reap_owner():
+                    await self.channel_layer.group_send(self.room_group_name, {'type': 'owner_left'})
+            except Exception as exc:
+                logger.warning("sharescreen %s 续期失败: %s", self.room_name, exc)
+
     async def receive(self, text_data):
         data = json.loads(text_data)
         msg_type = data.get('type')
         target = data.get('target')
+        messages_in.inc(consumer="sharescreen", type=msg_type if msg_type in CLIENT_TYPES else "other")
+
+        if msg_type == 'ack':
+            self.outbox.ack(data.get('n'))
+            return
 
         if msg_type == 'offer' and not self.is_owner:
             return
@@ -55,10 +122,48 @@ class ShareScreenConsumer(AsyncWebsocketConsumer):
 
     async def signal_message(self, event):
         if event['sender'] != self.channel_name:
-            await self.send(json.dumps(event['message']))
+            self.enqueue(event['message'])
 
     async def owner_left(self, event):
-        await self.send(json.dumps({'type': 'owner_left'}))
+        self.enqueue({'type': 'owner_left'})
+        try:
+            await self.take_over()
+        except Exception as exc:
+            logger.warning("sharescreen %s 接手 owner 失败: %s", self.room_name, exc)
+
+    async def owner_changed(self, event):
+        # 新 owner 会给所有 viewer 发 offer，这里让客户端先重建 viewer 端的连接
+        if event['owner'] != self.channel_name and not self.is_owner:
+            self.enqueue({'type': 'role', 'role': 'viewer'})
 
     async def new_viewer(self, event):
-        await self.send(json.dumps({'type': 'new_viewer_joined', 'viewer_id': event['viewer_id']}))
\ No newline at end of file
+        self.enqueue({'type': 'new_viewer_joined', 'viewer_id': event['viewer_id']})
+
+    # ========== 房间登记（阻塞调用，放在线程里） ==========
+    @database_sync_to_async
+    def claim_owner(self):
+        return get_rooms().claim(self.room_name, self.channel_name)
+
+    @database_sync_to_async
+    def release_owner(self):
+        return get_rooms().release(self.room_name, self.channel_name)
+
+    @database_sync_to_async
+    def reap_owner(self):
+        return get_rooms().reap(self.room_name)
+
+    @database_sync_to_async
+    def get_owner(self):
+        return get_rooms().owner(self.room_name)
+
+    @database_sync_to_async
+    def add_viewer(self):
+        get_rooms().join(self.room_name, self.channel_name)
+
+    @database_sync_to_async
+    def remove_viewer(self):
+        get_rooms().leave(self.room_name, self.channel_name)
+
+    @database_sync_to_async
+    def get_viewers(self):
+        return get_rooms().viewers(self.room_name)
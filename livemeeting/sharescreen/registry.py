@@ -0,0 +1,285 @@
+# sharescreen/registry.py
+#
+# 屏幕共享房间登记（owner + viewers），后端可插拔（settings.SHARESCREEN_ROOMS）：
+#   - LocalRooms   进程内字典，单进程部署 / 开发用
+#   - SQLiteRooms  本机共享的 SQLite 文件，同一台机器上的多个 worker 共享
+#   - RedisRooms   Redis 协议（RESP）的存储，跨机器共享（客户端见 livemeeting/resp.py）
+# owner 是一份租约：claim 原子地“没有 owner / 租约已过期 / 本来就是自己”时才成功，
+# 由 owner 所在进程定期 claim 续期；进程崩溃后租约过期，由 reap 原子地收回（只有一个调用者拿到），
+# 之后新连接可以重新成为 owner。viewer 同样带 TTL，定期续期，过期自动移出。
+# 所有方法都是同步的阻塞调用，consumer 里放在线程中执行。
+
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from livemeeting.resp import RespClient
+
+# owner 租约 / viewer 登记多久没续期就失效（秒）
+LEASE_TTL = getattr(settings, "SHARESCREEN_LEASE_TTL", 15)
+# 续期间隔（秒），应明显小于 LEASE_TTL
+HEARTBEAT = getattr(settings, "SHARESCREEN_HEARTBEAT", 5)
+
+
+class RoomRegistry:
+    """后端接口；conn 是连接的 channel name"""
+
+    def claim(self, room, conn, ttl=None):
+        """成为（或续期）owner，成功返回 True"""
+        raise NotImplementedError
+
+    def release(self, room, conn):
+        """conn 仍是 owner 时放弃，返回是否放弃成功"""
+        raise NotImplementedError
+
+    def reap(self, room):
+        """收回已过期的租约，返回原 owner；没有过期的租约时返回 None"""
+        raise NotImplementedError
+
+    def owner(self, room):
+        raise NotImplementedError
+
+    def join(self, room, conn, ttl=None):
+        """登记（或续期）viewer"""
+        raise NotImplementedError
+
+    def leave(self, room, conn):
+        raise NotImplementedError
+
+    def viewers(self, room):
+        raise NotImplementedError
+
+
+class LocalRooms(RoomRegistry):
+    def __init__(self, **options):
+        self._owners = {}    # room → (conn, expires_at)
+        self._viewers = {}   # room → {conn: expires_at}
+        self._lock = threading.Lock()
+
+    def claim(self, room, conn, ttl=None):
+        now = time.time()
+        with self._lock:
+            current = self._owners.get(room)
+            if current is not None and current[0] != conn and current[1] > now:
+                return False
+            self._owners[room] = (conn, now + (ttl or LEASE_TTL))
+            return True
+
+    def release(self, room, conn):
+        with self._lock:
+            current = self._owners.get(room)
+            if current is None or current[0] != conn:
+                return False
+            del self._owners[room]
+            return True
+
+    def reap(self, room):
+        with self._lock:
+            current = self._owners.get(room)
+            if current is None or current[1] > time.time():
+                return None
+            del self._owners[room]
+            return current[0]
+
+    def owner(self, room):
+        with self._lock:
+            current = self._owners.get(room)
+            return current[0] if current is not None and current[1] > time.time() else None
+
+    def join(self, room, conn, ttl=None):
+        with self._lock:
+            self._viewers.setdefault(room, {})[conn] = time.time() + (ttl or LEASE_TTL)
+
+    def leave(self, room, conn):
+        with self._lock:
+            viewers = self._viewers.get(room)
+            if viewers is not None:
+                viewers.pop(conn, None)
+                if not viewers:
+                    del self._viewers[room]
+
+    def viewers(self, room):
+        now = time.time()
+        with self._lock:
+            viewers = self._viewers.get(room, {})
+            for conn in [c for c, expires in viewers.items() if expires <= now]:
+                del viewers[conn]
+            return sorted(viewers)
+
+
+class SQLiteRooms(RoomRegistry):
+    """同一台机器上多个进程共享的 SQLite 文件（WAL 模式），每个线程一个连接
+
+    claim / release / reap 都是单条语句，靠 SQLite 的写锁保证原子性。
+    """
+
+    def __init__(self, path=None, **options):
+        self.path = str(path or settings.BASE_DIR / "sharescreen.sqlite3")
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS share_owner ("
+                " room TEXT PRIMARY KEY, conn TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS share_viewer ("
+                " room TEXT NOT NULL, conn TEXT NOT NULL, expires REAL NOT NULL, PRIMARY KEY (room, conn))"
+            )
+
+    def claim(self, room, conn, ttl=None):
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "INSERT INTO share_owner (room, conn, expires) VALUES (?, ?, ?)"
+                " ON CONFLICT (room) DO UPDATE SET conn = excluded.conn, expires = excluded.expires"
+                " WHERE share_owner.conn = excluded.conn OR share_owner.expires <= ?",
+                (room, conn, now + (ttl or LEASE_TTL), now),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, room, conn):
+        with self._connect() as db:
+            cursor = db.execute("DELETE FROM share_owner WHERE room = ? AND conn = ?", (room, conn))
+            return cursor.rowcount == 1
+
+    def reap(self, room):
+        with self._connect() as db:
+            row = db.execute(
+                "DELETE FROM share_owner WHERE room = ? AND expires <= ? RETURNING conn",
+                (room, time.time()),
+            ).fetchone()
+            return row[0] if row else None
+
+    def owner(self, room):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT conn FROM share_owner WHERE room = ? AND expires > ?", (room, time.time())
+            ).fetchone()
+            return row[0] if row else None
+
+    def join(self, room, conn, ttl=None):
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO share_viewer (room, conn, expires) VALUES (?, ?, ?)"
+                " ON CONFLICT (room, conn) DO UPDATE SET expires = excluded.expires",
+                (room, conn, time.time() + (ttl or LEASE_TTL)),
+            )
+
+    def leave(self, room, conn):
+        with self._connect() as db:
+            db.execute("DELETE FROM share_viewer WHERE room = ? AND conn = ?", (room, conn))
+
+    def viewers(self, room):
+        with self._connect() as db:
+            db.execute("DELETE FROM share_viewer WHERE room = ? AND expires <= ?", (room, time.time()))
+            rows = db.execute("SELECT conn FROM share_viewer WHERE room = ? ORDER BY conn", (room,))
+            return [row[0] for row in rows]
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+
+# owner 租约存成 "<conn>|<过期时间>"，比较和修改放在 Lua 脚本里，服务端原子执行
+_CLAIM = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local sep = string.find(current, '|', 1, true)
+    local conn, expires = string.sub(current, 1, sep - 1), tonumber(string.sub(current, sep + 1))
+    if conn ~= ARGV[1] and expires > tonumber(ARGV[2]) then return 0 end
+end
+redis.call('SET', KEYS[1], ARGV[1] .. '|' .. ARGV[3], 'PX', ARGV[4])
+return 1
+"""
+_RELEASE = """
+local current = redis.call('GET', KEYS[1])
+if current and string.sub(current, 1, string.find(current, '|', 1, true) - 1) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+_REAP = """
+local current = redis.call('GET', KEYS[1])
+if not current then return false end
+local sep = string.find(current, '|', 1, true)
+if tonumber(string.sub(current, sep + 1)) > tonumber(ARGV[1]) then return false end
+redis.call('DEL', KEYS[1])
+return string.sub(current, 1, sep - 1)
+"""
+
+
+class RedisRooms(RoomRegistry):
+    """owner 是一个字符串键（租约，原子操作用 Lua 脚本）；viewer 是有序集合，score = 过期时间
+
+    过期时间由各 worker 的本地时钟计算，机器之间需要大致对时。
+    owner 键另设 Redis 过期（租约的两倍），没人 reap 的房间也不会一直留着。
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", prefix="sharescreen:", timeout=2.0, **options):
+        self.prefix = prefix
+        self._command = RespClient(url, timeout).command
+
+    def claim(self, room, conn, ttl=None):
+        ttl = ttl or LEASE_TTL
+        now = time.time()
+        return self._command(
+            "EVAL", _CLAIM, 1, self._owner_key(room), conn, now, now + ttl, int(ttl * 2000)
+        ) == 1
+
+    def release(self, room, conn):
+        return self._command("EVAL", _RELEASE, 1, self._owner_key(room), conn) == 1
+
+    def reap(self, room):
+        conn = self._command("EVAL", _REAP, 1, self._owner_key(room), time.time())
+        return conn.decode() if conn else None
+
+    def owner(self, room):
+        current = self._command("GET", self._owner_key(room))
+        if not current:
+            return None
+        conn, expires = current.decode().rsplit("|", 1)
+        return conn if float(expires) > time.time() else None
+
+    def join(self, room, conn, ttl=None):
+        ttl = ttl or LEASE_TTL
+        key = self._viewers_key(room)
+        self._command("ZADD", key, time.time() + ttl, conn)
+        self._command("EXPIRE", key, int(ttl * 2))
+
+    def leave(self, room, conn):
+        self._command("ZREM", self._viewers_key(room), conn)
+
+    def viewers(self, room):
+        key = self._viewers_key(room)
+        self._command("ZREMRANGEBYSCORE", key, "-inf", time.time())
+        return sorted(m.decode() for m in self._command("ZRANGE", key, 0, -1) or [])
+
+    def _owner_key(self, room):
+        return f"{self.prefix}{room}:owner"
+
+    def _viewers_key(self, room):
+        return f"{self.prefix}{room}:viewers"
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_rooms():
+    """按 settings.SHARESCREEN_ROOMS 创建（并缓存）房间登记后端"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                config = getattr(settings, "SHARESCREEN_ROOMS", {})
+                backend = import_string(config.get("BACKEND", "sharescreen.registry.LocalRooms"))
+                _registry = backend(**config.get("OPTIONS", {}))
+    return _registry
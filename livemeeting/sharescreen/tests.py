@@ -1,3 +1,111 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from . import consumers, registry
+from .registry import LocalRooms, SQLiteRooms
+from .routing import websocket_urlpatterns
+
+
+class RoomRegistryMixin:
+    """LocalRooms / SQLiteRooms 共用的行为测试"""
+
+    def make_registry(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.rooms = self.make_registry()
+
+    def test_only_one_owner_until_release(self):
+        self.assertTrue(self.rooms.claim("r", "a"))
+        self.assertFalse(self.rooms.claim("r", "b"))
+        self.assertTrue(self.rooms.claim("r", "a"))   # 续期
+        self.assertEqual(self.rooms.owner("r"), "a")
+        self.assertFalse(self.rooms.release("r", "b"))
+        self.assertTrue(self.rooms.release("r", "a"))
+        self.assertIsNone(self.rooms.owner("r"))
+        self.assertTrue(self.rooms.claim("r", "b"))
+
+    def test_expired_lease_is_reaped_once(self):
+        self.assertTrue(self.rooms.claim("r", "a", ttl=0.05))
+        self.assertIsNone(self.rooms.reap("r"))
+        time.sleep(0.1)
+        self.assertIsNone(self.rooms.owner("r"))
+        self.assertEqual(self.rooms.reap("r"), "a")
+        self.assertIsNone(self.rooms.reap("r"))
+        self.assertTrue(self.rooms.claim("r", "b"))
+
+    def test_viewers_expire_and_leave(self):
+        self.rooms.join("r", "v1")
+        self.rooms.join("r", "v2", ttl=0.05)
+        self.rooms.join("other", "v3")
+        time.sleep(0.1)
+        self.assertEqual(self.rooms.viewers("r"), ["v1"])
+        self.rooms.leave("r", "v1")
+        self.assertEqual(self.rooms.viewers("r"), [])
+        self.assertEqual(self.rooms.viewers("other"), ["v3"])
+
+
+class LocalRoomsTests(RoomRegistryMixin, SimpleTestCase):
+    def make_registry(self):
+        return LocalRooms()
+
+
+class SQLiteRoomsTests(RoomRegistryMixin, SimpleTestCase):
+    def make_registry(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        return SQLiteRooms(path=os.path.join(self.directory.name, "rooms.sqlite3"))
+
+    def test_shared_between_instances(self):
+        other = SQLiteRooms(path=self.rooms.path)
+        self.assertTrue(self.rooms.claim("r", "a"))
+        self.assertFalse(other.claim("r", "b"))
+        self.assertEqual(other.owner("r"), "a")
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class OwnerFailoverTests(SimpleTestCase):
+    def setUp(self):
+        self.rooms = LocalRooms()
+        for patcher in (mock.patch.object(registry, "_registry", self.rooms),
+                        mock.patch.object(consumers, "HEARTBEAT", 0.05)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def join(self, role):
+        communicator = WebsocketCommunicator(self.application, "/ws/sharescreen/r1/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(await communicator.receive_json_from(), {"type": "role", "role": role})
+        return communicator
+
+    async def next_role(self, communicator):
+        while True:
+            message = await communicator.receive_json_from(timeout=2)
+            if message.get("type") == "role":
+                return message["role"]
+
+    async def test_a_viewer_takes_over_when_the_owner_leaves(self):
+        owner = await self.join("owner")
+        viewers = [await self.join("viewer"), await self.join("viewer")]
+        await owner.disconnect()
+        roles = [await self.next_role(viewer) for viewer in viewers]
+        self.assertEqual(sorted(roles), ["owner", "viewer"])
+        self.assertNotIn(self.rooms.owner("r1"), (None,) + tuple(self.rooms.viewers("r1")))
+        self.assertEqual(len(self.rooms.viewers("r1")), 1)
+        for viewer in viewers:
+            await viewer.disconnect()
+
+    async def test_reaper_takes_over_an_expired_lease(self):
+        self.assertTrue(self.rooms.claim("r1", "crashed", ttl=0.1))
+        viewer = await self.join("viewer")
+        self.assertEqual(await self.next_role(viewer), "owner")
+        self.assertNotEqual(self.rooms.owner("r1"), "crashed")
+        await viewer.disconnect()
@@ -13,6 +13,8 @@ document.addEventListener('DOMContentLoaded', () => {
   let offsetX = 0, offsetY = 0;
   const undoStack = [];
   const redoStack = [];
+  // Undo window (seconds) and server clock offset, both from init_begin
+  let undoWindow = null, serverClockOffset = 0;
   let currentPath = [];
   let shapeStart = null;
 
@@ -142,27 +144,282 @@ document.addEventListener('DOMContentLoaded', () => {
   ctx.lineJoin = 'round';
 
   // === WebSocket ===
-  if (!window.socket) {
-    window.socket = new WebSocket(`${location.protocol==='https:'?'wss':'ws'}://${location.host}/ws/board/${BOARD_ID}/`);
+  // lastSeq: last board action sequence number we have applied.
+  // On reconnect it is sent as ?since= so the server only replays the missing tail.
+  let lastSeq = null;
+  let reconnectDelay = 1000;
+
+  // Large frames are deflate-compressed by the server when the browser can inflate them
+  const canInflate = typeof DecompressionStream !== 'undefined';
+  let initMode = null;
+  // Binary sub-protocol (see board/codec.py): strokes and pans travel as compact binary frames
+  let binaryProtocol = false;
+  // Viewport loading: the first paint only gets on-screen items, the rest is fetched while panning.
+  // Snapshot items carry their draw order `z`; anything drawn after the snapshot arrives live.
+  let viewportHorizon = null;
+  const itemOrder = new WeakMap();
+  const loadedOrders = new Set();
+  const loadedRects = [];
+  // Presence: the server sends the full user_list once, then versioned user_joined / user_left deltas.
+  // A delta that skips a version means we missed one, so we ask for the full list again.
+  let presenceVersion = null;
+  const onlineUsers = new Map();
+  // Follow mode: the board owner presents; followers get the presenter's pans, everyone's own view is saved per user.
+  // Panning yourself stops following until the follow button is pressed again.
+  let following = true, presenterId = null;
+  // Flow control (livemeeting/outbox.py): we report how many frames we have processed so the server
+  // can hold back, coalesce or finally drop us with a "resync" hint instead of buffering without bound.
+  const ACK_EVERY = 32, ACK_DELAY = 500;
+  let framesReceived = 0, framesAcked = 0, ackTimer = null;
+  let viewportTimer = null;
+  // Server-rendered raster tiles (board/tiles.py) painted under the canvas until the vector state has loaded
+  const TILE_SIZE = 256, MIN_TILE_ZOOM = -4, MAX_TILE_ZOOM = 3;
+  let backdrop = [];
+
+  function connectSocket() {
+    const params = new URLSearchParams();
+    if (lastSeq !== null) params.set('since', lastSeq);
+    if (canInflate) params.set('compress', 'deflate');
+    params.set('viewport', `${canvas.width},${canvas.height}`);
+    if (viewportHorizon !== null) params.set('horizon', viewportHorizon);
+    if (!following) params.set('follow', '0');
+    const query = params.toString() ? `?${params}` : '';
+    window.socket = new WebSocket(`${location.protocol==='https:'?'wss':'ws'}://${location.host}/ws/board/${BOARD_ID}/${query}`, [BINARY_SUBPROTOCOL]);
+    socket.binaryType = 'arraybuffer';
+    socket.onopen = () => {
+      console.log('✅ WebSocket connected');
+      reconnectDelay = 1000;
+      binaryProtocol = socket.protocol === BINARY_SUBPROTOCOL;
+      framesReceived = framesAcked = 0;
+    };
+    socket.onclose = () => {
+      console.warn('⚠️ WebSocket closed, reconnecting...');
+      presenceVersion = null;
+      clearTimeout(ackTimer);
+      ackTimer = null;
+      setTimeout(connectSocket, reconnectDelay);
+      reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+    };
+    socket.onerror = err => console.error('❌ WebSocket error', err);
+    socket.onmessage = onSocketMessage;
+  }
+
+  // Compressed frames need an async inflate, so frames are decoded through a promise chain to keep their order
+  let inbound = Promise.resolve();
+  function onSocketMessage(e) {
+    const source = e.target;
+    inbound = inbound
+      .then(() => decodeFrame(e.data))
+      .then(handlePayload)
+      .catch(err => console.error("❌ WebSocket message error", err, e.data))
+      .then(() => { if (source === socket) ackFrame(); });
+  }
+
+  // Acks count frames once they have been applied, so a slow tab is seen as slow by the server
+  function ackFrame() {
+    framesReceived++;
+    if (framesReceived - framesAcked >= ACK_EVERY) sendAck();
+    else if (ackTimer === null) ackTimer = setTimeout(sendAck, ACK_DELAY);
+  }
+
+  function sendAck() {
+    clearTimeout(ackTimer);
+    ackTimer = null;
+    if (framesReceived === framesAcked) return;
+    framesAcked = framesReceived;
+    sendToSocket({type: 'ack', n: framesReceived});
+  }
+
+  async function decodeFrame(data) {
+    if (typeof data === 'string') return JSON.parse(data);
+    if (!binaryProtocol) return JSON.parse(await inflate(data));
+    const bytes = new Uint8Array(data);
+    switch (bytes[0]) {
+      case TAG_JSON: return JSON.parse(textDecoder.decode(bytes.subarray(1)));
+      case TAG_DEFLATE_JSON: return JSON.parse(await inflate(bytes.subarray(1)));
+      case TAG_STROKE: return {type: 'board.message', message: decodeStrokeFrame(data)};
+      case TAG_PAN: return {type: 'board.message', message: decodePanFrame(data)};
+      case TAG_BATCH: return {type: 'board.batch', messages: decodeBatchFrame(bytes)};
+    }
+    throw new Error(`Unknown frame tag ${bytes[0]}`);
+  }
+
+  // BATCH: varint length-prefixed sub-frames (STROKE / PAN / JSON message)
+  function decodeBatchFrame(bytes) {
+    const messages = [];
+    let offset = 1;
+    while (offset < bytes.length) {
+      let length = 0, scale = 1, b;
+      do { b = bytes[offset++]; length += (b & 0x7f) * scale; scale *= 128; } while (b & 0x80);
+      const sub = bytes.slice(offset, offset + length);
+      offset += length;
+      if (sub[0] === TAG_STROKE) messages.push(decodeStrokeFrame(sub.buffer));
+      else if (sub[0] === TAG_PAN) messages.push(decodePanFrame(sub.buffer));
+      else if (sub[0] === TAG_JSON) messages.push(JSON.parse(textDecoder.decode(sub.subarray(1))));
+    }
+    return messages;
+  }
+
+  async function inflate(data) {
+    const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Response(stream).text();
+  }
+
+  // === Binary frame codec (layout documented in board/codec.py) ===
+  const BINARY_SUBPROTOCOL = 'livemeeting.board.v1';
+  const TAG_JSON = 0x01, TAG_DEFLATE_JSON = 0x02, TAG_STROKE = 0x10, TAG_PAN = 0x11, TAG_BATCH = 0x20;
+  const FLAG_ERASE = 0x01, FLAG_COLOR = 0x02, FLAG_SEQ = 0x04;
+  const STROKE_HEADER = 25, PAN_HEADER = 30;
+  const STROKE_QUANTUM = 0.1;
+  const textDecoder = new TextDecoder();
+  const textEncoder = new TextEncoder();
+
+  function decodeStrokeFrame(buffer) {
+    const view = new DataView(buffer);
+    const flags = view.getUint8(1);
+    const data = {};
+    if (flags & FLAG_COLOR) {
+      data.color = '#' + [14, 15, 16].map(i => view.getUint8(i).toString(16).padStart(2, '0')).join('');
+    }
+    data.lineWidth = view.getFloat64(6);
+    data.q = view.getFloat64(17);
+    const bytes = new Uint8Array(buffer);
+    let offset = STROKE_HEADER;
+    const readVarint = () => {
+      let value = 0, scale = 1, b;
+      do { b = bytes[offset++]; value += (b & 0x7f) * scale; scale *= 128; } while (b & 0x80);
+      return value;
+    };
+    const count = readVarint();
+    data.pts = new Array(count);
+    for (let i = 0; i < count; i++) {
+      const z = readVarint();
+      data.pts[i] = z % 2 === 0 ? z / 2 : -(z + 1) / 2;
+    }
+    const msg = {type: flags & FLAG_ERASE ? 'erase' : 'path', data};
+    return applyFrameExtra(msg, view, flags, bytes.subarray(offset));
+  }
+
+  function decodePanFrame(buffer) {
+    const view = new DataView(buffer);
+    const msg = {type: 'pan', data: {offsetX: view.getFloat64(6), offsetY: view.getFloat64(14), scale: view.getFloat64(22)}};
+    return applyFrameExtra(msg, view, view.getUint8(1), new Uint8Array(buffer, PAN_HEADER));
+  }
+
+  function applyFrameExtra(msg, view, flags, extraBytes) {
+    if (extraBytes.length) {
+      const extra = JSON.parse(textDecoder.decode(extraBytes));
+      Object.assign(msg.data, extra.d || {});
+      for (const [k, v] of Object.entries(extra.m || {})) if (!(k in msg)) msg[k] = v;
+    }
+    if (flags & FLAG_SEQ) msg.seq = view.getUint32(2);
+    return msg;
+  }
+
+  // Encode our own path / erase / pan messages; returns null for anything else (sent as JSON)
+  function encodeBinaryMessage(obj) {
+    const data = obj.data;
+    if (!data) return null;
+    const extraTop = {};
+    for (const k of Object.keys(obj)) if (k !== 'type' && k !== 'data') extraTop[k] = obj[k];
+    if ((obj.type === 'path' || obj.type === 'erase') && Array.isArray(data.points)) {
+      const varints = [];
+      let px = 0, py = 0, count = 0;
+      const values = [];
+      for (const p of data.points) {
+        const x = Math.round(p.x / STROKE_QUANTUM), y = Math.round(p.y / STROKE_QUANTUM);
+        values.push(x - px, y - py); px = x; py = y; count += 2;
+      }
+      for (const v of [count, ...values.map(v => v >= 0 ? v * 2 : -v * 2 - 1)]) {
+        let z = v;
+        while (z >= 0x80) { varints.push((z % 128) | 0x80); z = Math.floor(z / 128); }
+        varints.push(z);
+      }
+      const extraData = {};
+      for (const k of Object.keys(data)) if (!['points', 'color', 'lineWidth'].includes(k)) extraData[k] = data[k];
+      const hasColor = typeof data.color === 'string' && /^#[0-9a-fA-F]{6}$/.test(data.color);
+      if (!hasColor && data.color !== undefined && data.color !== null) extraData.color = data.color;
+      const extra = encodeFrameExtra(extraTop, extraData);
+      const buffer = new ArrayBuffer(STROKE_HEADER + varints.length + extra.length);
+      const view = new DataView(buffer);
+      view.setUint8(0, TAG_STROKE);
+      view.setUint8(1, (obj.type === 'erase' ? FLAG_ERASE : 0) | (hasColor ? FLAG_COLOR : 0));
+      view.setFloat64(6, Number(data.lineWidth) || 0);
+      if (hasColor) for (let i = 0; i < 3; i++) view.setUint8(14 + i, parseInt(data.color.substr(1 + i * 2, 2), 16));
+      view.setFloat64(17, STROKE_QUANTUM);
+      const bytes = new Uint8Array(buffer);
+      bytes.set(varints, STROKE_HEADER);
+      bytes.set(extra, STROKE_HEADER + varints.length);
+      return buffer;
+    }
+    if (obj.type === 'pan' && typeof data.offsetX === 'number' && typeof data.offsetY === 'number') {
+      const extraData = {};
+      for (const k of Object.keys(data)) if (!['offsetX', 'offsetY', 'scale'].includes(k)) extraData[k] = data[k];
+      const extra = encodeFrameExtra(extraTop, extraData);
+      const buffer = new ArrayBuffer(PAN_HEADER + extra.length);
+      const view = new DataView(buffer);
+      view.setUint8(0, TAG_PAN);
+      view.setFloat64(6, data.offsetX);
+      view.setFloat64(14, data.offsetY);
+      view.setFloat64(22, data.scale || 1);
+      new Uint8Array(buffer).set(extra, PAN_HEADER);
+      return buffer;
+    }
+    return null;
+  }
+
+  function encodeFrameExtra(top, data) {
+    const extra = {};
+    if (Object.keys(top).length) extra.m = top;
+    if (Object.keys(data).length) extra.d = data;
+    return Object.keys(extra).length ? textEncoder.encode(JSON.stringify(extra)) : new Uint8Array(0);
   }
-  socket.onopen = () => console.log('✅ WebSocket connected');
-  socket.onclose = () => console.warn('⚠️ WebSocket closed');
-  socket.onerror = err => console.error('❌ WebSocket error', err);
-  socket.onmessage = e => {
 
-    let payload;
-    try { 
-        payload = JSON.parse(e.data); 
-    } catch(err){ 
-        console.error("❌ WebSocket JSON parse error", err, e.data);
-        return; 
+  function handlePayload(payload) {
+    // === Initial state stream: init_begin → init_chunk* → init_end ===
+    if(payload.type === "init_chunk"){
+      for(const action of payload.actions || []){
+        if(!action) continue;
+        if(initMode === 'full') undoStack.push(action);
+        else if(initMode === 'viewport') insertLoadedAction(action);
+        else handleBoardMessage(action);   // tail: replay like live messages
+      }
+      return;
+    }
+    if(payload.type === "viewport_chunk"){
+      for(const action of payload.actions || []) if(action) insertLoadedAction(action);
+      redrawCanvas();
+      return;
+    }
+    if(payload.type === "init_end"){
+      lastSeq = payload.seq;
+      initMode = null;
+      backdrop = [];
+      redrawCanvas();
+      return;
+    }
+
+    // Messages coalesced by the server fanout tick, in delivery order
+    if(payload.type === "board.batch"){
+      for(const message of payload.messages || []) handleBoardMessage(message);
+      return;
     }
 
     let msg = payload;
 
     if(payload.type === "board.message" && payload.message){
         msg = payload.message; // 🔹 Use local variable
-        console.log("📤 Unpacked board.message:", msg);
+    }
+    handleBoardMessage(msg);
+  }
+
+  function handleBoardMessage(msg) {
+    if(msg.seq !== undefined && msg.type !== 'init_begin'){
+      // Already covered by the initial state we received
+      if(lastSeq !== null && msg.seq <= lastSeq) return;
+      lastSeq = msg.seq;
+      const {seq, ...action} = msg;
+      msg = action;
     }
 
 function updateOnlineDot(userList){
@@ -193,14 +450,46 @@ function updateOnlineDot(userList){
 
 
     if(msg.type === "user_list" && Array.isArray(msg.users)){
-      updateOnlineDot(msg.users);
+      if(msg.version === undefined || presenceVersion === null || msg.version >= presenceVersion){
+        presenceVersion = msg.version ?? null;
+        onlineUsers.clear();
+        msg.users.forEach(u => onlineUsers.set(String(u.id), u));
+        updateOnlineDot([...onlineUsers.values()]);
+      }
+    } else if(msg.type === "user_joined" || msg.type === "user_left"){
+      // Deltas before the base list, or already covered by it, are ignored
+      if(presenceVersion === null || msg.version <= presenceVersion) return;
+      if(msg.version !== presenceVersion + 1){
+        presenceVersion = null;
+        sendToSocket({type: 'presence_sync'});
+        return;
+      }
+      presenceVersion = msg.version;
+      if(msg.type === "user_joined") onlineUsers.set(String(msg.user.id), msg.user);
+      else onlineUsers.delete(String(msg.user_id));
+      updateOnlineDot([...onlineUsers.values()]);
+      return;
     }
 
-    if(msg.type === "init_state") {
-      undoStack.length=0; redoStack.length=0;
-      const stateList = msg.state || [];
-      for(const action of stateList) if(action) undoStack.push(action);
-      redrawCanvas();
+    if(msg.type === "init_begin") {
+      initMode = msg.mode;
+      if(msg.mode !== 'tail'){ undoStack.length=0; redoStack.length=0; loadedOrders.clear(); loadedRects.length=0; }
+      if(msg.mode === 'viewport') loadedRects.push(msg.rect);
+      if(msg.mode !== 'tail'){
+        if(msg.pan){ offsetX = msg.pan.offsetX; offsetY = msg.pan.offsetY; scale = msg.pan.scale || scale; }
+        loadTileBackdrop(msg.seq);
+      }
+      viewportHorizon = msg.horizon ?? null;
+      if(msg.undo_window !== undefined){
+        undoWindow = msg.undo_window;
+        serverClockOffset = msg.now - Date.now() / 1000;
+      }
+      if(msg.presenter !== undefined){
+        presenterId = msg.presenter;
+        following = !!msg.following;
+        updateFollowButton();
+      }
+      console.log(`⏳ Loading board: ${msg.total} actions (${msg.mode})`);
       // If someone is already sharing screen
       hideShareNotice(); // Hide first
       if(msg.current_sharescreen && Number(msg.current_sharescreen) !== Number(user_id)){
@@ -213,7 +502,11 @@ function updateOnlineDot(userList){
         }
 
     } else if(['path','erase','rect','circle','text','clear'].includes(msg.type)) {
-      undoStack.push(msg); redrawCanvas();
+      // Our own drawing echoed back: swap in the server's (encoded) copy instead of drawing it twice
+      const idx = msg.id ? undoStack.findIndex(a => a.id === msg.id) : -1;
+      if(idx !== -1) undoStack[idx] = msg;
+      else undoStack.push(msg);
+      redrawCanvas();
     } else if(msg.type === 'pan') {
       if(msg.data) {
         offsetX = msg.data.offsetX;
@@ -222,19 +515,35 @@ function updateOnlineDot(userList){
         redrawCanvas();
       }
     } else if(msg.type === "undo") {
-      if(msg.action){
-        const idx = undoStack.findIndex(a => JSON.stringify(a) === JSON.stringify(msg.action));
-        if(idx!==-1) undoStack.splice(idx,1);
-        redoStack.push(msg.action);
+      const idx = msg.id ? undoStack.findIndex(a => a.id === msg.id)
+        : msg.action ? undoStack.findIndex(a => JSON.stringify(a) === JSON.stringify(msg.action)) : -1;
+      if(idx!==-1){
+        const [action] = undoStack.splice(idx,1);
+        // Undone from another tab of ours: keep it redoable here too
+        if(Number(msg.user) === Number(user_id) && !redoStack.some(a => a.id === action.id)) redoStack.push(action);
         redrawCanvas();
       }
     } else if(msg.type==="redo"){
       if(msg.action){
-        const idx = redoStack.findIndex(a => JSON.stringify(a)===JSON.stringify(msg.action));
-        if(idx!==-1) redoStack.splice(idx,1);
-        undoStack.push(msg.action);
+        const same = a => msg.action.id ? a.id === msg.action.id : JSON.stringify(a)===JSON.stringify(msg.action);
+        const ridx = redoStack.findIndex(same);
+        if(ridx!==-1) redoStack.splice(ridx,1);
+        const idx = undoStack.findIndex(same);
+        if(idx!==-1) undoStack[idx] = msg.action;
+        else undoStack.push(msg.action);
         redrawCanvas();
       }
+    } else if(msg.type === "conflict"){
+      console.warn(`⚠️ ${msg.op} rejected by the server (target changed)`, msg.id);
+    } else if(msg.type === "resync"){
+      // "lag": we fell too far behind; reconnect and replay the missing tail from lastSeq.
+      // Otherwise the server state was reloaded and our seq numbers are stale, so reload everything.
+      if(msg.reason !== "lag"){
+        lastSeq = null;
+        viewportHorizon = null;
+      }
+      socket.close();
+      return;
     }
     // === Handle Share Screen messages ===
     if(msg.type === "sharescreen"){
@@ -258,7 +567,9 @@ function updateOnlineDot(userList){
         showVideoPopup(msg.current_sharevideo.video_url);
     }
 
-  };
+  }
+
+  connectSocket();
 
   // --- Toolbar bindings ---
   const colorPicker = document.getElementById('color-picker');
@@ -293,15 +604,38 @@ function updateOnlineDot(userList){
 
   if(zoomInBtn) zoomInBtn.addEventListener('click', ()=>{
     scale *= 1.2; redrawCanvas();
-    sendToSocket({type:'pan', data:{offsetX, offsetY, scale}});
+    sendPan();
   });
 
   if(zoomOutBtn) zoomOutBtn.addEventListener('click', ()=>{
     scale /= 1.2; redrawCanvas();
-    sendToSocket({type:'pan', data:{offsetX, offsetY, scale}});
+    sendPan();
   });
 
   if(panBtn) panBtn.addEventListener('click', ()=> setTool('pan'));
+
+  const followBtn = document.getElementById('follow-btn');
+  if(followBtn) followBtn.addEventListener('click', ()=> setFollowing(!following));
+
+  function setFollowing(value){
+    if(following === value) return;
+    following = value;
+    sendToSocket({type: 'follow', follow: value});
+    updateFollowButton();
+  }
+
+  function updateFollowButton(){
+    if(!followBtn) return;
+    const presenting = presenterId !== null && Number(presenterId) === Number(user_id);
+    followBtn.style.display = presenting ? 'none' : '';
+    followBtn.textContent = following ? '👁 Following' : '👁 Follow presenter';
+  }
+
+  // Our own view change: saved per user on the server, broadcast only if we are the presenter
+  function sendPan(){
+    setFollowing(false);
+    sendToSocket({type:'pan', data:{offsetX, offsetY, scale}});
+  }
   
   // === Share Screen event binding ===
   if (shareBtn){
@@ -336,6 +670,26 @@ function updateOnlineDot(userList){
   }
 
   // --- Drawing functions ---
+  // Strokes from the server are simplified and delta-encoded:
+  // data.pts = [x0, y0, dx1, dy1, ...] in units of data.q. Local strokes still use data.points.
+  const expandedPoints = new WeakMap();
+  function strokePoints(data){
+    if(data.points) return data.points;
+    if(!Array.isArray(data.pts)) return [];
+    let points = expandedPoints.get(data);
+    if(!points){
+      points = [];
+      const q = data.q || 1;
+      let x = 0, y = 0;
+      for(let i=0; i+1<data.pts.length; i+=2){
+        x += data.pts[i]; y += data.pts[i+1];
+        points.push({x: x*q, y: y*q});
+      }
+      expandedPoints.set(data, points);
+    }
+    return points;
+  }
+
   function drawPathOnContext(ctx, points, strokeColor, w, composite){
     if(!points||points.length===0) return;
     ctx.save();
@@ -353,8 +707,8 @@ function updateOnlineDot(userList){
     if(!action) return;
     const type=action.type;
     const data=action.data;
-    if(type==='path') drawPathOnContext(ctx,data.points,data.color,data.lineWidth,'source-over');
-    else if(type==='erase') drawPathOnContext(ctx,data.points,null,data.lineWidth,'destination-out');
+    if(type==='path') drawPathOnContext(ctx,strokePoints(data),data.color,data.lineWidth,'source-over');
+    else if(type==='erase') drawPathOnContext(ctx,strokePoints(data),null,data.lineWidth,'destination-out');
     else if(type==='rect'){ ctx.save(); ctx.strokeStyle=data.color; ctx.lineWidth=data.lineWidth / scale; ctx.strokeRect(data.x,data.y,data.width,data.height); ctx.restore(); }
     else if(type==='circle'){ ctx.save(); ctx.strokeStyle=data.color; ctx.lineWidth=data.lineWidth / scale; ctx.beginPath(); ctx.arc(data.x,data.y,data.radius,0,Math.PI*2); ctx.stroke(); ctx.restore(); }
     else if(type==='text'){ renderTextToCanvas(data.text); }
@@ -366,21 +720,112 @@ function updateOnlineDot(userList){
     ctx.clearRect(0,0,canvas.width,canvas.height);
     ctx.save();
     ctx.setTransform(scale,0,0,scale,offsetX,offsetY);
+    for(const tile of backdrop) if(tile.img.complete && tile.img.naturalWidth) ctx.drawImage(tile.img, ...tile.rect);
     for(let action of undoStack) drawAction(action);
     ctx.restore();
+    scheduleViewportFetch();
+  }
+
+  // Fetch the raster tiles covering the screen; `version` is the board seq so they can be cached for good
+  function loadTileBackdrop(version){
+    const zoom = Math.max(MIN_TILE_ZOOM, Math.min(MAX_TILE_ZOOM, Math.round(Math.log2(scale))));
+    const span = TILE_SIZE / 2 ** zoom;
+    const x0 = Math.floor(-offsetX / scale / span), y0 = Math.floor(-offsetY / scale / span);
+    const x1 = Math.floor((canvas.width - offsetX) / scale / span), y1 = Math.floor((canvas.height - offsetY) / scale / span);
+    backdrop = [];
+    for(let x = x0; x <= x1; x++){
+      for(let y = y0; y <= y1; y++){
+        const img = new Image();
+        img.onload = () => { if(initMode !== null) redrawCanvas(); };
+        const tile = {img, rect: [x * span, y * span, span, span]};
+        fetchTile(tile, `/board/${BOARD_ID}/tiles/${zoom}/${x}/${y}.png?v=${version}`, 0);
+        backdrop.push(tile);
+      }
+    }
+  }
+
+  // A tile that is not rendered yet comes back as 202 + placeholder; ask again after Retry-After
+  function fetchTile(tile, url, attempt){
+    fetch(url, {credentials: 'same-origin'}).then(res => {
+      if(!backdrop.includes(tile)) return;
+      if(res.status === 202){
+        if(attempt < 10) setTimeout(() => fetchTile(tile, url, attempt + 1), 1000 * (Number(res.headers.get('Retry-After')) || 1));
+        return;
+      }
+      if(res.ok) return res.blob().then(blob => {
+        const src = URL.createObjectURL(blob);
+        tile.img.addEventListener('load', () => URL.revokeObjectURL(src), {once: true});
+        tile.img.src = src;
+      });
+    }).catch(err => console.error('❌ tile fetch failed', err));
+  }
+
+  // Insert a snapshot item by its draw order, ahead of everything drawn live since the snapshot
+  function insertLoadedAction(item){
+    if(item.type === 'pan'){ handleBoardMessage(item); return; }
+    const {z, ...action} = item;
+    if(z === undefined){ undoStack.push(action); return; }
+    if(loadedOrders.has(z)) return;
+    loadedOrders.add(z);
+    itemOrder.set(action, z);
+    let i = undoStack.length;
+    while(i > 0 && !(itemOrder.get(undoStack[i-1]) < z)) i--;
+    undoStack.splice(i, 0, action);
+  }
+
+  // Ask for snapshot items around the visible area once it leaves what we already loaded
+  function scheduleViewportFetch(){
+    if(viewportHorizon === null) return;
+    clearTimeout(viewportTimer);
+    viewportTimer = setTimeout(() => {
+      const x0 = -offsetX / scale, y0 = -offsetY / scale;
+      const x1 = (canvas.width - offsetX) / scale, y1 = (canvas.height - offsetY) / scale;
+      if(loadedRects.some(r => r && r[0] <= x0 && r[1] <= y0 && r[2] >= x1 && r[3] >= y1)) return;
+      const mx = (x1 - x0) / 2, my = (y1 - y0) / 2;
+      const rect = [x0 - mx, y0 - my, x1 + mx, y1 + my];
+      if(!socket || socket.readyState!==WebSocket.OPEN) return;
+      loadedRects.push(rect);
+      sendToSocket({type: 'viewport', rect});
+    }, 150);
   }
 
   function sendToSocket(obj){
-    if(socket && socket.readyState===WebSocket.OPEN) socket.send(JSON.stringify(obj));
+    if(!socket || socket.readyState!==WebSocket.OPEN) return;
+    const frame = binaryProtocol ? encodeBinaryMessage(obj) : null;
+    socket.send(frame || JSON.stringify(obj));
+  }
+
+  // Every drawing gets an id and our user id, so undo/redo can name exactly what they target
+  function newActionId(){
+    if(window.crypto && crypto.randomUUID) return crypto.randomUUID().replace(/-/g, '');
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+
+  function commitAction(action){
+    action.id = newActionId();
+    action.user = Number(user_id);
+    undoStack.push(action);
+    redoStack.length = 0;
+    sendToSocket(action);
   }
 
   // --- Undo/Redo ---
+  // Undo only ever takes back our own latest drawing, never someone else's.
+  // Drawings older than the server's undo window (stamped with server time t) can no longer be undone;
+  // keep a minute of slack so a request sent at the edge is not rejected after we already removed it locally.
+  function undoable(action){
+    if(undoWindow === null || typeof action.t !== 'number') return true;
+    return Date.now() / 1000 + serverClockOffset - action.t <= undoWindow - 60;
+  }
+
   function undo(){
-    if(undoStack.length===0) return;
-    const action=undoStack.pop();
+    let i = undoStack.length - 1;
+    while(i >= 0 && !(undoStack[i].id && Number(undoStack[i].user) === Number(user_id))) i--;
+    if(i < 0 || !undoable(undoStack[i])) return;
+    const [action] = undoStack.splice(i, 1);
     redoStack.push(action);
     redrawCanvas();
-    sendToSocket({type:'undo', action});
+    sendToSocket({type:'undo', id: action.id});
   }
 
   function redo(){
@@ -414,7 +859,7 @@ function updateOnlineDot(userList){
       const dx=e.clientX-startX, dy=e.clientY-startY;
       offsetX+=dx; offsetY+=dy; startX=e.clientX; startY=e.clientY;
       redrawCanvas();
-      sendToSocket({type:'pan', data:{offsetX, offsetY, scale}});
+      sendPan();
       return;
     }
 
@@ -431,10 +876,10 @@ function updateOnlineDot(userList){
     const x=(e.clientX-rect.left-offsetX)/scale;
     const y=(e.clientY-rect.top-offsetY)/scale;
 
-    if(tool==='pen' && currentPath.length>=2){ const action={type:'path', data:{points:currentPath.slice(), color, lineWidth}}; undoStack.push(action); redoStack.length=0; sendToSocket(action); currentPath=[]; }
-    else if(tool==='eraser' && currentPath.length>=1){ const action={type:'erase', data:{points:currentPath.slice(), lineWidth}}; undoStack.push(action); redoStack.length=0; sendToSocket(action); currentPath=[]; }
-    else if(tool==='rect' && shapeStart){ const w=x-shapeStart.x; const h=y-shapeStart.y; const action={type:'rect', data:{x:shapeStart.x, y:shapeStart.y, width:w, height:h, color, lineWidth}}; undoStack.push(action); redoStack.length=0; sendToSocket(action); shapeStart=null; redrawCanvas(); }
-    else if(tool==='circle' && shapeStart){ const dx=x-shapeStart.x; const dy=y-shapeStart.y; const r=Math.sqrt(dx*dx+dy*dy); const action={type:'circle', data:{x:shapeStart.x, y:shapeStart.y, radius:r, color, lineWidth}}; undoStack.push(action); redoStack.length=0; sendToSocket(action); shapeStart=null; redrawCanvas(); }
+    if(tool==='pen' && currentPath.length>=2){ const action={type:'path', data:{points:currentPath.slice(), color, lineWidth}}; commitAction(action); currentPath=[]; }
+    else if(tool==='eraser' && currentPath.length>=1){ const action={type:'erase', data:{points:currentPath.slice(), lineWidth}}; commitAction(action); currentPath=[]; }
+    else if(tool==='rect' && shapeStart){ const w=x-shapeStart.x; const h=y-shapeStart.y; const action={type:'rect', data:{x:shapeStart.x, y:shapeStart.y, width:w, height:h, color, lineWidth}}; commitAction(action); shapeStart=null; redrawCanvas(); }
+    else if(tool==='circle' && shapeStart){ const dx=x-shapeStart.x; const dy=y-shapeStart.y; const r=Math.sqrt(dx*dx+dy*dy); const action={type:'circle', data:{x:shapeStart.x, y:shapeStart.y, radius:r, color, lineWidth}}; commitAction(action); shapeStart=null; redrawCanvas(); }
   });
 
   canvas.addEventListener('mouseleave', ()=>{ if(drawing){drawing=false; currentPath=[]; shapeStart=null; canvas.style.cursor=tool==='pan'?'grab':'crosshair';} });
@@ -487,7 +932,7 @@ canvas.addEventListener('touchmove', e => {
         startX = e.touches[0].clientX;
         startY = e.touches[0].clientY;
         redrawCanvas();
-        sendToSocket({ type: 'pan', data: { offsetX, offsetY, scale } });
+        sendPan();
         return;
     }
 
@@ -545,23 +990,17 @@ canvas.addEventListener('touchend', e => {
 
     if (tool === 'pen' && currentPath.length >= 2) {
         const action = { type: 'path', data: { points: currentPath.slice(), color, lineWidth } };
-        undoStack.push(action);
-        redoStack.length = 0;
-        sendToSocket(action);
+        commitAction(action);
         currentPath = [];
     } else if (tool === 'eraser' && currentPath.length >= 1) {
         const action = { type: 'erase', data: { points: currentPath.slice(), lineWidth } };
-        undoStack.push(action);
-        redoStack.length = 0;
-        sendToSocket(action);
+        commitAction(action);
         currentPath = [];
     } else if (tool === 'rect' && shapeStart) {
         const w = pos.x - shapeStart.x;
         const h = pos.y - shapeStart.y;
         const action = { type: 'rect', data: { x: shapeStart.x, y: shapeStart.y, width: w, height: h, color, lineWidth } };
-        undoStack.push(action);
-        redoStack.length = 0;
-        sendToSocket(action);
+        commitAction(action);
         shapeStart = null;
         redrawCanvas();
     } else if (tool === 'circle' && shapeStart) {
@@ -569,9 +1008,7 @@ canvas.addEventListener('touchend', e => {
         const dy = pos.y - shapeStart.y;
         const r = Math.sqrt(dx * dx + dy * dy);
         const action = { type: 'circle', data: { x: shapeStart.x, y: shapeStart.y, radius: r, color, lineWidth } };
-        undoStack.push(action);
-        redoStack.length = 0;
-        sendToSocket(action);
+        commitAction(action);
         shapeStart = null;
         redrawCanvas();
     }
@@ -4,20 +4,142 @@ document.addEventListener('DOMContentLoaded', () => {
   if (typeof ROOM_NAME === "undefined") return;
 
   const wsUrl = `${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/ws/chat/${ROOM_NAME}/`;
-  const socket = new WebSocket(wsUrl);
+  let socket = null;
 
   const messages = document.getElementById('messages');
   const input = document.getElementById('chat-input');
   const sendBtn = document.getElementById('send-btn');
 
-  // 接收消息
-  socket.onmessage = (e) => {
-    const data = JSON.parse(e.data);
+  // 流量控制（livemeeting/outbox.py）：定期告诉服务器收到了多少帧
+  const ACK_EVERY = 32, ACK_DELAY = 500;
+  let framesReceived = 0, framesAcked = 0, ackTimer = null;
+
+  // 历史消息分页：before 是已显示的最早一条的游标，null 表示没有更早的了
+  let before = null, loadingOlder = false;
+  const olderBtn = document.createElement('button');
+  olderBtn.textContent = 'Load older messages';
+  olderBtn.style.display = 'none';
+  olderBtn.addEventListener('click', loadOlder);
+  messages.addEventListener('scroll', () => {
+    if (messages.scrollTop === 0) loadOlder();
+  });
+
+  function loadOlder() {
+    if (before === null || loadingOlder || socket.readyState !== WebSocket.OPEN) return;
+    loadingOlder = true;
+    socket.send(JSON.stringify({ type: 'load_older', before }));
+  }
+
+  function renderMessage(data) {
     const div = document.createElement('div');
     div.innerText = `[${data.timestamp || ''}] ${data.user || 'guest'}: ${data.message || ''}`;
-    messages.appendChild(div);
-    messages.scrollTop = messages.scrollHeight;  // 自动滚动
-  };
+    return div;
+  }
+
+  function showHistory(data) {
+    const frag = document.createDocumentFragment();
+    data.messages.forEach(msg => frag.appendChild(renderMessage(msg)));
+    if (data.older) {
+      // 往前翻页：插在最前面，保持当前看到的位置不动
+      const height = messages.scrollHeight;
+      olderBtn.after(frag);
+      messages.scrollTop += messages.scrollHeight - height;
+      loadingOlder = false;
+    } else {
+      // 连接（或重连）后的第一页替换掉页面上已有的消息
+      messages.innerHTML = '';
+      messages.appendChild(olderBtn);
+      messages.appendChild(frag);
+      messages.scrollTop = messages.scrollHeight;
+    }
+    before = data.before;
+    olderBtn.style.display = before === null ? 'none' : '';
+  }
+
+  function sendAck() {
+    clearTimeout(ackTimer);
+    ackTimer = null;
+    if (framesReceived === framesAcked || socket.readyState !== WebSocket.OPEN) return;
+    framesAcked = framesReceived;
+    socket.send(JSON.stringify({ type: 'ack', n: framesReceived }));
+  }
+
+  function connect() {
+    socket = new WebSocket(wsUrl);
+    framesReceived = framesAcked = 0;
+    loadingOlder = false;
+
+    // 接收消息
+    socket.onmessage = (e) => {
+      const data = JSON.parse(e.data);
+      framesReceived++;
+      if (framesReceived - framesAcked >= ACK_EVERY) sendAck();
+      else if (ackTimer === null) ackTimer = setTimeout(sendAck, ACK_DELAY);
+
+      if (data.type === 'resync') {
+        // 积压太多被服务器断开：重连后最近一页历史消息会重新发送
+        socket.onclose = null;
+        socket.close();
+        connect();
+        return;
+      }
+      if (data.type === 'history') {
+        showHistory(data);
+        return;
+      }
+      if (data.type === 'search_results') {
+        showSearchResults(data);
+        return;
+      }
+      messages.appendChild(renderMessage(data));
+      messages.scrollTop = messages.scrollHeight;  // 自动滚动
+    };
+  }
+  connect();
+
+  // 全文搜索（chat/search.py）：结果里的 snippet 已经由服务器转义，命中部分包在 <mark> 里
+  const searchInput = document.getElementById('search-input');
+  const searchAll = document.getElementById('search-all');
+  const searchResults = document.getElementById('search-results');
+  const searchMore = document.getElementById('search-more');
+  let searchQuery = '', searchPage = 1;
+
+  function search(page) {
+    if (!searchQuery || socket.readyState !== WebSocket.OPEN) return;
+    searchPage = page;
+    socket.send(JSON.stringify({ type: 'search', q: searchQuery, page, all: searchAll.checked }));
+  }
+
+  function showSearchResults(data) {
+    if (data.q !== searchQuery) return;  // 已经换了搜索词
+    if (data.page === 1) searchResults.innerHTML = '';
+    if (data.page === 1 && !data.results.length) searchResults.textContent = 'No results.';
+    data.results.forEach(result => {
+      const div = document.createElement('div');
+      const meta = document.createElement('span');
+      meta.innerText = `[${result.timestamp}] ${searchAll.checked ? result.room_name + ' / ' : ''}${result.user}: `;
+      const snippet = document.createElement('span');
+      snippet.innerHTML = result.snippet;
+      div.append(meta, snippet);
+      searchResults.appendChild(div);
+    });
+    searchMore.style.display = data.has_more ? '' : 'none';
+    if (data.truncated && !data.has_more) {
+      const note = document.createElement('div');
+      note.textContent = 'Only the most recent matches are shown; refine the search to find older messages.';
+      searchResults.appendChild(note);
+    }
+  }
+
+  if (searchInput) {
+    searchInput.addEventListener('keydown', (e) => {
+      if (e.key !== 'Enter') return;
+      e.preventDefault();
+      searchQuery = searchInput.value.trim();
+      search(1);
+    });
+    searchMore.addEventListener('click', () => search(searchPage + 1));
+  }
 
   // 发送消息
   function sendMessage() {
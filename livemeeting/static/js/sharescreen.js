@@ -12,9 +12,30 @@ console.log("🔌 Connecting WebSocket to room:", ROOM_NAME);
 ws.onopen = () => console.log("🟢 WebSocket connected");
 ws.onclose = () => console.log("🔴 WebSocket disconnected");
 
+// 流量控制（livemeeting/outbox.py）：定期告诉服务器收到了多少帧
+const ACK_EVERY = 32, ACK_DELAY = 500;
+let framesReceived = 0, framesAcked = 0, ackTimer = null;
+
+function sendAck() {
+    clearTimeout(ackTimer);
+    ackTimer = null;
+    if (framesReceived === framesAcked || ws.readyState !== WebSocket.OPEN) return;
+    framesAcked = framesReceived;
+    ws.send(JSON.stringify({ type: "ack", n: framesReceived }));
+}
+
 ws.onmessage = async (event) => {
     const data = JSON.parse(event.data);
     console.log("📩 收到 WebSocket 消息:", data);
+    framesReceived++;
+    if (framesReceived - framesAcked >= ACK_EVERY) sendAck();
+    else if (ackTimer === null) ackTimer = setTimeout(sendAck, ACK_DELAY);
+
+    if (data.type === "resync") {
+        // 积压太多被服务器断开，信令已经不完整：重新进入房间
+        location.reload();
+        return;
+    }
 
     if (data.type === "role") {
         console.log("✅ 你的身份:", data.role);